@@ -3,6 +3,7 @@ from os.path import dirname
 from pathlib import Path
 
 from cranetoolbox.analysis.countOccurences import *
+from cranetoolbox.analysis.keywordMatcher import MATCH_MODES
 from cranetoolbox.fileHandler import scan_folder_csv
 
 
@@ -23,6 +24,17 @@ def main():
     parser.add_argument("-d",
                         "--date_format", help="String defining the format of dates in the dataset.",
                         default="%a %b %d %H:%M:%S %z %Y")
+    parser.add_argument("--since", help="First day to count, as YYYY-MM-DD.", type=parse_day, default=None)
+    parser.add_argument("--until", help="Day after the last day to count, as YYYY-MM-DD.", type=parse_day,
+                        default=None)
+    parser.add_argument("--match",
+                        help="How variants are found in the tweets: 'substring' anywhere in the text, or 'tokens' "
+                             "only as whole words, e.g. 'asia' is not found in 'caucasian'",
+                        choices=list(MATCH_MODES), default='substring')
+    parser.add_argument("--workers",
+                        help="Number of processes counting the files, and ranges of rows of large uncompressed files, "
+                             "in parallel, 1 to count in the main process",
+                        type=int, default=1)
     # Parse arguments
     args = parser.parse_args()
 
@@ -41,7 +53,8 @@ def main():
         Path(dirname(args.output_path)).mkdir(exist_ok=True, parents=True)
 
     # Count the keywords' occurrences
-    keyword_counts = count_keywords(input_paths, keywords, args.date_format)
+    keyword_counts = count_keywords(input_paths, keywords, args.date_format, args.since, args.until, args.match,
+                                    args.workers)
 
     # Compute daily frequencies
     keyword_counts_and_freqs = counts_to_freq(keyword_counts, keywords)
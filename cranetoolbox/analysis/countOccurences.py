@@ -1,13 +1,33 @@
 # Take a list of keywords (with spelling variants) and compute their daily frequency in the entire dataset
 
 import json
-from csv import reader
-from datetime import datetime
-from typing import Dict, List
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import pandas as pd
 
-MAX_BUFFER_SIZE = 1000
+from cranetoolbox.analysis.keywordMatcher import KeywordMatcher
+from cranetoolbox.dateHandler import get_days
+from cranetoolbox.fileHandler import get_compression, get_row_offsets, read_csv_blocks, read_metadata
+
+MAX_BUFFER_SIZE = 10000
+# Uncompressed files are split into ranges of rows of at least this many bytes, counted in parallel
+MIN_RANGE_SIZE = 1 << 26
+
+
+def parse_day(value: str) -> date:
+    """Parse a day written as YYYY-MM-DD, e.g. in the metadata of a partition or on the command line.
+
+    :param value: The day, as YYYY-MM-DD
+    :type value: str
+    :return: The day
+    :rtype: date
+    """
+
+    return datetime.strptime(value, '%Y-%m-%d').date()
 
 
 def transform_date_format(df: pd.DataFrame) -> pd.DataFrame:
@@ -79,18 +99,21 @@ def get_tweet_counts(path: str) -> pd.DataFrame:
     return tweet_counts
 
 
-def detect_keywords(text: str, keywords: Dict[str, List[str]]) -> Dict[str, bool]:
+def detect_keywords(text: str, keywords: Union[Dict[str, List[str]], KeywordMatcher]) -> Dict[str, bool]:
     """Look for each keyword (with variants) in a tweet.
 
     :param text: The preprocessed text of the tweet.
     :type text: str
-    :param keywords: The dictionary of keywords with their variants.
-    :type keywords: dict(str, list(str))
+    :param keywords: The dictionary of keywords with their variants, or a :class:`KeywordMatcher` built from it to
+        search all variants in a single pass.
+    :type keywords: dict(str, list(str)) or KeywordMatcher
     :return: A dictionary indicating the presence or absence of each keyword.
     :rtype: dict(str, bool)
 
     """
 
+    if isinstance(keywords, KeywordMatcher):
+        return keywords.detect(text)
     tweet_info = {}
     for main_variant in keywords.keys():
         # Detect if one of the variants of the keyword is present in the tweet
@@ -103,8 +126,8 @@ def detect_keywords(text: str, keywords: Dict[str, List[str]]) -> Dict[str, bool
 def aggregate_counts(data, main_variants: List[str], date_format: str) -> pd.DataFrame:
     """Create a DataFrame with keywords daily counts.
 
-    :param data: List of dictionaries, each dictionary with a date, boolean indicators for the presence of each keyword, and a 1-valued 'total' column.
-    :type data: list(dict())
+    :param data: List of dictionaries, each dictionary with a date, boolean indicators for the presence of each keyword, and a 1-valued 'total' column, or a dictionary of these columns.
+    :type data: list(dict()) or dict(str, list())
     :param main_variants: List of the keywords main variants.
     :type main_variants: list(str)
     :param date_format: String defining the format of dates in the dataset.
@@ -117,10 +140,8 @@ def aggregate_counts(data, main_variants: List[str], date_format: str) -> pd.Dat
     # Get data into a DataFrame
     occurences = pd.DataFrame(data)
 
-    # Transform timestamps to a date format, adding a 'day' column
-    occurences["timestamp"] = pd.to_datetime(
-        occurences["timestamp"], format=date_format)
-    occurences = transform_date_format(occurences)
+    # Read the day of the timestamps, adding a 'day' column
+    occurences["day"] = get_days(occurences["timestamp"].tolist(), date_format)
 
     # Aggregate counts:
     #   - sum by date
@@ -133,15 +154,108 @@ def aggregate_counts(data, main_variants: List[str], date_format: str) -> pd.Dat
     return counts
 
 
-def count_keywords(input_paths: List[str], keywords: Dict[str, List[str]], date_format: str) -> pd.DataFrame:
+class DailyKeywordCounts:
+    """
+    Accumulator of the number of tweets per day, in total and with each keyword
+
+    Counts are held in a single integer array with a row per day and a column per keyword, after a first column with
+    the total, updated in place for each block of tweets. Its memory only grows with the number of days, whatever the
+    number of tweets.
+
+    :param main_variants: The main variants of the keywords, in the order of the columns of the matches.
+    :type main_variants: list(str)
+    """
+
+    def __init__(self, main_variants: List[str]):
+        self.main_variants = list(main_variants)
+        # Row of each day in the counts, rows are added by doubling the size of the array
+        self._day_rows: Dict[date, int] = {}
+        self._counts = np.zeros((16, len(self.main_variants) + 1), dtype=np.int64)
+
+    def _get_row(self, day: date) -> int:
+        row = self._day_rows.get(day)
+        if row is None:
+            row = len(self._day_rows)
+            if row == len(self._counts):
+                self._counts = np.concatenate([self._counts, np.zeros_like(self._counts)])
+            self._day_rows[day] = row
+        return row
+
+    def add(self, days: List[date], matches: np.ndarray):
+        """Count a block of tweets.
+
+        :param days: The day of each tweet, see :func:`cranetoolbox.dateHandler.get_days`
+        :type days: list(datetime.date)
+        :param matches: A boolean array with a row per tweet and a column per keyword, see
+            :meth:`KeywordMatcher.detect_texts`
+        :type matches: numpy.ndarray
+        """
+
+        # A block of tweets only spans a few days, counted one after the other
+        codes, block_days = pd.factorize(pd.Series(days, dtype=object), sort=False)
+        if len(block_days) == 1:
+            row = self._get_row(block_days[0])
+            self._counts[row, 0] += len(days)
+            self._counts[row, 1:] += matches.sum(axis=0)
+            return
+        for code, day in enumerate(block_days):
+            in_day = codes == code
+            row = self._get_row(day)
+            self._counts[row, 0] += np.count_nonzero(in_day)
+            self._counts[row, 1:] += matches[in_day].sum(axis=0)
+
+    def merge(self, other: 'DailyKeywordCounts'):
+        """Add the counts of another accumulator, e.g. of another part of the dataset.
+
+        :param other: Counts of the same keywords
+        :type other: DailyKeywordCounts
+        """
+
+        for day, row in other._day_rows.items():
+            self._counts[self._get_row(day)] += other._counts[row]
+
+    def to_dataframe(self, since: Optional[date] = None, until: Optional[date] = None) -> pd.DataFrame:
+        """Get the counts, in the format of :func:`count_keywords`.
+
+        :param since: First day to keep, or None
+        :type since: datetime.date
+        :param until: Day after the last day to keep, or None
+        :type until: datetime.date
+        :return: A DataFrame with the total number of tweets and the number of tweets with each keyword, per day.
+        :rtype: pandas.DataFrame
+        """
+
+        days = sorted(day for day in self._day_rows if _is_in_window(day, since, until))
+        counts = self._counts[[self._day_rows[day] for day in days]]
+        return pd.DataFrame(counts, columns=["total_count"] + [keyword + "_count" for keyword in self.main_variants],
+                            index=pd.Index(days, name="day", dtype=object))
+
+
+def count_keywords(input_paths: List[str], keywords: Dict[str, List[str]], date_format: str,
+                   since: Optional[date] = None, until: Optional[date] = None,
+                   match: str = 'substring', workers: int = 1) -> pd.DataFrame:
     """Search all tweets for keywords and count their occurences per day.
 
+    Input files with metadata, the partitions written by the *preprocess* module with ``--partition-by``, are skipped
+    when none of their days is between *since* and *until*. When all the files read have metadata, the daily totals are
+    taken from it.
+
     :param input_paths: The list of the paths to the input files.
     :type input_paths: list(str)
     :param keywords: The dictionary of keywords with their variants.
     :type keywords: dict(str, list(str))
     :param date_format: String defining the format of dates in the dataset.
     :type date_format: str
+    :param since: First day to count, or None
+    :type since: datetime.date
+    :param until: Day after the last day to count, or None
+    :type until: datetime.date
+    :param match: 'substring' to find variants anywhere in the text, or 'tokens' to only find whole words, see
+        :class:`KeywordMatcher`
+    :type match: str
+    :param workers: Number of processes counting files, and ranges of rows of large uncompressed files, in parallel.
+        Each process builds its own matcher, and the counts of all the parts are added up.
+    :type workers: int
     :return: A DataFrame with the number of occurences of each keyword for each day.
     :rtype: pandas.DataFrame
 
@@ -149,61 +263,100 @@ def count_keywords(input_paths: List[str], keywords: Dict[str, List[str]], date_
 
     # List the main variants of the keywords (e.g. the keys of the keywords dict)
     main_variants = list(keywords.keys())
-
-    # Create a list of intermediate DataFrames to store the day-aggregated counts for each chunk of the dataset
-    chunks_counts = []
+    # Accumulate the daily counts of all the parts of the dataset
+    daily_counts = DailyKeywordCounts(main_variants)
+    # Daily totals from the metadata of the files, None once a file without metadata is read
+    metadata_totals = {}
+    # Files to read, with the ranges of bytes to read separately
+    parts: List[Tuple[str, Optional[Tuple[int, int]]]] = []
 
     # For each input file
     for input_path in input_paths:
-        try:
-            with open(input_path, 'r') as csv_input:
-                csv_reader = reader(csv_input)
-                # Reading and saving in chunks to avoid memory overload
-                buffer_size = 0
-                buffer_data = []
-                # Catch errors, no specific exception handling for now
+        metadata = read_metadata(input_path)
+        if metadata is not None:
+            days = [day for day in metadata['counts'] if _is_in_window(day, since, until)]
+            if not days:
+                print("Skipping %s, outside of the requested days" % input_path)
+                continue
+            if metadata_totals is not None:
+                for day in days:
+                    metadata_totals[day] = metadata_totals.get(day, 0) + metadata['counts'][day]
+        else:
+            metadata_totals = None
+        ranges = min(workers, os.path.getsize(input_path) // MIN_RANGE_SIZE)
+        if ranges > 1 and get_compression(input_path) is None:
+            offsets = get_row_offsets(input_path, ranges)
+            parts.extend((input_path, byte_range) for byte_range in zip(offsets, offsets[1:]))
+        else:
+            parts.append((input_path, None))
+
+    if workers > 1:
+        # Each worker builds its own matcher and counts whole files or ranges of rows
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(keywords, match)) as executor:
+            futures = [executor.submit(_count_part, input_path, date_format, byte_range)
+                       for input_path, byte_range in parts]
+            for (input_path, _), future in zip(parts, futures):
                 try:
-                    # For each line
-                    for row in csv_reader:
-                        # Detect keywords
-                        clean_text = row[2]
-                        has_keyword = detect_keywords(clean_text, keywords)
-                        has_keyword["timestamp"] = row[3]
-                        has_keyword["total"] = 1  # Easier group_by later
-                        buffer_data.append(has_keyword)
-                        buffer_size += 1
-
-                        # If the buffer is full, aggregate daily counts
-                        if buffer_size >= MAX_BUFFER_SIZE:
-                            temp_counts = aggregate_counts(buffer_data, main_variants, date_format)
-                            # Save aggregate DataFrame to list
-                            chunks_counts.append(temp_counts)
-                            del temp_counts
-                            buffer_data = []
-                            buffer_size = 0
-
-                    # Saving incomplete buffer when end of file is reached
-                    if buffer_size > 0:
-                        temp_counts = aggregate_counts(buffer_data, main_variants, date_format)
-                        # Save aggregate DataFrame to list
-                        chunks_counts.append(temp_counts)
+                    daily_counts.merge(future.result())
                 except Exception as e:
-                    print("Unknown error while counting keywords")
+                    print("Cannot read CSV input file: %s" % input_path)
                     print(e)
                     raise e
-        except Exception as e:
-            print("Cannot read CSV input file: %s" % input_path)
-            print(e)
-            raise e
+    else:
+        # Automaton of all the variants, built once
+        matcher = KeywordMatcher(keywords, mode=match)
+        for input_path, byte_range in parts:
+            try:
+                _count_blocks(daily_counts, matcher, input_path, date_format, byte_range)
+            except Exception as e:
+                print("Cannot read CSV input file: %s" % input_path)
+                print(e)
+                raise e
+
+    daily_counts = daily_counts.to_dataframe(since, until)
+    if metadata_totals is not None:
+        daily_counts["total_count"] = [metadata_totals.get(day.isoformat(), total)
+                                       for day, total in zip(daily_counts.index, daily_counts["total_count"])]
+
+    return daily_counts
+
 
-    # Concatenate all chunks
-    daily_counts = pd.concat(chunks_counts, ignore_index=True)
-    # Aggregate over chunks
-    daily_counts = daily_counts.groupby("day").sum()
+def _count_blocks(daily_counts: DailyKeywordCounts, matcher: KeywordMatcher, input_path: str, date_format: str,
+                  byte_range: Optional[Tuple[int, int]] = None):
+    # Reading the clean text and timestamp columns by blocks of rows to avoid memory overload
+    blocks = read_csv_blocks(input_path, [2, 3], MAX_BUFFER_SIZE, byte_range=byte_range)
+    # Catch errors, no specific exception handling for now
+    try:
+        for clean_texts, timestamps in blocks:
+            # Detect keywords, one column per keyword, and add them to the counts of their day
+            daily_counts.add(get_days(timestamps, date_format), matcher.detect_texts(clean_texts))
+    except Exception as e:
+        print("Unknown error while counting keywords")
+        print(e)
+        raise e
 
+
+# Matcher of each worker process, built once by the pool initializer
+_worker_matcher = None
+
+
+def _init_worker(keywords: Dict[str, List[str]], match: str):
+    global _worker_matcher
+    _worker_matcher = KeywordMatcher(keywords, mode=match)
+
+
+def _count_part(input_path: str, date_format: str, byte_range: Optional[Tuple[int, int]]) -> DailyKeywordCounts:
+    daily_counts = DailyKeywordCounts(_worker_matcher.main_variants)
+    _count_blocks(daily_counts, _worker_matcher, input_path, date_format, byte_range)
     return daily_counts
 
 
+def _is_in_window(day: Union[date, str], since: Optional[date], until: Optional[date]) -> bool:
+    if isinstance(day, str):
+        day = parse_day(day)
+    return (since is None or day >= since) and (until is None or day < until)
+
+
 def counts_to_freq(keyword_counts: pd.DataFrame, keywords: Dict[str, List[str]]) -> pd.DataFrame:
     """For each day, divide the count for each keyword by the daily total.
 
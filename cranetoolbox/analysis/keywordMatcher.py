@@ -0,0 +1,226 @@
+# Find all the keywords of a dictionary in a text in a single pass, with an Aho-Corasick automaton or by tokens
+
+import re
+from collections import deque
+from typing import Dict, Iterable, List, Set, Tuple
+
+import numpy as np
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+MATCHER_BACKENDS = ('pyahocorasick', 'python')
+# Ways to decide whether a variant is in a text: anywhere as a substring, or as a sequence of whole tokens
+MATCH_MODES = ('substring', 'tokens')
+# Tokens are words, which can contain hyphens and apostrophes, e.g. "covid-nineteen", without the punctuation around
+_TOKEN_PATTERN = re.compile(r"\w+(?:[-']\w+)*")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split a preprocessed text into tokens, as matched in the 'tokens' mode of :class:`KeywordMatcher`.
+
+    :param text: The preprocessed text.
+    :type text: str
+    :return: The tokens of the text, in order.
+    :rtype: list(str)
+    """
+
+    return _TOKEN_PATTERN.findall(text)
+
+
+def resolve_matcher_backend(backend: str) -> str:
+    """Get the name of the automaton backend to use, resolving 'auto' to 'pyahocorasick' when it is installed.
+
+    :param backend: Name of a backend of :data:`MATCHER_BACKENDS`, or 'auto'
+    :type backend: str
+    :return: Name of an installed backend
+    :rtype: str
+    """
+
+    if backend == 'auto':
+        return 'pyahocorasick' if ahocorasick is not None else 'python'
+    if backend not in MATCHER_BACKENDS:
+        raise ValueError("Unknown keyword matcher backend: " + str(backend))
+    if backend == 'pyahocorasick' and ahocorasick is None:
+        raise ImportError("The pyahocorasick package is required to use the pyahocorasick backend")
+    return backend
+
+
+class KeywordMatcher:
+    """
+    Matcher of the keywords of a dictionary, see :func:`cranetoolbox.analysis.countOccurences.get_keywords`
+
+    An Aho-Corasick automaton of all the variants is built once, and each text is scanned in a single pass whatever
+    the number of variants, instead of one substring search per variant. Each variant found maps back to its main
+    variants. A keyword is found in a text exactly when one of its variants is a substring of the text, as with
+    :func:`cranetoolbox.analysis.countOccurences.detect_keywords`: the search is case-sensitive, variants can overlap
+    and an empty variant is found in any text.
+
+    In the 'tokens' mode, texts and variants are split into tokens with :func:`tokenize`, and a variant is found when
+    its tokens appear consecutively in the text, so "asia" is not found in "caucasian". Each text is tokenized once
+    and its n-grams, for the numbers of tokens of the variants, are looked up in a map of the variants. Variants
+    without any token are never found.
+
+    :param keywords: The dictionary of keywords with their variants.
+    :type keywords: dict(str, list(str))
+    :param backend: Name of a backend of :data:`MATCHER_BACKENDS`, or 'auto' to use the pyahocorasick package when it
+        is installed and the pure Python automaton otherwise. Only used in the 'substring' mode.
+    :type backend: str
+    :param mode: Name of a mode of :data:`MATCH_MODES`
+    :type mode: str
+    """
+
+    def __init__(self, keywords: Dict[str, List[str]], backend: str = 'auto', mode: str = 'substring'):
+        if mode not in MATCH_MODES:
+            raise ValueError("Unknown keyword match mode: " + str(mode))
+        self.main_variants = list(keywords.keys())
+        self.mode = mode
+        if mode == 'tokens':
+            self._build_ngrams(keywords)
+            return
+        self.backend = resolve_matcher_backend(backend)
+        # Indices of the main variants of each variant
+        variant_indices: Dict[str, Set[int]] = {}
+        # Indices of the keywords with an empty variant, found in any text
+        self._always = set()
+        for index, variants in enumerate(keywords.values()):
+            for variant in variants:
+                if variant:
+                    variant_indices.setdefault(variant, set()).add(index)
+                else:
+                    self._always.add(index)
+        # No variant to search, only empty ones
+        self._empty = not variant_indices
+        if variant_indices:
+            if self.backend == 'pyahocorasick':
+                self._automaton = ahocorasick.Automaton()
+                for variant, indices in variant_indices.items():
+                    self._automaton.add_word(variant, tuple(indices))
+                self._automaton.make_automaton()
+            else:
+                self._build(variant_indices)
+
+    def _build(self, variant_indices: Dict[str, Set[int]]):
+        # Trie of the variants, with the indices of the main variants ending at each state
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[Set[int]] = [set()]
+        for variant, indices in variant_indices.items():
+            state = 0
+            for char in variant:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto.append({})
+                    outputs.append(set())
+                    goto[state][char] = next_state
+                state = next_state
+            outputs[state].update(indices)
+        # Failure links, in breadth-first order, so that the outputs of each state include those of its suffixes
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                fail_state = fail[state]
+                while fail_state and char not in goto[fail_state]:
+                    fail_state = fail[fail_state]
+                fail[next_state] = goto[fail_state].get(char, 0)
+                outputs[next_state].update(outputs[fail[next_state]])
+                queue.append(next_state)
+        self._goto = goto
+        self._fail = fail
+        self._outputs = [tuple(indices) for indices in outputs]
+
+    def _build_ngrams(self, keywords: Dict[str, List[str]]):
+        # Indices of the main variants of each variant, by its tokens joined with spaces, which tokens cannot contain
+        ngram_indices: Dict[str, Set[int]] = {}
+        for index, variants in enumerate(keywords.values()):
+            for variant in variants:
+                tokens = tokenize(variant)
+                if tokens:
+                    ngram_indices.setdefault(" ".join(tokens), set()).add(index)
+        self._ngram_indices: Dict[str, Tuple[int, ...]] = {
+            ngram: tuple(indices) for ngram, indices in ngram_indices.items()}
+        # Numbers of tokens of the variants, the only n-grams of the texts to look up
+        self._ngram_sizes = sorted({ngram.count(" ") + 1 for ngram in ngram_indices})
+
+    def _find_token_indices(self, text: str) -> Set[int]:
+        found = set()
+        ngram_indices = self._ngram_indices
+        tokens = tokenize(text)
+        for size in self._ngram_sizes:
+            if size == 1:
+                ngrams = tokens
+            else:
+                ngrams = [" ".join(tokens[start:start + size]) for start in range(len(tokens) - size + 1)]
+            for ngram in ngrams:
+                indices = ngram_indices.get(ngram)
+                if indices is not None:
+                    found.update(indices)
+        return found
+
+    def _find_indices(self, text: str) -> Set[int]:
+        if self.mode == 'tokens':
+            return self._find_token_indices(text)
+        found = set(self._always)
+        if self._empty:
+            return found
+        if self.backend == 'pyahocorasick':
+            for _, indices in self._automaton.iter(text):
+                found.update(indices)
+            return found
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if outputs[state]:
+                found.update(outputs[state])
+        return found
+
+    def find(self, text: str) -> Set[str]:
+        """Find the keywords present in a text.
+
+        :param text: The preprocessed text of the tweet.
+        :type text: str
+        :return: The main variants of the keywords found
+        :rtype: set(str)
+        """
+
+        return {self.main_variants[index] for index in self._find_indices(text)}
+
+    def detect(self, text: str) -> Dict[str, bool]:
+        """Look for each keyword in a text, see :func:`cranetoolbox.analysis.countOccurences.detect_keywords`.
+
+        :param text: The preprocessed text of the tweet.
+        :type text: str
+        :return: A dictionary indicating the presence or absence of each keyword.
+        :rtype: dict(str, bool)
+        """
+
+        found = self._find_indices(text)
+        return {main_variant: index in found for index, main_variant in enumerate(self.main_variants)}
+
+    def detect_texts(self, texts: Iterable[str]) -> np.ndarray:
+        """Look for each keyword in several texts.
+
+        :param texts: The preprocessed texts of the tweets.
+        :type texts: iterable(str)
+        :return: A boolean array with a row per text and a column per keyword, in the order of :attr:`main_variants`
+        :rtype: numpy.ndarray
+        """
+
+        rows = []
+        columns = []
+        count = 0
+        for row, text in enumerate(texts):
+            found = self._find_indices(text)
+            rows.extend([row] * len(found))
+            columns.extend(found)
+            count += 1
+        matches = np.zeros((count, len(self.main_variants)), dtype=bool)
+        matches[rows, columns] = True
+        return matches
@@ -0,0 +1,119 @@
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+
+import pandas as pd
+
+TWITTER_DATE_FORMAT = '%a %b %d %H:%M:%S %z %Y'
+# Cached days are dropped past this number of keys, only reached with many timestamps parsed by the fallback
+MAX_CACHE_SIZE = 100000
+_MONTHS = {month: index + 1 for index, month in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'))}
+# Days of the timestamps read so far, by the part of the timestamp that gives the day, or by format and timestamp for
+# those parsed by the fallback
+_day_cache: Dict[Union[str, Tuple[Optional[str], str]], date] = {}
+
+
+def _get_day_key(timestamp: str, date_format: Optional[str]) -> Optional[str]:
+    # Part of a timestamp giving its day, for the formats whose day can be read from fixed positions
+    if date_format is None or date_format == TWITTER_DATE_FORMAT:
+        # e.g. 'Wed Oct 10 20:19:24 +0000 2018', keep 'Oct 10' and the year
+        if len(timestamp) == 30 and timestamp[3] == ' ' and timestamp[10] == ' ' and timestamp[19] == ' ' \
+                and timestamp[25] == ' ':
+            return timestamp[4:10] + timestamp[25:]
+    if date_format is None or date_format.startswith('%Y-%m-%d'):
+        # e.g. '2018-10-10 20:19:24+00:00' or '2018-10-10T20:19:24', keep '2018-10-10'
+        if len(timestamp) >= 10 and timestamp[4] == '-' and timestamp[7] == '-' \
+                and (len(timestamp) == 10 or timestamp[10] in ' T'):
+            return timestamp[:10]
+    return None
+
+
+def _parse_day_key(key: str) -> Optional[date]:
+    try:
+        if key[3] == ' ':
+            return date(int(key[7:]), _MONTHS[key[:3]], int(key[4:6]))
+        return date(int(key[:4]), int(key[5:7]), int(key[8:10]))
+    except (KeyError, ValueError):
+        return None
+
+
+def _parse_days(timestamps: List[str], date_format: Optional[str]) -> List[date]:
+    # Vectorized fallback, the day is the one written in the timestamp, whatever its time zone
+    try:
+        parsed = pd.to_datetime(pd.Series(timestamps, dtype=object), format=date_format)
+        if pd.api.types.is_datetime64_any_dtype(parsed):
+            return parsed.dt.date.tolist()
+    except ValueError:
+        # e.g. timestamps with different UTC offsets
+        pass
+    return [pd.to_datetime(timestamp, format=date_format).date() for timestamp in timestamps]
+
+
+def get_days(timestamps: Iterable[str], date_format: Optional[str] = None) -> List[date]:
+    """Get the day of each timestamp, as written in the timestamp.
+
+    The day of Twitter dates (e.g. 'Wed Oct 10 20:19:24 +0000 2018') and of ISO dates (e.g. '2018-10-10 20:19:24') is
+    read from fixed character positions and cached, since a dataset only spans a few days. Other timestamps are
+    parsed together with :func:`pandas.to_datetime`. Time zones are kept, so the day is never shifted to UTC.
+
+    :param timestamps: The timestamps
+    :type timestamps: iterable(str)
+    :param date_format: Format of the timestamps, as for :func:`datetime.strptime`, or None to infer it
+    :type date_format: str
+    :return: The day of each timestamp, in the same order
+    :rtype: list(datetime.date)
+    :raises ValueError: If a timestamp cannot be parsed
+    """
+
+    cache = _day_cache
+    if len(cache) > MAX_CACHE_SIZE:
+        cache.clear()
+    days = []
+    missing = {}
+    for index, timestamp in enumerate(timestamps):
+        key = _get_day_key(timestamp, date_format) if isinstance(timestamp, str) else None
+        day = None
+        if key is not None:
+            day = cache.get(key)
+            if day is None:
+                day = _parse_day_key(key)
+                if day is not None:
+                    cache[key] = day
+        if day is None:
+            day = cache.get((date_format, timestamp)) if isinstance(timestamp, str) else None
+            if day is None:
+                missing.setdefault(timestamp, []).append(index)
+        days.append(day)
+    if missing:
+        for timestamp, day in zip(missing, _parse_days(list(missing), date_format)):
+            if isinstance(timestamp, str):
+                cache[(date_format, timestamp)] = day
+            for index in missing[timestamp]:
+                days[index] = day
+    return days
+
+
+def get_utc_timestamps(timestamps: List[str], date_format: Optional[str] = None) -> pd.Series:
+    """Parse timestamps into UTC datetimes.
+
+    :param timestamps: The timestamps
+    :type timestamps: list(str)
+    :param date_format: Format of the timestamps, as for :func:`datetime.strptime`, or None to infer it
+    :type date_format: str
+    :return: The timestamps in UTC, NaT for those that cannot be parsed
+    :rtype: pandas.Series
+    """
+
+    if date_format is None and timestamps and isinstance(timestamps[0], str) \
+            and _get_day_key(timestamps[0], TWITTER_DATE_FORMAT) is not None:
+        # pandas cannot infer the Twitter format, and would parse each timestamp separately
+        date_format = TWITTER_DATE_FORMAT
+    parsed = pd.to_datetime(pd.Series(timestamps, dtype=object), format=date_format, utc=True, errors='coerce')
+    if date_format is None:
+        # Timestamps in another format than the one inferred from the first one are parsed separately
+        for index in parsed.index[parsed.isna()]:
+            try:
+                parsed[index] = pd.to_datetime(timestamps[index], utc=True)
+            except (TypeError, ValueError):
+                pass
+    return parsed
@@ -1,8 +1,35 @@
+import csv
+import gzip
+import io
+import json
 import os
 import typing
+from collections import deque
 from os import path
 from pathlib import PurePath, Path
 
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.compute
+    import pyarrow.csv
+except ImportError:
+    pyarrow = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Suffix of the metadata file written next to each partition of a partitioned preprocessed dataset
+METADATA_SUFFIX = '.meta.json'
+# Extensions of compressed CSV files, after the .csv extension, for each compression
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+CSV_ENGINES = ('arrow', 'pandas')
+# Number of bytes parsed at once by the Arrow CSV reader
+CSV_READ_SIZE = 1 << 22
+
 
 def scan_folder(search_path: str) -> [str]:
     """List all files in the file-system tree down from the search path.
@@ -24,12 +51,12 @@ def scan_folder(search_path: str) -> [str]:
     # Build list of files in folder and its sub-folders
     for root, _, files in os.walk(search_path):
         for file in files:
-            file_list.append(PurePath(search_path, file))
+            file_list.append(PurePath(root, file))
     return file_list
 
 
 def scan_folder_csv(search_path: str) -> typing.List[str]:
-    """Scans a given path and extracts all files that end with .csv
+    """Scans a given path and extracts all files that end with .csv, or .csv.gz or .csv.zst for compressed files
     
     :param search_path: Any path on the machine
     :type search_path: str
@@ -40,6 +67,349 @@ def scan_folder_csv(search_path: str) -> typing.List[str]:
     all_files = scan_folder(search_path)
     output_file_list = []
     for curr_path in all_files:
-        if Path(curr_path).suffix == '.csv':
+        suffixes = Path(curr_path).suffixes
+        if suffixes[-1:] == ['.csv'] or (suffixes[-2:-1] == ['.csv'] and
+                                         suffixes[-1] in COMPRESSION_SUFFIXES.values()):
             output_file_list.append(curr_path)
     return output_file_list
+
+
+def get_metadata_path(file_path: str) -> str:
+    """Get the path of the metadata file of a partition of a preprocessed dataset.
+
+    :param file_path: Path to the partition, a CSV file
+    :type file_path: str
+    :return: Path to its metadata file
+    :rtype: str
+    """
+
+    return str(file_path) + METADATA_SUFFIX
+
+
+def read_metadata(file_path: str) -> typing.Optional[dict]:
+    """Read the metadata of a partition of a preprocessed dataset, if any.
+
+    :param file_path: Path to the partition, a CSV file
+    :type file_path: str
+    :return: The metadata, with the number of rows, the first and last timestamps, the number of rows per day and the
+        preprocessing options, or None if the file has no metadata
+    :rtype: dict
+    """
+
+    metadata_path = get_metadata_path(file_path)
+    if not path.exists(metadata_path):
+        return None
+    with open(metadata_path, 'r') as metadata_file:
+        return json.load(metadata_file)
+
+
+def get_compression(file_path: str) -> typing.Optional[str]:
+    """Get the compression of a file from its extension.
+
+    :param file_path: Path to the file
+    :type file_path: str
+    :return: A key of :data:`COMPRESSION_SUFFIXES`, or None for an uncompressed file
+    :rtype: str
+    """
+
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if str(file_path).endswith(suffix):
+            return compression
+    return None
+
+
+def open_csv_file(file_path: str, mode: str = 'r', compression: typing.Optional[str] = 'infer') -> typing.TextIO:
+    """Open a CSV file in text mode, through a streaming (de)compressor for compressed files.
+
+    :param file_path: Path to the file
+    :type file_path: str
+    :param mode: 'r' to read, 'w' to write, 'a' to append, as a new member or frame for compressed files
+    :type mode: str
+    :param compression: A key of :data:`COMPRESSION_SUFFIXES`, None for an uncompressed file, or 'infer' to get it
+        from the extension of the file
+    :type compression: str
+    :return: The file, opened in text mode
+    :rtype: file
+    """
+
+    if compression == 'infer':
+        compression = get_compression(file_path)
+    if compression is None:
+        return open(file_path, mode)
+    if compression == 'gzip':
+        return gzip.open(file_path, mode + 't')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("The zstandard package is required to read and write zstd compressed files")
+        if mode == 'r':
+            return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(file_path, 'rb'),
+                                                                               read_across_frames=True))
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(open(file_path, mode + 'b')))
+    raise ValueError("Unknown compression: " + str(compression))
+
+
+def get_output_file_name(file_path: str, compression: typing.Optional[str] = None) -> str:
+    """Get the name of the preprocessed version of an input file, named from the input file with
+    "_preprocessed.csv" appended.
+
+    :param file_path: The path to the input file.
+    :type file_path: str
+    :param compression: Compression of the output, a key of :data:`COMPRESSION_SUFFIXES`, or None
+    :type compression: str
+    :return: The name of the output file
+    :rtype: str
+
+    """
+
+    input_file_name = path.basename(str(file_path))
+    input_compression = get_compression(input_file_name)
+    if input_compression is not None:
+        input_file_name = input_file_name[:-len(COMPRESSION_SUFFIXES[input_compression])]
+    output_file_name = path.splitext(input_file_name)[0] + "_preprocessed.csv"
+    if compression is not None:
+        output_file_name += COMPRESSION_SUFFIXES[compression]
+    return output_file_name
+
+
+def resolve_csv_engine(engine: str) -> str:
+    """Get the name of the CSV reader to use, resolving 'auto' to 'arrow' when pyarrow is installed.
+
+    :param engine: Name of an engine of :data:`CSV_ENGINES`, or 'auto'
+    :type engine: str
+    :return: Name of an installed engine
+    :rtype: str
+    """
+
+    if engine == 'auto':
+        return 'arrow' if pyarrow is not None else 'pandas'
+    if engine not in CSV_ENGINES:
+        raise ValueError("Unknown CSV engine: " + str(engine))
+    if engine == 'arrow' and pyarrow is None:
+        raise ImportError("The pyarrow package is required to use the arrow CSV engine")
+    return engine
+
+
+def get_row_offsets(file_path: str, parts: int) -> typing.List[int]:
+    """Split an uncompressed CSV file into ranges of bytes of about the same size, each made of whole rows.
+
+    A newline ends a row only when it is out of a quoted value, e.g. not in a multiline text, that is when an even
+    number of double quotes precedes it, escaped double quotes being doubled. The file is read once to count them.
+
+    :param file_path: Path to the file
+    :type file_path: str
+    :param parts: Number of ranges, fewer ranges are returned for files with fewer rows
+    :type parts: int
+    :return: The offsets of the start of each range, followed by the size of the file
+    :rtype: list(int)
+    """
+
+    size = os.path.getsize(file_path)
+    targets = [size * part // parts for part in range(1, parts)]
+    offsets = [0]
+    # Number of double quotes before the current chunk
+    quotes = 0
+    position = 0
+    with open(file_path, 'rb') as csv_file:
+        while targets:
+            chunk = csv_file.read(CSV_READ_SIZE)
+            if not chunk:
+                break
+            while targets:
+                start = max(targets[0], offsets[-1], position) - position
+                index = chunk.find(b'\n', start) if start < len(chunk) else -1
+                while index != -1 and (quotes + chunk.count(b'"', 0, index)) % 2:
+                    index = chunk.find(b'\n', index + 1)
+                if index == -1:
+                    break
+                if position + index + 1 < size:
+                    offsets.append(position + index + 1)
+                targets.pop(0)
+            quotes += chunk.count(b'"')
+            position += len(chunk)
+    offsets.append(size)
+    return offsets
+
+
+class _ByteRangeReader(io.RawIOBase):
+    # Reader of a range of bytes of a file, from its current position
+
+    def __init__(self, raw_file: typing.BinaryIO, size: int):
+        self.raw_file = raw_file
+        self.remaining = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        size = min(len(buffer), self.remaining)
+        if size <= 0:
+            return 0
+        read = self.raw_file.readinto(memoryview(buffer)[:size])
+        self.remaining -= read
+        return read
+
+    def close(self):
+        self.raw_file.close()
+        super().close()
+
+
+def read_csv_blocks(file_path: str, columns: typing.List[int], block_size: int, skip_rows: int = 0,
+                    engine: str = 'auto', byte_range: typing.Optional[typing.Tuple[int, int]] = None
+                    ) -> typing.Iterator[typing.List[typing.List[str]]]:
+    """Read some columns of a CSV file without header, by blocks of rows.
+
+    The file is parsed by large blocks of bytes, with the streaming CSV reader of Arrow or chunks of
+    :func:`pandas.read_csv`, instead of one row at a time. Values are read as strings, empty values as empty strings.
+    As with :func:`csv.reader` on a file opened in text mode, rows can have any number of fields, missing values being
+    read as empty strings, and line breaks within values are read as '\\n'.
+    Files compressed with gzip or zstd are decompressed on the fly, see :func:`get_compression`.
+
+    :param file_path: Path to the file
+    :type file_path: str
+    :param columns: Indices of the columns to read
+    :type columns: list(int)
+    :param block_size: Number of rows of each block, only the last block can be shorter
+    :type block_size: int
+    :param skip_rows: Number of rows to skip at the start of the file
+    :type skip_rows: int
+    :param engine: Name of an engine of :data:`CSV_ENGINES`, or 'auto' to use Arrow when available
+    :type engine: str
+    :param byte_range: Start and end offsets of the rows to read in an uncompressed file, see
+        :func:`get_row_offsets`, or None to read the whole file
+    :type byte_range: tuple(int, int)
+    :return: For each block of rows, the values of each column, in the order of *columns*
+    :rtype: iterator(list(list(str)))
+    """
+
+    engine = resolve_csv_engine(engine)
+    source = str(file_path)
+    if byte_range is not None:
+        if get_compression(file_path) is not None:
+            raise ValueError("Ranges of bytes cannot be read from a compressed file")
+        raw_file = open(file_path, 'rb')
+        raw_file.seek(byte_range[0])
+        source = io.BufferedReader(_ByteRangeReader(raw_file, byte_range[1] - byte_range[0]), CSV_READ_SIZE)
+    try:
+        yield from _read_blocks(source, columns, block_size, skip_rows, engine)
+    finally:
+        if byte_range is not None:
+            source.close()
+
+
+def _read_blocks(source: typing.Union[str, typing.BinaryIO], columns: typing.List[int], block_size: int,
+                 skip_rows: int, engine: str) -> typing.Iterator[typing.List[typing.List[str]]]:
+    if engine == 'arrow':
+        blocks = _read_arrow_blocks(source, columns)
+    else:
+        blocks = _read_pandas_blocks(source, columns, block_size)
+    # Rows left from the previous blocks of the engine, fewer than block_size
+    buffer = [[] for _ in columns]
+    for block in blocks:
+        rows = len(block[0])
+        start = min(skip_rows, rows)
+        skip_rows -= start
+        # Blocks of the engines have their own size, they are split or merged into blocks of block_size rows
+        if buffer[0] and start < rows:
+            end = min(start + block_size - len(buffer[0]), rows)
+            for values, block_values in zip(buffer, block):
+                values.extend(block_values[start:end])
+            start = end
+            if len(buffer[0]) < block_size:
+                continue
+            yield buffer
+            buffer = [[] for _ in columns]
+        while rows - start >= block_size:
+            yield [block_values[start:start + block_size] for block_values in block]
+            start += block_size
+        for values, block_values in zip(buffer, block):
+            values.extend(block_values[start:])
+    if buffer[0]:
+        yield buffer
+
+
+def _read_arrow_blocks(source: typing.Union[str, typing.BinaryIO],
+                       columns: typing.List[int]) -> typing.Iterator[typing.List[list]]:
+    names = ['f' + str(column) for column in columns]
+    # Rows without the number of fields of the first row are skipped by Arrow, as (row number, values), and put back
+    # in place from their text, read with the csv module
+    invalid_rows = deque()
+
+    def read_invalid_row(row) -> str:
+        if row.number is None:
+            return 'error'
+        fields = next(csv.reader(io.StringIO(row.text)), [])
+        invalid_rows.append((row.number, [_normalise_newlines(fields[column]) if column < len(fields) else ''
+                                          for column in columns]))
+        return 'skip'
+
+    try:
+        reader = pyarrow.csv.open_csv(
+            source, read_options=pyarrow.csv.ReadOptions(block_size=CSV_READ_SIZE, autogenerate_column_names=True),
+            parse_options=pyarrow.csv.ParseOptions(newlines_in_values=True, invalid_row_handler=read_invalid_row),
+            convert_options=pyarrow.csv.ConvertOptions(
+                include_columns=names, include_missing_columns=True,
+                column_types={name: pyarrow.string() for name in names},
+                strings_can_be_null=False, quoted_strings_can_be_null=False))
+    except pyarrow.ArrowInvalid as e:
+        if str(e).startswith("Empty CSV file"):
+            return
+        raise
+    # Number of rows yielded so far
+    row_count = 0
+    for batch in reader:
+        block = [_read_arrow_column(batch.column(index)) for index in range(len(names))]
+        if invalid_rows:
+            block = _insert_rows(block, invalid_rows, row_count)
+        row_count += len(block[0])
+        yield block
+    if invalid_rows:
+        yield _insert_rows([[] for _ in names], invalid_rows, row_count)
+
+
+def _read_arrow_column(column) -> list:
+    if column.null_count:
+        # A column missing from the first row
+        return ['' if value is None else value for value in column.to_pylist()]
+    if pyarrow.compute.any(pyarrow.compute.match_substring(column, '\r')).as_py():
+        column = pyarrow.compute.replace_substring_regex(column, '\r\n?', '\n')
+    return column.to_pylist()
+
+
+def _insert_rows(block: typing.List[list], rows: typing.Deque[tuple], row_count: int) -> typing.List[list]:
+    # Insert the rows, given as (1-based row number, values), that fall within or at the end of the block, which
+    # starts after row_count rows
+    merged = [[] for _ in block]
+    start = 0
+    while rows and rows[0][0] - 1 - row_count - len(merged[0]) <= len(block[0]) - start:
+        number, values = rows.popleft()
+        end = start + number - 1 - row_count - len(merged[0])
+        for merged_values, block_values, value in zip(merged, block, values):
+            merged_values.extend(block_values[start:end])
+            merged_values.append(value)
+        start = end
+    for merged_values, block_values in zip(merged, block):
+        merged_values.extend(block_values[start:])
+    return merged
+
+
+def _normalise_newlines(value: str) -> str:
+    # Line breaks within values as read by the csv module from a file opened in text mode
+    return value.replace('\r\n', '\n').replace('\r', '\n') if '\r' in value else value
+
+
+def _read_pandas_blocks(source: typing.Union[str, typing.BinaryIO], columns: typing.List[int],
+                        block_size: int) -> typing.Iterator[typing.List[list]]:
+    try:
+        chunks = pd.read_csv(source, header=None, usecols=columns, dtype=str, keep_default_na=False,
+                             chunksize=block_size, compression='infer')
+    except pd.errors.EmptyDataError:
+        return
+    with chunks:
+        for chunk in chunks:
+            block = []
+            for column in columns:
+                values = chunk[column]
+                if values.str.contains('\r', regex=False).any():
+                    values = values.str.replace('\r\n?', '\n', regex=True)
+                block.append(values.tolist())
+            yield block
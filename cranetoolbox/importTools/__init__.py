@@ -1,3 +1,12 @@
 from .transform import *
+from .columnar import *
+from .dateWindow import *
+from .decompress import *
+from .dedup import *
+from .jsonBackend import *
+from .jsonStream import *
+from .manifest import *
+from .prefilter import *
+from .tarIndex import *
 from .__main__ import main
 
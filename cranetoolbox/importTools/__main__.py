@@ -1,10 +1,18 @@
 import argparse
 import os
+from datetime import datetime
 
 from cranetoolbox.fileHandler import scan_folder
 from cranetoolbox.importTools import *
 
 
+def parse_date_argument(value: str) -> datetime:
+    date = parse_tweet_date(value)
+    if date is None:
+        raise argparse.ArgumentTypeError("invalid date: " + value)
+    return date
+
+
 def main():
     # Parse arguments
     parser = argparse.ArgumentParser(description="A tool to transform twitter data into a CSV format")
@@ -25,15 +33,60 @@ def main():
                                                                         'files')
     parser.add_argument('--output-name', type=str, default='filtered_data.csv',
                         help="Specify the output file name with extension")
+    parser.add_argument('--workers', type=int, default=1, help='number of worker processes used to process the input '
+                                                               'files in parallel')
+    parser.add_argument('--json-backend', type=str, default='json', choices=JSON_BACKENDS + ('auto',),
+                        help="JSON parser used to decode tweets, 'auto' selects the fastest installed one")
+    parser.add_argument('--targeted-fields', action='store_true',
+                        help='only decode the fields of the tweets needed for the output, only faster with the '
+                             'simdjson backend, other backends decode the whole tweet first')
+    parser.add_argument('--prefilter', action='store_true',
+                        help='reject tweets that clearly do not match the language and retweet filters before parsing '
+                             'them')
+    parser.add_argument('--tar-index', action='store_true',
+                        help='index uncompressed tar archives to process their members in parallel and resume '
+                             'interrupted runs')
+    parser.add_argument('--dedup', action='store_true',
+                        help='drop tweets whose id was already written, keeping the first occurrence')
+    parser.add_argument('--incremental', action='store_true',
+                        help='keep the output of previous runs and only process new or changed input files')
+    parser.add_argument('--rebuild', action='store_true',
+                        help='with --incremental, replace an existing output that was not written by an incremental '
+                             'run')
+    parser.add_argument('--input-format', type=str, default='lines', choices=INPUT_FORMATS,
+                        help="layout of the input files, 'lines' for one tweet per line, 'json' for JSON arrays or "
+                             "objects spanning several lines")
+    parser.add_argument('--output-format', type=str, default='csv', choices=OUTPUT_FORMATS,
+                        help='format of the output file, parquet and arrow store typed columns')
+    parser.add_argument('--since', type=parse_date_argument, default=None,
+                        help='only keep tweets created at or after this date, e.g. 2020-03-01 or 2020-03-01T12:00:00, '
+                             'in UTC unless an offset is given')
+    parser.add_argument('--until', type=parse_date_argument, default=None,
+                        help='only keep tweets created before this date')
+    parser.add_argument('--no-date-pruning', action='store_true',
+                        help='read all input files and archive members with --since/--until, even when their name '
+                             'or modification time show that they are outside of the window')
     args = parser.parse_args()
 
     # Extract options
     opts = TransformationOptions(args.tweet_language,
                                  args.retweets,
                                  args.max_lines_in_memory,
-                                 args.text_field_key,
-                                 args.date_field_key,
-                                 args.id_field_key)
+                                 text_field_key=args.text_field_key,
+                                 id_field_key=args.id_field_key,
+                                 date_field_key=args.date_field_key,
+                                 json_backend=args.json_backend,
+                                 targeted_fields=args.targeted_fields,
+                                 prefilter=args.prefilter,
+                                 tar_index=args.tar_index,
+                                 dedup=args.dedup,
+                                 incremental=args.incremental,
+                                 output_format=args.output_format,
+                                 since=args.since,
+                                 until=args.until,
+                                 date_pruning=not args.no_date_pruning,
+                                 input_format=args.input_format,
+                                 rebuild=args.rebuild)
 
     # Scan source folder for files
     file_list = scan_folder(args.source_folder)
@@ -41,7 +94,8 @@ def main():
     print(file_list)
 
     # Process the files and record stats
-    line_count, failure_count = process_files(file_list, opts, os.path.join(args.output_folder, args.output_name))
+    line_count, failure_count = process_files(file_list, opts, os.path.join(args.output_folder, args.output_name),
+                                              args.workers)
     print("wrote ", line_count, " lines", " failures ", failure_count)
 
 
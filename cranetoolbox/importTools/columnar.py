@@ -0,0 +1,99 @@
+# Typed columnar output (Parquet and Arrow) for imported tweets
+
+from typing import List, Optional
+
+from cranetoolbox.importTools.dateWindow import parse_tweet_date
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+OUTPUT_FORMATS = ('csv', 'parquet', 'arrow')
+OUTPUT_COLUMNS = ('id', 'text', 'created_at')
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+
+
+def parse_tweet_id(tweet_id) -> Optional[int]:
+    """Convert the id of a tweet to an integer.
+
+    :param tweet_id: The id, as an integer or its decimal representation
+    :type tweet_id: int or str
+    :return: The id, or None if it is not an integer that fits in 64 bits
+    :rtype: int or None
+    """
+
+    if isinstance(tweet_id, bool):
+        return None
+    if isinstance(tweet_id, str):
+        try:
+            tweet_id = int(tweet_id)
+        except ValueError:
+            return None
+    if isinstance(tweet_id, int) and INT64_MIN <= tweet_id <= INT64_MAX:
+        return tweet_id
+    return None
+
+
+class ColumnarWriter:
+    """
+    Writer of tweets to a Parquet or Arrow IPC file, with typed columns
+
+    Rows of (id, text, created_at) are buffered and written in row groups (Parquet) or record batches (Arrow) of a
+    fixed number of rows. Ids are stored as int64 and creation dates as UTC timestamps. Values that cannot be
+    converted are stored as nulls, so that no tweet is lost. The output file is overwritten.
+    """
+
+    def __init__(self, path: str, output_format: str, row_group_size: int):
+        if output_format not in OUTPUT_FORMATS[1:]:
+            raise ValueError("Unknown columnar output format: " + str(output_format))
+        if pyarrow is None:
+            raise ImportError("The pyarrow package is required to write " + output_format + " files")
+        self.path = str(path)
+        self.row_group_size = max(row_group_size, 1)
+        self.schema = pyarrow.schema([(OUTPUT_COLUMNS[0], pyarrow.int64()),
+                                      (OUTPUT_COLUMNS[1], pyarrow.string()),
+                                      (OUTPUT_COLUMNS[2], pyarrow.timestamp('ms', tz='UTC'))])
+        if output_format == 'parquet':
+            self._writer = pyarrow.parquet.ParquetWriter(self.path, self.schema)
+        else:
+            self._writer = pyarrow.ipc.new_file(self.path, self.schema)
+        self._buffer = []
+
+    def writerows(self, rows: List[list]):
+        """Add rows of (id, text, created_at) to the file.
+
+        :param rows: The rows, with the values as written in the tweets or read from a CSV file
+        :type rows: list(list)
+        """
+
+        self._buffer.extend(rows)
+        while len(self._buffer) >= self.row_group_size:
+            self._write_buffer(self.row_group_size)
+
+    def close(self):
+        while self._buffer:
+            self._write_buffer(self.row_group_size)
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_buffer(self, size: int):
+        rows = self._buffer[:size]
+        del self._buffer[:size]
+        batch = pyarrow.record_batch([pyarrow.array([parse_tweet_id(row[0]) for row in rows], pyarrow.int64()),
+                                      pyarrow.array([row[1] for row in rows], pyarrow.string()),
+                                      pyarrow.array([parse_tweet_date(row[2]) for row in rows],
+                                                    pyarrow.timestamp('ms', tz='UTC'))],
+                                     schema=self.schema)
+        if isinstance(self._writer, pyarrow.parquet.ParquetWriter):
+            self._writer.write_batch(batch, row_group_size=size)
+        else:
+            self._writer.write_batch(batch)
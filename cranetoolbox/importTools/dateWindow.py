@@ -0,0 +1,162 @@
+# Filtering of tweets and input files on a window of creation dates
+
+import re
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+TWITTER_DATE_FORMAT = '%a %b %d %H:%M:%S %z %Y'
+# Twitter dates in UTC, the format of the Twitter API, which can be compared without building a datetime
+TWITTER_UTC_DATE = re.compile(r'[A-Z][a-z]{2} ([A-Z][a-z]{2}) (\d\d) (\d\d:\d\d:\d\d) \+0000 (\d{4})$')
+# A day written in a file or member name, e.g. 2020-03-15, 2020_03_15, 2020/03/15 or 20200315
+NAME_DATE = re.compile(r'(?<!\d)(20\d\d)[-_./]?(0[1-9]|1[0-2])[-_./]?(0[1-9]|[12]\d|3[01])(?!\d)')
+# Tweets of an input can be off from the day in its name or from its modification time, e.g. because of time zones
+INPUT_PRUNING_MARGIN = timedelta(days=1)
+# ISO 8601 dates, as written by datetime.isoformat, which cannot be parsed with datetime.fromisoformat before Python 3.7
+ISO_DATE = re.compile(r'(\d{4})-(\d\d)-(\d\d)(?:[T ](\d\d):(\d\d)(?::(\d\d)(?:\.(\d{1,6})\d*)?)?)?'
+                      r'(?:(Z)|([+-])(\d\d):?(\d\d))?$')
+_MONTHS = {month: index + 1 for index, month in enumerate(
+    ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec'))}
+_MONTH_KEYS = {month: "%02d" % number for month, number in _MONTHS.items()}
+
+
+def parse_tweet_date(date: str) -> Optional[datetime]:
+    """Parse the creation date of a tweet into an aware datetime in UTC.
+
+    Dates in the Twitter format, e.g. 'Wed Oct 10 20:19:24 +0000 2018', are read from fixed positions. Other formats
+    are tried with :func:`datetime.strptime` and as ISO 8601 dates, naive dates are assumed to be in UTC.
+
+    :param date: The date as written in the tweet
+    :type date: str
+    :return: The date in UTC, or None if it could not be parsed
+    :rtype: datetime or None
+    """
+
+    if not isinstance(date, str):
+        return None
+    if len(date) == 30 and date[3] == ' ' and date[19] == ' ' and date[25] == ' ':
+        try:
+            offset = int(date[21:23]) * 60 + int(date[23:25])
+            if date[20] == '-':
+                offset = -offset
+            elif date[20] != '+':
+                raise ValueError
+            parsed = datetime(int(date[26:30]), _MONTHS[date[4:7]], int(date[8:10]), int(date[11:13]),
+                              int(date[14:16]), int(date[17:19]), tzinfo=timezone(timedelta(minutes=offset)))
+            return parsed.astimezone(timezone.utc)
+        except (KeyError, ValueError):
+            pass
+    for parse in (lambda value: datetime.strptime(value, TWITTER_DATE_FORMAT), _parse_iso_date):
+        try:
+            parsed = parse(date)
+        except ValueError:
+            continue
+        if parsed.tzinfo is None:
+            return parsed.replace(tzinfo=timezone.utc)
+        return parsed.astimezone(timezone.utc)
+    return None
+
+
+def _parse_iso_date(date: str) -> datetime:
+    match = ISO_DATE.match(date)
+    if match is None:
+        raise ValueError("not an ISO 8601 date: " + date)
+    year, month, day, hour, minute, second, fraction, utc, sign, offset_hours, offset_minutes = match.groups()
+    tzinfo = None
+    if utc:
+        tzinfo = timezone.utc
+    elif sign:
+        offset = int(offset_hours) * 60 + int(offset_minutes)
+        tzinfo = timezone(timedelta(minutes=-offset if sign == '-' else offset))
+    return datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0),
+                    int((fraction or '0').ljust(6, '0')), tzinfo=tzinfo)
+
+
+def _to_utc_second(date: Optional[datetime]) -> Optional[datetime]:
+    # Tweet dates have a resolution of one second, bounds are rounded up to the next second
+    if date is None:
+        return None
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    date = date.astimezone(timezone.utc)
+    if date.microsecond:
+        date = date.replace(microsecond=0) + timedelta(seconds=1)
+    return date
+
+
+class DateWindow:
+    """
+    A window of tweet creation dates, from *since* (included) to *until* (excluded)
+
+    Either bound can be None to leave the window open on that side. Naive bounds are assumed to be in UTC.
+    """
+
+    def __init__(self, since: Optional[datetime] = None, until: Optional[datetime] = None):
+        self.since = _to_utc_second(since)
+        self.until = _to_utc_second(until)
+        self._since_key = self.since.strftime('%Y%m%d%H:%M:%S') if self.since is not None else None
+        self._until_key = self.until.strftime('%Y%m%d%H:%M:%S') if self.until is not None else None
+
+    def contains(self, date: datetime) -> bool:
+        """Check whether an aware date is in the window.
+
+        :param date: The date
+        :type date: datetime
+        :return: True if the date is in the window
+        :rtype: bool
+        """
+
+        return (self.since is None or date >= self.since) and (self.until is None or date < self.until)
+
+    def contains_date(self, date: str) -> Optional[bool]:
+        """Check whether the creation date of a tweet, as written in the tweet, is in the window.
+
+        Dates in the Twitter format in UTC are compared as strings, other dates are parsed with
+        :func:`parse_tweet_date`.
+
+        :param date: The date as written in the tweet
+        :type date: str
+        :return: True if the date is in the window, False if it is not, None if it could not be parsed
+        :rtype: bool or None
+        """
+
+        match = TWITTER_UTC_DATE.match(date) if isinstance(date, str) else None
+        month = _MONTH_KEYS.get(match.group(1)) if match is not None else None
+        if month is not None:
+            key = match.group(4) + month + match.group(2) + match.group(3)
+            return (self._since_key is None or key >= self._since_key) and \
+                (self._until_key is None or key < self._until_key)
+        parsed = parse_tweet_date(date)
+        if parsed is None:
+            return None
+        return self.contains(parsed)
+
+    def may_contain_input(self, name: str, mtime: Optional[float] = None) -> bool:
+        """Check whether an input file or archive member can hold tweets from the window, from its name and mtime.
+
+        Inputs are assumed to hold the tweets of the day written in their name, or of the days from the first to the
+        last date if several are written, e.g. 'tweets_2020-01-01_2020-06-30.json', and to be written after the
+        creation of their tweets. Both are allowed to be off by :data:`INPUT_PRUNING_MARGIN`.
+
+        :param name: Name or path of the input
+        :type name: str
+        :param mtime: Modification time of the input, as a POSIX timestamp, or None if unknown
+        :type mtime: float or None
+        :return: False if the input can be skipped
+        :rtype: bool
+        """
+
+        days = []
+        for year, month, day in NAME_DATE.findall(str(name)):
+            try:
+                days.append(datetime(int(year), int(month), int(day), tzinfo=timezone.utc))
+            except ValueError:
+                continue
+        if days:
+            if self.since is not None and max(days) + timedelta(days=1) + INPUT_PRUNING_MARGIN <= self.since:
+                return False
+            if self.until is not None and min(days) - INPUT_PRUNING_MARGIN >= self.until:
+                return False
+        if mtime is not None and self.since is not None:
+            if datetime.fromtimestamp(mtime, timezone.utc) + INPUT_PRUNING_MARGIN < self.since:
+                return False
+        return True
@@ -0,0 +1,276 @@
+# Streaming decompression of compressed files and (nested) archives
+
+import bz2
+import gzip
+import io
+import lzma
+import queue
+import tarfile
+import tempfile
+import threading
+import zipfile
+from datetime import datetime
+from itertools import islice
+from typing import BinaryIO, Callable, Iterator, Optional, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Number of bytes needed to detect the format of a stream, a tar header is the longest signature
+HEADER_SIZE = 512
+# Magic numbers of the supported compression and archive formats
+MAGIC_NUMBERS = [
+    (b'\x1f\x8b', 'gzip'),
+    (b'BZh', 'bz2'),
+    (b'\xfd7zXZ\x00', 'xz'),
+    (b'\x28\xb5\x2f\xfd', 'zstd'),
+    (b'PK\x03\x04', 'zip'),
+]
+COMPRESSION_FORMATS = ('gzip', 'bz2', 'xz', 'zstd')
+# Nested zip archives need random access, they are spooled to disk past this size
+ZIP_SPOOL_MAX_SIZE = 64 * 1024 * 1024
+# Lines are handed from the decompression thread to the parser in batches of this size
+LINE_BATCH_SIZE = 1000
+LINE_QUEUE_SIZE = 16
+
+
+class _PrefixedStream(io.RawIOBase):
+    """
+    A raw binary stream replaying already consumed bytes before the rest of a stream
+    """
+
+    def __init__(self, prefix: bytes, stream: BinaryIO):
+        self._prefix = prefix
+        self._stream = stream
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._prefix:
+            size = min(len(buffer), len(self._prefix))
+            buffer[:size] = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return size
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def detect_format(header: bytes) -> str:
+    """Detect the format of a stream from its first bytes.
+
+    :param header: The first bytes of the stream, at least HEADER_SIZE unless the stream is shorter
+    :type header: bytes
+    :return: One of 'gzip', 'bz2', 'xz', 'zstd', 'zip', 'tar' or 'plain'
+    :rtype: str
+    """
+
+    for magic, name in MAGIC_NUMBERS:
+        if header.startswith(magic):
+            return name
+    if len(header) >= HEADER_SIZE:
+        try:
+            # Checks the header checksum, which also covers old tar formats without the 'ustar' magic
+            tarfile.TarInfo.frombuf(header[:HEADER_SIZE], tarfile.ENCODING, 'surrogateescape')
+            return 'tar'
+        except tarfile.HeaderError:
+            pass
+    return 'plain'
+
+
+def detect_file_format(path: str) -> str:
+    """Detect the format of a file from its magic bytes.
+
+    :param path: Path to the file
+    :type path: str
+    :return: One of 'gzip', 'bz2', 'xz', 'zstd', 'zip', 'tar' or 'plain'
+    :rtype: str
+    """
+
+    with open(path, 'rb') as f:
+        return detect_format(f.read(HEADER_SIZE))
+
+
+def peek_stream(stream: BinaryIO) -> Tuple[bytes, BinaryIO]:
+    """Read the first bytes of a non-seekable stream without losing them.
+
+    :param stream: A binary stream
+    :type stream: file object
+    :return: The first HEADER_SIZE bytes, or less for shorter streams, and a stream starting from the first byte
+    :rtype: tuple(bytes, file object)
+    """
+
+    header = b''
+    while len(header) < HEADER_SIZE:
+        data = stream.read(HEADER_SIZE - len(header))
+        if not data:
+            break
+        header += data
+    return header, io.BufferedReader(_PrefixedStream(header, stream))
+
+
+def open_decompressor(compression: str, stream: BinaryIO) -> BinaryIO:
+    """Wrap a compressed stream into a stream of decompressed bytes.
+
+    :param compression: One of 'gzip', 'bz2', 'xz' or 'zstd'
+    :type compression: str
+    :param stream: The compressed binary stream
+    :type stream: file object
+    :return: The decompressed binary stream
+    :rtype: file object
+    """
+
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if compression == 'bz2':
+        return bz2.BZ2File(stream, mode='rb')
+    if compression == 'xz':
+        return lzma.LZMAFile(stream, mode='rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise ImportError("The zstandard package is required to read zstd compressed files")
+        return io.BufferedReader(zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True))
+    raise ValueError("Unknown compression format: " + compression)
+
+
+def iter_file_streams(path: str, member_filter: Optional[Callable[[str, float], bool]] = None) -> \
+        Iterator[Tuple[str, BinaryIO]]:
+    """Iterate over the decompressed content of a file, recursing into archives and nested compression.
+
+    Each stream must be fully consumed before the next one is requested, since archives are read in streaming mode.
+
+    :param path: Path to the file
+    :type path: str
+    :param member_filter: A function of the name and modification time of an archive member, returning False for the
+        members to skip, or None to read all members
+    :type member_filter: function or None
+    :return: Iterator of (name, binary stream) for each plain file found, with names of archive members appended to
+        the path of the archive
+    :rtype: iterator(tuple(str, file object))
+    """
+
+    if detect_file_format(path) == 'zip':
+        # Top-level zip archives are read with random access directly from disk
+        with zipfile.ZipFile(path) as zf:
+            yield from _iter_zip_members(zf, str(path), member_filter)
+        return
+    with open(path, 'rb') as f:
+        yield from iter_decompressed_streams(f, str(path), member_filter)
+
+
+def iter_decompressed_streams(stream: BinaryIO, name: str,
+                              member_filter: Optional[Callable[[str, float], bool]] = None) -> \
+        Iterator[Tuple[str, BinaryIO]]:
+    """Iterate over the decompressed content of a stream, recursing into archives and nested compression.
+
+    :param stream: A binary stream
+    :type stream: file object
+    :param name: Name used to report the stream and its members
+    :type name: str
+    :param member_filter: A function of the name and modification time of an archive member, returning False for the
+        members to skip, or None to read all members
+    :type member_filter: function or None
+    :return: Iterator of (name, binary stream) for each plain file found
+    :rtype: iterator(tuple(str, file object))
+    """
+
+    header, stream = peek_stream(stream)
+    stream_format = detect_format(header)
+    if stream_format in COMPRESSION_FORMATS:
+        yield from iter_decompressed_streams(open_decompressor(stream_format, stream), name, member_filter)
+    elif stream_format == 'tar':
+        with tarfile.open(fileobj=stream, mode='r|') as tf:
+            for member in tf:
+                if not member.isfile():
+                    # The member is not a file(could be a malformed file, a folder etc.)
+                    print("skipping archive member: ", member.name)
+                    continue
+                if member_filter is not None and not member_filter(member.name, member.mtime):
+                    continue
+                yield from iter_decompressed_streams(tf.extractfile(member), name + "/" + member.name,
+                                                     member_filter)
+    elif stream_format == 'zip':
+        # Zip archives keep their index at the end, nested ones are spooled to allow random access
+        with tempfile.SpooledTemporaryFile(max_size=ZIP_SPOOL_MAX_SIZE) as spool:
+            while True:
+                data = stream.read(io.DEFAULT_BUFFER_SIZE * 64)
+                if not data:
+                    break
+                spool.write(data)
+            spool.seek(0)
+            with zipfile.ZipFile(spool) as zf:
+                yield from _iter_zip_members(zf, name, member_filter)
+    else:
+        yield name, stream
+
+
+def _iter_zip_members(zf: zipfile.ZipFile, name: str,
+                      member_filter: Optional[Callable[[str, float], bool]] = None) -> Iterator[Tuple[str, BinaryIO]]:
+    for info in zf.infolist():
+        if info.is_dir():
+            print("skipping archive member: ", info.filename)
+            continue
+        if member_filter is not None and not member_filter(info.filename, datetime(*info.date_time).timestamp()):
+            continue
+        with zf.open(info) as member:
+            yield from iter_decompressed_streams(member, name + "/" + info.filename, member_filter)
+
+
+def read_lines_in_background(stream: BinaryIO, batch_size: int = LINE_BATCH_SIZE,
+                             queue_size: int = LINE_QUEUE_SIZE) -> Iterator[bytes]:
+    """Read the lines of a stream on a background thread.
+
+    Decompression releases the GIL, so reading ahead on a separate thread lets decompression overlap with parsing.
+    At most queue_size batches of lines are held in memory.
+
+    :param stream: A binary stream
+    :type stream: file object
+    :param batch_size: Number of lines handed over at once
+    :type batch_size: int
+    :param queue_size: Maximum number of batches read ahead
+    :type queue_size: int
+    :return: Iterator over the lines of the stream
+    :rtype: iterator(bytes)
+    """
+
+    batches = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                batches.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def reader():
+        try:
+            while True:
+                batch = list(islice(stream, batch_size))
+                if not batch:
+                    break
+                if not put(batch):
+                    return
+            put(None)
+        except BaseException as e:
+            # Forward the error to the consumer
+            put(e)
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    try:
+        while True:
+            batch = batches.get()
+            if batch is None:
+                break
+            if isinstance(batch, BaseException):
+                raise batch
+            yield from batch
+    finally:
+        stop.set()
+        thread.join()
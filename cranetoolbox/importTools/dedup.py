@@ -0,0 +1,153 @@
+# Memory-bounded set of tweet ids, to drop duplicated tweets during import
+
+import re
+from itertools import repeat
+from typing import Hashable, Iterable, List
+
+import numpy as np
+
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+# Decimal representation of an integer id, str.isdigit also accepts non-ASCII digits
+_DECIMAL_ID = re.compile(r'[0-9]+')
+# Number of recent ids held in a Python set before they are packed into a sorted array
+DEFAULT_BUFFER_SIZE = 1000000
+
+
+class TweetIdSet:
+    """
+    A set of tweet ids stored compactly, counting the duplicates it is given
+
+    Integer ids (or their decimal string representation) are stored in sorted int64 arrays, using 8 bytes per id, so
+    that hundreds of millions of ids fit in a few GB. Recent ids are buffered in a Python set, and packed into a new
+    sorted array when the buffer is full. Arrays are merged when a newer one grows as large as an older one, which keeps
+    their number logarithmic in the number of ids. Any other id is kept in an exact Python set.
+
+    A set can be given a *parent*, whose ids count as already seen. New ids are only added to the parent by
+    :meth:`commit`, e.g. once the rows of an input are safely written, so that the ids of an input that failed can be
+    dropped with its rows.
+    """
+
+    def __init__(self, buffer_size: int = DEFAULT_BUFFER_SIZE, parent: 'TweetIdSet' = None):
+        self.duplicates = 0
+        self.parent = parent
+        self._buffer_size = buffer_size
+        self._runs = []
+        self._buffer = set()
+        self._others = set()
+
+    def __len__(self) -> int:
+        return sum(len(run) for run in self._runs) + len(self._buffer) + len(self._others)
+
+    def __contains__(self, tweet_id) -> bool:
+        return self._contains_keys([self._key(tweet_id)])[0]
+
+    def __iter__(self):
+        for run in self._runs:
+            yield from run.tolist()
+        yield from self._buffer
+        yield from self._others
+
+    def filter_new(self, tweet_ids: Iterable) -> List[bool]:
+        """Add a batch of ids to the set, and tell which ones were not in it yet.
+
+        An id repeated within the batch is only new the first time.
+
+        :param tweet_ids: The ids to add
+        :type tweet_ids: iterable
+        :return: For each id, True if it was new, False if it is a duplicate
+        :rtype: list(bool)
+        """
+
+        keys = [self._key(tweet_id) for tweet_id in tweet_ids]
+        integer_keys = np.fromiter((key for key in keys if isinstance(key, int)), dtype=np.int64)
+        in_runs = self._in_runs(integer_keys).tolist()
+        in_parent = self.parent._contains_keys(keys) if self.parent is not None else repeat(False)
+        is_new = []
+        integer_position = 0
+        for key, seen_in_parent in zip(keys, in_parent):
+            if seen_in_parent:
+                seen = True
+                if isinstance(key, int):
+                    integer_position += 1
+            elif isinstance(key, int):
+                seen = in_runs[integer_position] or key in self._buffer
+                integer_position += 1
+                if not seen:
+                    self._buffer.add(key)
+            else:
+                seen = key in self._others
+                if not seen:
+                    self._others.add(key)
+            if seen:
+                self.duplicates += 1
+            is_new.append(not seen)
+        if len(self._buffer) >= self._buffer_size:
+            self._pack_buffer()
+        return is_new
+
+    def update(self, tweet_ids: Iterable):
+        """Add ids to the set without counting the ones already in it as duplicates.
+
+        :param tweet_ids: The ids to add
+        :type tweet_ids: iterable
+        """
+
+        duplicates = self.duplicates
+        self.filter_new(tweet_ids)
+        self.duplicates = duplicates
+
+    def commit(self):
+        """Add the ids of this set, and its count of duplicates, to its parent."""
+
+        self.parent.update(self)
+        self.parent.duplicates += self.duplicates
+
+    def _contains_keys(self, keys: List[Hashable]) -> List[bool]:
+        integer_keys = np.fromiter((key for key in keys if isinstance(key, int)), dtype=np.int64)
+        in_runs = iter(self._in_runs(integer_keys).tolist())
+        found = []
+        for key in keys:
+            if isinstance(key, int):
+                found.append(next(in_runs) or key in self._buffer)
+            else:
+                found.append(key in self._others)
+        if self.parent is not None:
+            found = [seen or seen_in_parent for seen, seen_in_parent in zip(found, self.parent._contains_keys(keys))]
+        return found
+
+    @staticmethod
+    def _key(tweet_id) -> Hashable:
+        # Ids are compared as written in the output, so 42 and "42" are the same tweet
+        if isinstance(tweet_id, bool):
+            return str(tweet_id)
+        if isinstance(tweet_id, int):
+            key = tweet_id
+        elif isinstance(tweet_id, str) and _DECIMAL_ID.fullmatch(tweet_id) \
+                and (tweet_id == "0" or tweet_id[0] != "0"):
+            key = int(tweet_id)
+        else:
+            return str(tweet_id)
+        if INT64_MIN <= key <= INT64_MAX:
+            return key
+        return str(key)
+
+    def _in_runs(self, keys: np.ndarray) -> np.ndarray:
+        found = np.zeros(len(keys), dtype=bool)
+        for run in self._runs:
+            positions = np.searchsorted(run, keys)
+            positions[positions == len(run)] = 0
+            found |= run[positions] == keys
+        return found
+
+    def _pack_buffer(self):
+        self._runs.append(np.array(sorted(self._buffer), dtype=np.int64))
+        self._buffer = set()
+        # Merge runs of similar sizes, newer runs are always smaller than older ones
+        while len(self._runs) > 1 and len(self._runs[-2]) <= 2 * len(self._runs[-1]):
+            newer = self._runs.pop()
+            older = self._runs.pop()
+            merged = np.concatenate((older, newer))
+            # Both halves are sorted, which a stable sort merges in linear time
+            merged.sort(kind='stable')
+            self._runs.append(merged)
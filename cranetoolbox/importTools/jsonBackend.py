@@ -0,0 +1,125 @@
+# Pluggable JSON parsing backends for tweets
+
+import json
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+JSON_BACKENDS = ('json', 'orjson', 'simdjson', 'ujson')
+# Preference order when the backend is selected automatically
+AUTO_BACKENDS = ('orjson', 'simdjson', 'ujson', 'json')
+_MODULES = {'json': json, 'orjson': orjson, 'simdjson': simdjson, 'ujson': ujson}
+
+
+def available_json_backends() -> Tuple[str, ...]:
+    """List the JSON backends that can be used in the current environment.
+
+    :return: Names of the installed backends, the standard library backend 'json' is always available
+    :rtype: tuple(str)
+    """
+
+    return tuple(name for name in JSON_BACKENDS if _MODULES[name] is not None)
+
+
+def resolve_json_backend(backend: str) -> str:
+    """Get the name of the backend to use, resolving 'auto' to the fastest installed one.
+
+    :param backend: Name of a backend, or 'auto'
+    :type backend: str
+    :return: Name of an installed backend
+    :rtype: str
+    """
+
+    if backend == 'auto':
+        return next(name for name in AUTO_BACKENDS if _MODULES[name] is not None)
+    if backend not in JSON_BACKENDS:
+        raise ValueError("Unknown JSON backend: " + str(backend))
+    if _MODULES[backend] is None:
+        raise ImportError("The " + backend + " package is required to use the " + backend + " JSON backend")
+    return backend
+
+
+def get_json_loads(backend: str) -> Callable:
+    """Get the function decoding a full JSON document with the given backend.
+
+    All backends accept both str and bytes and raise a ValueError (or subclass) on invalid input.
+
+    :param backend: Name of a backend, or 'auto'
+    :type backend: str
+    :return: A function decoding a JSON document into Python objects
+    :rtype: function
+    """
+
+    return _MODULES[resolve_json_backend(backend)].loads
+
+
+@lru_cache(maxsize=None)
+def get_tweet_parser(backend: str = 'json', fields: Optional[Tuple[str, ...]] = None) -> Callable:
+    """Get a function parsing a tweet from its JSON representation into a dictionary.
+
+    When fields are given, only these top-level keys are kept. With the *simdjson* backend, the document is parsed
+    lazily and only the values of these keys are decoded, skipping the nested objects that are not needed. With other
+    backends, the document is fully decoded before keeping the fields. In both cases, the dictionary holds the same
+    values for these keys as a full decode.
+
+    :param backend: Name of a backend, or 'auto'
+    :type backend: str
+    :param fields: Top-level keys to extract, or None to decode the full tweet
+    :type fields: tuple(str) or None
+    :return: A function parsing a tweet, raising a ValueError if the input is invalid or not a JSON object
+    :rtype: function
+    """
+
+    backend = resolve_json_backend(backend)
+    if fields is not None and backend == 'simdjson':
+        return _make_lazy_parser(fields)
+
+    loads = get_json_loads(backend)
+
+    def parse(tweet) -> dict:
+        tweet_dict = loads(tweet)
+        if not isinstance(tweet_dict, dict):
+            raise ValueError
+        if fields is not None:
+            tweet_dict = {key: tweet_dict[key] for key in fields if key in tweet_dict}
+        return tweet_dict
+
+    return parse
+
+
+def _make_lazy_parser(fields: Tuple[str, ...]) -> Callable:
+    parser = simdjson.Parser()
+
+    def parse(tweet) -> dict:
+        document = parser.parse(tweet.encode('utf-8') if isinstance(tweet, str) else tweet)
+        if not isinstance(document, simdjson.Object):
+            raise ValueError
+        tweet_dict = {}
+        for key in fields:
+            if key not in document:
+                continue
+            value = document[key]
+            if isinstance(value, simdjson.Object):
+                value = value.as_dict()
+            elif isinstance(value, simdjson.Array):
+                value = value.as_list()
+            tweet_dict[key] = value
+        # Release the document before the parser is reused
+        del document
+        return tweet_dict
+
+    return parse
@@ -0,0 +1,138 @@
+# Incremental splitting of JSON arrays and multi-line JSON objects into single documents
+
+import re
+from functools import partial
+from typing import IO, Iterable, Iterator, Union
+
+INPUT_FORMATS = ('lines', 'json')
+# Size of the reads of a JSON input, which can be a single line holding the whole file
+JSON_CHUNK_SIZE = 1 << 20
+# An object growing past this size without being closed is reported as malformed, to bound memory use
+MAX_DOCUMENT_SIZE = 64 * 1024 * 1024
+
+# Complete strings, brackets, and quotes opening a string that is not closed in the same chunk. Strings cannot span
+# lines in JSON, since line breaks within them must be escaped.
+_STR_TOKENS = re.compile(r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"|[{}\[\]"]')
+_BYTES_TOKENS = re.compile(rb'"[^"\\\n]*(?:\\.[^"\\\n]*)*"|[{}\[\]"]')
+# Rest of a string opened in a previous chunk, up to its closing quote, a line break or the end of the chunk
+_STR_STRING_REST = re.compile(r'[^"\\\n]*(?:\\.[^"\\\n]*)*')
+_BYTES_STRING_REST = re.compile(rb'[^"\\\n]*(?:\\.[^"\\\n]*)*')
+
+
+def iter_chunks(stream: IO, chunk_size: int = JSON_CHUNK_SIZE) -> Iterator[Union[str, bytes]]:
+    """Read a text or binary stream by fixed-size chunks, regardless of its line breaks.
+
+    :param stream: The stream
+    :type stream: file object
+    :param chunk_size: Size of each read, in characters or bytes
+    :type chunk_size: int
+    :return: Iterator over the chunks
+    :rtype: iterator(str) or iterator(bytes)
+    """
+
+    for chunk in iter(partial(stream.read, chunk_size), None):
+        if not chunk:
+            break
+        yield chunk
+
+
+def iter_json_documents(chunks: Iterable[Union[str, bytes]],
+                        max_document_size: int = MAX_DOCUMENT_SIZE) -> Iterator[Union[str, bytes]]:
+    """Split the content of a JSON file into the raw text of each of its top-level objects.
+
+    Objects can be written on any number of lines, concatenated, or be the elements of a top-level array, so that
+    JSON lines, pretty-printed objects and large JSON arrays are all supported. The content can be given by lines or
+    by chunks of any size, see :func:`iter_chunks`, which are scanned one after the other, so that only the chunk and
+    the object being read are held in memory, even for an array written on a single line. Values that are not
+    objects, e.g. array brackets and separators, are skipped.
+
+    A malformed object, with a string not closed on its line or growing past max_document_size, is yielded as read so
+    far, to fail parsing and be reported, and reading resumes after it.
+
+    :param chunks: Lines or chunks of the file, as str or bytes
+    :type chunks: iterable(str) or iterable(bytes)
+    :param max_document_size: Maximum size of an object, in characters or bytes
+    :type max_document_size: int
+    :return: Iterator over the raw text of each object, of the type of the chunks
+    :rtype: iterator(str) or iterator(bytes)
+    """
+
+    depth = 0
+    # Within a string opened in a previous chunk, and after a backslash ending the previous chunk
+    in_string = False
+    escaped = False
+    parts = []
+    size = 0
+    for chunk in chunks:
+        if isinstance(chunk, (bytes, bytearray)):
+            tokens, string_rest = _BYTES_TOKENS, _BYTES_STRING_REST
+            opening_object, quote, backslash, opening = b'{', b'"', b'\\', (b'{', b'[')
+        else:
+            tokens, string_rest = _STR_TOKENS, _STR_STRING_REST
+            opening_object, quote, backslash, opening = '{', '"', '\\', ('{', '[')
+        start = 0
+        position = 0
+        while position < len(chunk):
+            if in_string:
+                if escaped:
+                    position += 1
+                    escaped = False
+                    continue
+                end = string_rest.match(chunk, position).end()
+                character = chunk[end:end + 1]
+                if character == quote:
+                    in_string = False
+                    position = end + 1
+                elif character == backslash and end + 1 == len(chunk):
+                    escaped = True
+                    position = end + 1
+                elif character:
+                    # Line break within the string, the object is malformed
+                    in_string = False
+                    position = end + 1
+                    if depth > 0:
+                        parts.append(chunk[start:end])
+                        yield chunk[:0].join(parts)
+                        parts = []
+                        size = 0
+                        depth = 0
+                else:
+                    position = end
+                continue
+            token = tokens.search(chunk, position)
+            if token is None:
+                break
+            position = token.end()
+            text = token.group()
+            if len(text) != 1:
+                # A complete string, brackets within it do not count
+                continue
+            if text == quote:
+                in_string = True
+            elif depth == 0:
+                # Outside of an object, only look for the next one
+                if text == opening_object:
+                    depth = 1
+                    start = token.start()
+            elif text in opening:
+                depth += 1
+            else:
+                depth -= 1
+                if depth == 0:
+                    parts.append(chunk[start:token.end()])
+                    yield chunk[:0].join(parts)
+                    parts = []
+                    size = 0
+        if depth > 0:
+            parts.append(chunk[start:])
+            size += len(chunk) - start
+            if size > max_document_size:
+                yield chunk[:0].join(parts)
+                parts = []
+                size = 0
+                depth = 0
+                in_string = False
+                escaped = False
+    if parts:
+        # Truncated object at the end of the file
+        yield parts[0][:0].join(parts)
@@ -0,0 +1,187 @@
+# Checkpoint manifest of the inputs already written to an import output file
+
+import json
+import os
+import shutil
+from typing import Dict, List, Optional, Tuple
+
+MANIFEST_SUFFIX = ".manifest.json"
+COPY_BUFFER_SIZE = 16 * 1024 * 1024
+
+
+def get_manifest_path(csv_output_path: str) -> str:
+    """Get the path of the manifest of an output file.
+
+    :param csv_output_path: Full output path of the combined CSV file
+    :type csv_output_path: str
+    :return: Path of the manifest
+    :rtype: str
+    """
+
+    return str(csv_output_path) + MANIFEST_SUFFIX
+
+
+def get_input_signature(path: str, member: Optional[Dict] = None) -> Tuple[str, Optional[str], int, float]:
+    """Identify an input unit, a file or a member of an indexed tar archive, and its current version.
+
+    :param path: Path to the input file
+    :type path: str
+    :param member: Index entry of a tar member, see :func:`build_tar_index`, or None for a whole file
+    :type member: dict
+    :return: A tuple of (absolute path, member name or None, size, modification time)
+    :rtype: tuple(str, str, int, float)
+    """
+
+    if member is not None:
+        return os.path.abspath(str(path)), member['name'], member['size'], member['mtime']
+    stat = os.stat(path)
+    return os.path.abspath(str(path)), None, stat.st_size, stat.st_mtime
+
+
+class ImportManifest:
+    """
+    Manifest of the inputs written to an import output file, saved next to it as <output>.manifest.json
+
+    Each input unit (a file, or a member of an indexed tar archive) is recorded with its size and modification time,
+    the byte range of its rows in the output file and its line and failure counts, once all its rows are written.
+    The output is only trusted up to the end of the last recorded unit: anything after it was written by an
+    interrupted run and is truncated when the manifest is opened.
+
+    An output without a manifest, e.g. written by a run without *incremental*, is not trusted either, but it is only
+    removed if *rebuild* is set, otherwise a ValueError is raised so that its content is not lost.
+    """
+
+    def __init__(self, csv_output_path: str, rebuild: bool = False):
+        self.output_path = str(csv_output_path)
+        self.manifest_path = get_manifest_path(csv_output_path)
+        self._entries = []
+        output_size = os.path.getsize(self.output_path) if os.path.exists(self.output_path) else 0
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, 'r') as manifest_file:
+                self._entries = json.load(manifest_file)['entries']
+        elif output_size > 0:
+            if not rebuild:
+                raise ValueError("Output file " + self.output_path + " has no manifest and was not written by an "
+                                 "incremental import, use the rebuild option to replace it")
+            print("Output file " + self.output_path + " has no manifest, it will be rebuilt")
+            os.remove(self.output_path)
+            output_size = 0
+        if output_size < self.committed_offset:
+            # The output was modified outside of the import, none of its content can be trusted
+            print("Output file " + self.output_path + " does not match its manifest, it will be rebuilt")
+            self._entries = []
+            if os.path.exists(self.output_path):
+                os.remove(self.output_path)
+        elif output_size > self.committed_offset:
+            print("Truncating incomplete rows at the end of " + self.output_path)
+            self.rollback()
+        self.save()
+
+    @property
+    def committed_offset(self) -> int:
+        return self._entries[-1]['end'] if self._entries else 0
+
+    def _find(self, path: str, member: Optional[str]) -> Optional[Dict]:
+        for entry in self._entries:
+            if entry['path'] == path and entry['member'] == member:
+                return entry
+        return None
+
+    def is_up_to_date(self, signature: Tuple[str, Optional[str], int, float]) -> bool:
+        """Check whether an input unit was fully written, and has not changed since.
+
+        :param signature: Signature of the unit, see :func:`get_input_signature`
+        :type signature: tuple
+        :return: True if the unit can be skipped
+        :rtype: bool
+        """
+
+        path, member, size, mtime = signature
+        entry = self._find(path, member)
+        return entry is not None and entry['size'] == size and entry['mtime'] == mtime
+
+    def drop_changed(self, signatures: List[Tuple[str, Optional[str], int, float]]) -> int:
+        """Remove from the output the rows of the units that changed since they were written.
+
+        Rows at the end of the output are truncated, others are removed by rewriting the output once.
+
+        :param signatures: Current signatures of the input units, see :func:`get_input_signature`
+        :type signatures: list(tuple)
+        :return: The number of units dropped
+        :rtype: int
+        """
+
+        changed = []
+        for signature in signatures:
+            path, member, size, mtime = signature
+            entry = self._find(path, member)
+            if entry is not None and (entry['size'] != size or entry['mtime'] != mtime):
+                changed.append(entry)
+        if not changed:
+            return 0
+
+        kept = [entry for entry in self._entries if all(entry is not dropped for dropped in changed)]
+        first_dropped = min(self._entries.index(entry) for entry in changed)
+        temp_path = self.output_path + ".tmp"
+        with open(self.output_path, 'rb') as output_file, open(temp_path, 'wb') as temp_file:
+            # Rows before the first changed unit are kept in place
+            shutil.copyfileobj(_limited(output_file, self._entries[first_dropped]['start']), temp_file,
+                               COPY_BUFFER_SIZE)
+            offset = self._entries[first_dropped]['start']
+            for entry in kept[first_dropped:]:
+                output_file.seek(entry['start'])
+                shutil.copyfileobj(_limited(output_file, entry['end'] - entry['start']), temp_file, COPY_BUFFER_SIZE)
+                entry['end'] = offset + entry['end'] - entry['start']
+                entry['start'] = offset
+                offset = entry['end']
+        self._entries = kept
+        # Save the manifest first, a crash in between leaves an output longer than the manifest, which is rebuilt
+        self.save()
+        os.replace(temp_path, self.output_path)
+        return len(changed)
+
+    def commit(self, signature: Tuple[str, Optional[str], int, float], counts: Tuple[int, int]):
+        """Record that all rows of an input unit were written at the end of the output.
+
+        :param signature: Signature of the unit, see :func:`get_input_signature`
+        :type signature: tuple
+        :param counts: Lines written and failures for the unit
+        :type counts: tuple(int, int)
+        """
+
+        path, member, size, mtime = signature
+        start = self.committed_offset
+        end = os.path.getsize(self.output_path) if os.path.exists(self.output_path) else start
+        self._entries.append({'path': path, 'member': member, 'size': size, 'mtime': mtime, 'start': start,
+                              'end': end, 'lines': counts[0], 'failures': counts[1]})
+        self.save()
+
+    def rollback(self):
+        """Truncate the output to the end of the last recorded unit, dropping the rows of a unit that failed."""
+
+        if os.path.exists(self.output_path):
+            with open(self.output_path, 'r+b') as output_file:
+                output_file.truncate(self.committed_offset)
+
+    def save(self):
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, 'w') as manifest_file:
+            json.dump({'output': self.output_path, 'entries': self._entries}, manifest_file)
+        os.replace(temp_path, self.manifest_path)
+
+
+class _limited:
+    """
+    A read-only view of the next bytes of a file, for shutil.copyfileobj
+    """
+
+    def __init__(self, f, size: int):
+        self._file = f
+        self._remaining = size
+
+    def read(self, size: int = -1) -> bytes:
+        if size < 0 or size > self._remaining:
+            size = self._remaining
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
@@ -0,0 +1,210 @@
+# Conservative filtering of raw JSON lines before they are parsed
+
+import re
+from typing import Optional, Union
+
+from cranetoolbox.importTools.dateWindow import DateWindow
+
+# Only the shorter side of a key, before or after it, is scanned to check that it belongs to the root object
+MAX_SCAN_LENGTH = 1024
+
+
+class _Patterns:
+    """
+    Compiled patterns for either str or bytes lines
+    """
+
+    def __init__(self, kind: type):
+        def compile_pattern(pattern: str):
+            return re.compile(pattern.encode('ascii') if kind is bytes else pattern)
+
+        self.kind = kind
+        # Strings, structural characters, and runs of anything else, covering a valid document without gaps
+        self.tokens = compile_pattern(r'"[^"\\]*(?:\\.[^"\\]*)*"|[{}\[\]]|[^"{}\[\]]+')
+        self.value = compile_pattern(r'"[^"\\]*(?:\\.[^"\\]*)*"|true|false|null')
+        self.first_char = compile_pattern(r'\s*{')
+        self.backslash = b'\\' if kind is bytes else '\\'
+        self.quote = b'"' if kind is bytes else '"'
+        self.opening = (b'{', b'[') if kind is bytes else ('{', '[')
+        self.closing = (b'}', b']') if kind is bytes else ('}', ']')
+        self.true = b'true' if kind is bytes else 'true'
+        self.rt = b'RT' if kind is bytes else 'RT'
+        self._keys = {}
+
+    def key(self, key: str):
+        pattern = self._keys.get(key)
+        if pattern is None:
+            escaped = re.escape('"' + key + '"') + r'\s*:\s*'
+            pattern = re.compile(escaped.encode('utf-8') if self.kind is bytes else escaped)
+            self._keys[key] = pattern
+        return pattern
+
+    def encode(self, text: str):
+        return text.encode('utf-8') if self.kind is bytes else text
+
+
+_STR_PATTERNS = _Patterns(str)
+_BYTES_PATTERNS = _Patterns(bytes)
+
+
+def find_top_level_value(line: Union[str, bytes], key: str) -> Optional[Union[str, bytes]]:
+    """Find the raw value of a key of the root object of a JSON line, without parsing the line.
+
+    Only string values and the literals true, false and null are reported. Nested objects can use the same keys, so a
+    value is only reported when the key is proven to belong to the root object, by scanning the shorter part of the
+    line before or after it. Duplicated keys are assumed not to occur.
+
+    :param line: A JSON object, as str or bytes
+    :type line: str or bytes
+    :param key: The key to look for
+    :type key: str
+    :return: The raw value, including quotes for strings, or None if it could not be found cheaply
+    :rtype: str or bytes or None
+    """
+
+    patterns = _BYTES_PATTERNS if isinstance(line, (bytes, bytearray)) else _STR_PATTERNS
+    if not patterns.first_char.match(line):
+        return None
+    # Top-level keys are most often either the first or the last occurrence
+    first = _find_key(line, key, patterns, reverse=False)
+    if first is None:
+        return None
+    last = _find_key(line, key, patterns, reverse=True)
+    candidates = [first] if last.start() == first.start() else [first, last]
+    # Try the cheapest one to check first
+    candidates.sort(key=lambda match: min(match.start(), len(line) - match.end()))
+    for match in candidates:
+        before = match.start()
+        if min(before, len(line) - match.end()) > MAX_SCAN_LENGTH:
+            continue
+        if _is_escaped(line, before, patterns):
+            # Quote preceded by an odd number of backslashes, this is the content of a string
+            continue
+        value = patterns.value.match(line, match.end())
+        if value is None:
+            continue
+        after = len(line) - value.end()
+        if before <= after:
+            is_root = _prefix_is_root(line[:before], patterns)
+        else:
+            is_root = _suffix_closes_root(line[value.end():], patterns)
+        if is_root:
+            return value.group()
+    return None
+
+
+def _find_key(line, key: str, patterns: _Patterns, reverse: bool):
+    # Plain substring search is much faster than a regex scan over the whole line
+    quoted_key = patterns.encode('"' + key + '"')
+    pattern = patterns.key(key)
+    position = line.rfind(quoted_key) if reverse else line.find(quoted_key)
+    while position != -1:
+        match = pattern.match(line, position)
+        if match is not None:
+            return match
+        position = line.rfind(quoted_key, 0, position) if reverse else line.find(quoted_key, position + 1)
+    return None
+
+
+def _is_escaped(line, position: int, patterns: _Patterns) -> bool:
+    backslashes = 0
+    while position - backslashes > 0 and line[position - backslashes - 1:position - backslashes] == patterns.backslash:
+        backslashes += 1
+    return backslashes % 2 == 1
+
+
+def _prefix_is_root(prefix, patterns: _Patterns) -> bool:
+    depth = 0
+    position = 0
+    for token in patterns.tokens.finditer(prefix):
+        if token.start() != position:
+            # Unmatched quote, the prefix ends within a string
+            return False
+        position = token.end()
+        first = token.group()[0:1]
+        if first in patterns.opening:
+            depth += 1
+        elif first in patterns.closing:
+            depth -= 1
+            if depth <= 0:
+                return False
+    return position == len(prefix) and depth == 1
+
+
+def _suffix_closes_root(suffix, patterns: _Patterns) -> bool:
+    depth = 0
+    position = 0
+    closed = False
+    for token in patterns.tokens.finditer(suffix):
+        if token.start() != position:
+            return False
+        position = token.end()
+        text = token.group()
+        if closed:
+            # Only whitespace can follow the end of the root object
+            if text.strip():
+                return False
+            continue
+        first = text[0:1]
+        if first in patterns.opening:
+            depth += 1
+        elif first in patterns.closing:
+            depth -= 1
+            if depth < 0:
+                if first != patterns.closing[0]:
+                    return False
+                closed = True
+    return position == len(suffix) and closed
+
+
+def prefilter_line(line: Union[str, bytes], filter_language: str, include_retweet: bool,
+                   text_field_key: Optional[str] = None, date_window: Optional[DateWindow] = None,
+                   date_field_key: Optional[str] = None) -> bool:
+    """Check from the raw JSON line whether a tweet could pass the language, retweet and date filters.
+
+    A line is only rejected when the top-level fields read by :func:`matches_language_filter`, :func:`is_retweet`
+    and :meth:`DateWindow.contains_date` can be found cheaply and clearly fail them. Any ambiguous line is accepted,
+    to be fully parsed and filtered.
+
+    :param line: A JSON tweet, as str or bytes
+    :type line: str or bytes
+    :param filter_language: The language of the tweets to keep
+    :type filter_language: str
+    :param include_retweet: Whether retweets are kept
+    :type include_retweet: bool
+    :param text_field_key: User-defined name for the "text" field
+    :type text_field_key: str or None
+    :param date_window: The window of creation dates of the tweets to keep, or None to keep all dates
+    :type date_window: DateWindow or None
+    :param date_field_key: User-defined name for the "created_at" field
+    :type date_field_key: str or None
+    :return: False if the tweet cannot pass the filters, True otherwise
+    :rtype: bool
+
+    .. warning:: A malformed line that is rejected is not counted as a parse failure.
+    """
+
+    patterns = _BYTES_PATTERNS if isinstance(line, (bytes, bytearray)) else _STR_PATTERNS
+
+    language = find_top_level_value(line, "lang")
+    if language is not None and language[0:1] == patterns.quote and patterns.backslash not in language:
+        if language[1:-1] != patterns.encode(filter_language):
+            return False
+
+    if not include_retweet:
+        if find_top_level_value(line, "retweeted") == patterns.true:
+            return False
+        text = find_top_level_value(line, text_field_key if text_field_key is not None else "text")
+        if text is not None and text[0:1] == patterns.quote and text[1:3] == patterns.rt:
+            return False
+
+    if date_window is not None:
+        date = find_top_level_value(line, date_field_key if date_field_key is not None else "created_at")
+        if date is not None and date[0:1] == patterns.quote and patterns.backslash not in date:
+            date = date[1:-1]
+            if isinstance(date, (bytes, bytearray)):
+                date = date.decode('utf-8', 'replace')
+            if date_window.contains_date(date) is False:
+                return False
+
+    return True
@@ -0,0 +1,168 @@
+# Member index of tar archives, for parallel and resumable processing of their members
+
+import io
+import json
+import os
+import tarfile
+import threading
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from cranetoolbox.importTools.decompress import detect_file_format
+
+INDEX_SUFFIX = ".index.json"
+
+
+class _RangeReader(io.RawIOBase):
+    """
+    A raw binary stream over a byte range of a file
+    """
+
+    def __init__(self, path: str, offset: int, size: int):
+        self._file = open(path, 'rb')
+        self._file.seek(offset)
+        self._remaining = size
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if self._remaining <= 0:
+            return 0
+        size = min(len(buffer), self._remaining)
+        data = self._file.read(size)
+        buffer[:len(data)] = data
+        self._remaining -= len(data)
+        return len(data)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+
+def get_index_path(path: str) -> str:
+    """Get the path of the sidecar index file of an archive.
+
+    :param path: Path to the tar archive
+    :type path: str
+    :return: Path to the index file
+    :rtype: str
+    """
+
+    return str(path) + INDEX_SUFFIX
+
+
+def build_tar_index(path: str) -> List[Dict]:
+    """List the offset and size of each file member of an uncompressed tar archive.
+
+    Only the headers are read, the payload of each member is skipped with a seek.
+
+    :param path: Path to the tar archive
+    :type path: str
+    :return: List of members with their 'name', 'offset' (of the data), 'size' and 'mtime'
+    :rtype: list(dict)
+    """
+
+    if detect_file_format(path) != 'tar':
+        raise ValueError("Only uncompressed tar archives can be indexed: " + str(path))
+    members = []
+    with tarfile.open(path, 'r:') as tf:
+        while True:
+            member = tf.next()
+            if member is None:
+                # End of members
+                break
+            # The archive keeps every header otherwise, we only need our own compact list
+            tf.members.clear()
+            if not member.isfile():
+                continue
+            members.append({'name': member.name, 'offset': member.offset_data, 'size': member.size,
+                            'mtime': member.mtime})
+    return members
+
+
+def open_tar_member(path: str, member: Dict) -> BinaryIO:
+    """Open a member of a tar archive with random access, from its index entry.
+
+    :param path: Path to the tar archive
+    :type path: str
+    :param member: Index entry of the member
+    :type member: dict
+    :return: Binary stream of the member's content
+    :rtype: file object
+    """
+
+    return io.BufferedReader(_RangeReader(path, member['offset'], member['size']))
+
+
+class TarIndex:
+    """
+    Sidecar index of an uncompressed tar archive, with the progress of the processing of its members
+
+    The index is rebuilt whenever the size or modification time of the archive changes. Progress is recorded for a
+    given output file: each member is marked as completed once its shard is written, then as merged once the shard
+    is appended to the output, so that an interrupted run can skip the members that are already done.
+    """
+
+    def __init__(self, path: str, output_path: str):
+        self.path = str(path)
+        self.index_path = get_index_path(path)
+        self.output_path = os.path.abspath(output_path)
+        self._lock = threading.Lock()
+
+        stat = os.stat(self.path)
+        data = None
+        if os.path.exists(self.index_path):
+            try:
+                with open(self.index_path, 'r') as index_file:
+                    data = json.load(index_file)
+            except (ValueError, OSError) as e:
+                print("Could not read index " + self.index_path + ", it will be rebuilt")
+                print(e)
+        if data is None or data.get('size') != stat.st_size or data.get('mtime') != stat.st_mtime:
+            data = {'size': stat.st_size, 'mtime': stat.st_mtime, 'members': build_tar_index(self.path)}
+        if data.get('output') != self.output_path:
+            # Progress recorded for another output file does not apply
+            data['output'] = self.output_path
+            data['progress'] = {}
+        self._data = data
+        self.save()
+
+    @property
+    def members(self) -> List[Dict]:
+        return self._data['members']
+
+    def get_progress(self, member_index: int) -> Optional[Dict]:
+        """Get the recorded progress of a member.
+
+        :param member_index: Position of the member in the index
+        :type member_index: int
+        :return: None if the member was not completed, or a dictionary with its 'lines' and 'failures' counts and
+            whether it was 'merged' into the output
+        :rtype: dict or None
+        """
+
+        return self._data['progress'].get(str(member_index))
+
+    def mark_completed(self, member_index: int, counts: Tuple[int, int]):
+        with self._lock:
+            if str(member_index) not in self._data['progress']:
+                self._data['progress'][str(member_index)] = {'lines': counts[0], 'failures': counts[1],
+                                                             'merged': False}
+                self.save()
+
+    def mark_merged(self, member_index: int, counts: Tuple[int, int]):
+        with self._lock:
+            self._data['progress'][str(member_index)] = {'lines': counts[0], 'failures': counts[1],
+                                                         'merged': True}
+            self.save()
+
+    def reset_progress(self):
+        with self._lock:
+            self._data['progress'] = {}
+            self.save()
+
+    def save(self):
+        temp_path = self.index_path + ".tmp"
+        with open(temp_path, 'w') as index_file:
+            json.dump(self._data, index_file)
+        os.replace(temp_path, self.index_path)
@@ -1,8 +1,26 @@
 import csv
 import json
-import tarfile
-from itertools import islice
-from typing import List
+import os
+import shutil
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from functools import partial
+from itertools import islice, repeat
+from typing import List, Optional, Tuple
+
+from cranetoolbox.importTools.columnar import ColumnarWriter
+from cranetoolbox.importTools.dateWindow import DateWindow
+from cranetoolbox.importTools.dedup import TweetIdSet
+from cranetoolbox.importTools.decompress import detect_file_format, iter_decompressed_streams, iter_file_streams, \
+    read_lines_in_background
+from cranetoolbox.importTools.jsonBackend import get_tweet_parser, resolve_json_backend
+from cranetoolbox.importTools.jsonStream import iter_chunks, iter_json_documents
+from cranetoolbox.importTools.manifest import ImportManifest, get_input_signature
+from cranetoolbox.importTools.prefilter import prefilter_line
+from cranetoolbox.importTools.tarIndex import TarIndex, open_tar_member
+
+SHARD_COPY_BUFFER_SIZE = 16 * 1024 * 1024
+SHARD_DEDUP_CHUNK_SIZE = 50000
 
 
 class TransformationOptions:
@@ -13,78 +31,423 @@ class TransformationOptions:
     filter_language: str
     include_retweet: bool
     max_in_memory_size: int
+    json_backend: str
+    targeted_fields: bool
+    prefilter: bool
+    tar_index: bool
+    dedup: bool
+    incremental: bool
+    rebuild: bool
+    output_format: str
+    date_window: Optional[DateWindow]
+    date_pruning: bool
+    input_format: str
 
     def __init__(self, languagefilter: str, retweets: bool, max_in_mem: int,
-                 text_field_key: str, id_field_key: str, date_field_key: str):
+                 text_field_key: str, id_field_key: str, date_field_key: str,
+                 json_backend: str = 'json', targeted_fields: bool = False, prefilter: bool = False,
+                 tar_index: bool = False, dedup: bool = False, incremental: bool = False,
+                 output_format: str = 'csv', since: Optional[datetime] = None, until: Optional[datetime] = None,
+                 date_pruning: bool = True, input_format: str = 'lines', rebuild: bool = False):
         self.filter_language = languagefilter
         self.include_retweet = retweets
         self.max_in_memory_size = max_in_mem
         self.text_field_key = text_field_key
         self.id_field_key = id_field_key
         self.date_field_key = date_field_key
+        self.json_backend = json_backend
+        self.targeted_fields = targeted_fields
+        self.prefilter = prefilter
+        self.tar_index = tar_index
+        self.dedup = dedup
+        self.incremental = incremental
+        self.output_format = output_format
+        self.date_window = DateWindow(since, until) if since is not None or until is not None else None
+        self.date_pruning = date_pruning
+        self.input_format = input_format
+        self.rebuild = rebuild
 
 
 def process_files(file_list: List[str], opts: TransformationOptions,
-                  csv_output_path: str) -> (int, int):
+                  csv_output_path: str, workers: int = 1) -> (int, int):
     """Top-level function to combine input set into a single CSV file.
 
+    If the *incremental* option is set, the inputs written to the output are recorded in a manifest (see
+    :class:`ImportManifest`). A new run keeps the output of the previous ones, only processes the inputs that are new
+    or changed since, and removes the rows of the changed ones from the output. Changed inputs are appended at the end
+    of the output, so the row order can differ from a full run. An input that fails is not recorded, its rows are
+    removed from the output and it is processed again by the next run. An existing output without a manifest is only
+    replaced if the *rebuild* option is set, see :class:`ImportManifest`.
+
+    If the *output_format* option is 'parquet' or 'arrow', the tweets are written with typed columns by a
+    :class:`ColumnarWriter` instead, which overwrites the output file. Each input is first written to a CSV shard, as
+    in a parallel run, and converted when the shard is merged.
+
+    If the *since* or *until* options are set, only the tweets created in this window are kept, and unless the
+    *date_pruning* option is unset, input files and archive members whose name or modification time show that they
+    only hold tweets outside of the window are skipped, see :meth:`DateWindow.may_contain_input`.
+
     :param file_list: paths to files to be processed
     :type file_list: list(str)
     :param opts: An instance of the transformation options, used to control filtering and parsing of tweets
     :type opts: TransformationOptions
     :param csv_output_path: Full output path, folder, filename and extension
     :type csv_output_path: str
+    :param workers: Number of worker processes, files are processed in parallel if greater than 1
+    :type workers: int
     :return: A tuple of (successes, failures) that represents the number of lines written to the file
     :rtype: tuple(int, int)
     """
 
-    line_count = 0
-    failure_count = 0
-    for file in file_list:
-        print("Processing file " + str(file))
-        if tarfile.is_tarfile(file):
-            try:
-                lines_written, failures = process_tar_file(file, opts,
-                                                           csv_output_path)
+    if opts.incremental and opts.output_format != 'csv':
+        raise ValueError("Incremental imports can only append to a csv output")
+    if opts.targeted_fields and resolve_json_backend(opts.json_backend) != 'simdjson':
+        print("Warning: targeted fields only avoid decoding whole tweets with the simdjson JSON backend, the "
+              + resolve_json_backend(opts.json_backend) + " backend decodes them fully")
+    if opts.date_window is not None and opts.date_pruning:
+        file_list = [file for file in file_list if _may_contain_window(file, opts)]
+    seen_ids = TweetIdSet() if opts.dedup else None
+    # Recovers the output of an interrupted run
+    manifest = ImportManifest(csv_output_path, opts.rebuild) if opts.incremental else None
+    writer = None
+    if opts.output_format != 'csv':
+        writer = ColumnarWriter(csv_output_path, opts.output_format, opts.max_in_memory_size)
+    try:
+        if (workers > 1 and len(file_list) > 1) or opts.tar_index:
+            line_count, failure_count = process_files_parallel(file_list, opts, csv_output_path, workers, seen_ids,
+                                                               manifest, writer)
+        else:
+            line_count = 0
+            failure_count = 0
+            signatures = repeat(None)
+            if manifest is not None:
+                signatures = [get_input_signature(file) for file in file_list]
+                prepare_incremental_output(manifest, signatures, seen_ids)
+            for file, signature in zip(file_list, signatures):
+                if manifest is not None and manifest.is_up_to_date(signature):
+                    print("Skipping unchanged file " + str(file))
+                    continue
+                if manifest is not None:
+                    # Ids of the file are only added to the run once its rows are committed
+                    file_ids = TweetIdSet(parent=seen_ids) if seen_ids is not None else None
+                    try:
+                        lines_written, failures = process_file(file, opts, csv_output_path, file_ids,
+                                                               raise_errors=True)
+                    except Exception:
+                        # Already reported, the file will be processed again by the next run, drop what it wrote
+                        manifest.rollback()
+                        continue
+                    if file_ids is not None:
+                        file_ids.commit()
+                elif writer is None:
+                    lines_written, failures = process_file(file, opts, csv_output_path, seen_ids)
+                else:
+                    shard_path = get_shard_path(csv_output_path, 0)
+                    _remove_shard(shard_path)
+                    lines_written, failures = process_file(file, opts, shard_path)
+                    lines_written -= merge_shard(shard_path, csv_output_path, seen_ids, writer)
                 line_count += lines_written
                 failure_count += failures
-            except BaseException as e:
-                print("Encountered error with " + str(
-                    file) + " but recovered and will continue")
-                print(e)
-                continue
-        else:
-            try:
-                with open(file, 'r') as f:
-                    lines_written, failures = write_tweets_by_chunk(f,
-                                                                    csv_output_path,
-                                                                    opts)
-                    line_count += lines_written
-                    failure_count += failures
-            except UnicodeDecodeError:
-                print("Could not open file " + str(
-                    file) + " but recovered and will continue")
-                continue
+                if manifest is not None:
+                    manifest.commit(signature, (lines_written, failures))
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if seen_ids is not None:
+        print("removed ", seen_ids.duplicates, " duplicate tweets")
+    return line_count, failure_count
+
+
+def process_files_parallel(file_list: List[str], opts: TransformationOptions,
+                           csv_output_path: str, workers: int, seen_ids: TweetIdSet = None,
+                           manifest: ImportManifest = None, writer: ColumnarWriter = None) -> (int, int):
+    """Process files in a pool of worker processes and merge their output into a single CSV file.
+
+    Each file is written by its worker to its own shard next to the output file. Shards are appended to the output
+    in the order of the file list as soon as they are complete, so the output is identical to a sequential run.
+
+    If the *tar_index* option is set, uncompressed tar archives are indexed (see :class:`TarIndex`) and each of their
+    members is processed as a separate task. Progress is recorded in the index, so that a new run after a failure
+    skips the members that are already done.
+
+    Duplicated tweets are removed while merging the shards, so that the first occurrence is kept as in a sequential
+    run.
+
+    :param file_list: paths to files to be processed
+    :type file_list: list(str)
+    :param opts: Transformation options
+    :type opts: TransformationOptions
+    :param csv_output_path: Full output path, folder, filename and extension
+    :type csv_output_path: str
+    :param workers: Number of worker processes
+    :type workers: int
+    :param seen_ids: Ids of the tweets already written, to drop duplicates, or None to keep them
+    :type seen_ids: TweetIdSet
+    :param manifest: Manifest of the inputs already in the output, for incremental runs, or None
+    :type manifest: ImportManifest
+    :param writer: Writer of the columnar output, or None to append to a CSV file
+    :type writer: ColumnarWriter
+    :return: A tuple of (successes, failures) that represents the number of lines written to the file
+    :rtype: tuple(int, int)
+    """
+
+    line_count = 0
+    failure_count = 0
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as executor:
+        # Submit all tasks first, as (shard path, future or recorded counts, tar index, member index, signature)
+        tasks = []
+        for file_index, file in enumerate(file_list):
+            shard_path = get_shard_path(csv_output_path, file_index)
+            if opts.tar_index and detect_file_format(file) == 'tar':
+                print("Indexing tar file " + str(file))
+                tar_index = TarIndex(file, csv_output_path)
+                for member_index, member in enumerate(tar_index.members):
+                    if opts.date_window is not None and opts.date_pruning and \
+                            not _member_may_contain_window(opts, member['name'], member['mtime']):
+                        continue
+                    member_shard_path = get_shard_path(shard_path, member_index)
+                    signature = get_input_signature(file, member) if manifest is not None else None
+                    if manifest is not None and manifest.is_up_to_date(signature):
+                        continue
+                    progress = tar_index.get_progress(member_index)
+                    if progress is not None and progress['merged'] and manifest is None and writer is None:
+                        # Already in the output, columnar outputs are rewritten by each run
+                        continue
+                    if progress is not None and os.path.exists(member_shard_path):
+                        # Completed by a previous run but not merged yet
+                        tasks.append((member_shard_path, (progress['lines'], progress['failures']), tar_index,
+                                      member_index, signature))
+                        continue
+                    _remove_shard(member_shard_path)
+                    future = executor.submit(process_tar_member, file, member, opts, member_shard_path)
+                    future.add_done_callback(partial(_record_member_completion, tar_index, member_index))
+                    tasks.append((member_shard_path, future, tar_index, member_index, signature))
+            else:
+                signature = get_input_signature(file) if manifest is not None else None
+                if manifest is not None and manifest.is_up_to_date(signature):
+                    print("Skipping unchanged file " + str(file))
+                    continue
+                _remove_shard(shard_path)
+                future = executor.submit(process_file, file, opts, shard_path, raise_errors=manifest is not None)
+                tasks.append((shard_path, future, None, None, signature))
+
+        if manifest is not None:
+            prepare_incremental_output(manifest, [task[4] for task in tasks], seen_ids)
+
+        # Merge shards in order
+        failed_archives = set()
+        for task_index, (shard_path, result, tar_index, member_index, signature) in enumerate(tasks):
+            if isinstance(result, Future):
+                try:
+                    result = result.result()
+                except Exception as e:
+                    print("Encountered error with " + shard_path + " but recovered and will continue")
+                    print(e)
+                    # The member will be processed again by the next run, drop what it wrote
+                    _remove_shard(shard_path)
+                    if tar_index is not None:
+                        failed_archives.add(tar_index.path)
+                    continue
+            lines_written, failures = result
+            lines_written -= merge_shard(shard_path, csv_output_path, seen_ids, writer)
+            line_count += lines_written
+            failure_count += failures
+            if manifest is not None:
+                manifest.commit(signature, (lines_written, failures))
+            if tar_index is not None:
+                tar_index.mark_merged(member_index, result)
+                is_last_member = task_index + 1 == len(tasks) or tasks[task_index + 1][2] is not tar_index
+                if is_last_member and tar_index.path not in failed_archives:
+                    # The archive is done, it will be fully processed again by later runs
+                    tar_index.reset_progress()
 
     return line_count, failure_count
 
 
+def _may_contain_window(file: str, opts: TransformationOptions) -> bool:
+    if opts.date_window.may_contain_input(os.path.basename(str(file)), os.path.getmtime(file)):
+        return True
+    print("Skipping file outside of the date window " + str(file))
+    return False
+
+
+def _member_may_contain_window(opts: TransformationOptions, name: str, mtime: float) -> bool:
+    if opts.date_window.may_contain_input(name, mtime):
+        return True
+    print("Skipping archive member outside of the date window " + str(name))
+    return False
+
+
+def prepare_incremental_output(manifest: ImportManifest, signatures: list, seen_ids: TweetIdSet = None):
+    """Remove the rows of the changed inputs from the output of previous runs, and load the ids it holds.
+
+    :param manifest: Manifest of the inputs already in the output
+    :type manifest: ImportManifest
+    :param signatures: Signatures of the inputs to process, see :func:`get_input_signature`
+    :type signatures: list(tuple)
+    :param seen_ids: Ids of the tweets already written, to drop duplicates, or None to keep them
+    :type seen_ids: TweetIdSet
+    """
+
+    dropped = manifest.drop_changed(signatures)
+    if dropped:
+        print("Removed the rows of ", dropped, " changed inputs from " + manifest.output_path)
+    if seen_ids is not None and os.path.exists(manifest.output_path):
+        # Tweets written by previous runs are duplicates too
+        with open(manifest.output_path, 'r', newline='') as output_file:
+            csv_reader = csv.reader(output_file)
+            while True:
+                rows = list(islice(csv_reader, SHARD_DEDUP_CHUNK_SIZE))
+                if not rows:
+                    break
+                seen_ids.update(row[0] for row in rows)
+
+
+def _remove_shard(shard_path: str):
+    # Shards are appended to, make sure no leftover from a previous run is picked up
+    if os.path.exists(shard_path):
+        os.remove(shard_path)
+
+
+def _record_member_completion(tar_index: TarIndex, member_index: int, future: Future):
+    if future.exception() is None:
+        tar_index.mark_completed(member_index, future.result())
+
+
+def get_shard_path(csv_output_path: str, index: int) -> str:
+    """Get the path of the temporary shard written by a worker for the input with the given index.
+
+    :param csv_output_path: Full output path of the combined CSV file
+    :type csv_output_path: str
+    :param index: Index of the input in the list of processed files
+    :type index: int
+    :return: Path of the shard
+    :rtype: str
+    """
+
+    return "%s.part%d" % (csv_output_path, index)
+
+
+def merge_shard(shard_path: str, csv_output_path: str, seen_ids: TweetIdSet = None,
+                writer: ColumnarWriter = None) -> int:
+    """Append a shard to the combined output file and delete it.
+
+    :param shard_path: Path of the shard
+    :type shard_path: str
+    :param csv_output_path: Full output path of the combined CSV file
+    :type csv_output_path: str
+    :param seen_ids: Ids of the tweets already written, to drop duplicates, or None to keep them
+    :type seen_ids: TweetIdSet
+    :param writer: Writer of the columnar output, or None to append to the CSV file
+    :type writer: ColumnarWriter
+    :return: The number of duplicated tweets that were dropped
+    :rtype: int
+    """
+
+    if not os.path.exists(shard_path):
+        # Nothing was written for this input
+        return 0
+    duplicates = 0
+    if seen_ids is None and writer is None:
+        with open(csv_output_path, 'ab') as output_file, open(shard_path, 'rb') as shard_file:
+            shutil.copyfileobj(shard_file, output_file, SHARD_COPY_BUFFER_SIZE)
+    elif writer is None:
+        with open(csv_output_path, 'a+') as output_file:
+            duplicates = _copy_shard_rows(shard_path, csv.writer(output_file, quoting=csv.QUOTE_MINIMAL), seen_ids)
+    else:
+        duplicates = _copy_shard_rows(shard_path, writer, seen_ids)
+    os.remove(shard_path)
+    return duplicates
+
+
+def _copy_shard_rows(shard_path: str, writer, seen_ids: TweetIdSet = None) -> int:
+    duplicates = 0
+    with open(shard_path, 'r', newline='') as shard_file:
+        csv_reader = csv.reader(shard_file)
+        while True:
+            rows = list(islice(csv_reader, SHARD_DEDUP_CHUNK_SIZE))
+            if not rows:
+                break
+            if seen_ids is not None:
+                is_new = seen_ids.filter_new([row[0] for row in rows])
+                new_rows = [row for row, new in zip(rows, is_new) if new]
+                duplicates += len(rows) - len(new_rows)
+                rows = new_rows
+            writer.writerows(rows)
+    return duplicates
+
+
+def process_file(file: str, opts: TransformationOptions, csv_output_path: str,
+                 seen_ids: TweetIdSet = None, raise_errors: bool = False) -> (int, int):
+    """Process a single input file, either a tar archive or a text file, and append its tweets to the CSV file.
+
+    Errors on a given file are reported and the file is skipped, so that a single bad input does not stop the
+    processing of a whole dataset. The rows written before the error are kept, unless *raise_errors* is set, in which
+    case the error is raised again for the caller to drop them.
+
+    :param file: Path to the file
+    :type file: str
+    :param opts: Transformation options
+    :type opts: TransformationOptions
+    :param csv_output_path: Full output path, folder, filename and extension
+    :type csv_output_path: str
+    :param seen_ids: Ids of the tweets already written, to drop duplicates, or None to keep them
+    :type seen_ids: TweetIdSet
+    :param raise_errors: Raise errors again after reporting them, instead of returning (0, 0)
+    :type raise_errors: bool
+    :return: Pass/fail counts
+    :rtype: tuple(int, int)
+    """
+
+    print("Processing file " + str(file))
+    if detect_file_format(file) != 'plain':
+        try:
+            return process_compressed_file(file, opts, csv_output_path, seen_ids)
+        except BaseException as e:
+            print("Encountered error with " + str(
+                file) + " but recovered and will continue")
+            print(e)
+            if raise_errors:
+                raise
+            return 0, 0
+    else:
+        try:
+            with open(file, 'r') as f:
+                return write_tweets_by_chunk(iter_chunks(f) if opts.input_format == 'json' else f, csv_output_path,
+                                             opts, seen_ids)
+        except UnicodeDecodeError:
+            print("Could not open file " + str(
+                file) + " but recovered and will continue")
+            if raise_errors:
+                raise
+            return 0, 0
+
+
 def write_tweets_by_chunk(lines, csv_output_path: str,
-                          opts: TransformationOptions) -> (int, int):
+                          opts: TransformationOptions, seen_ids: TweetIdSet = None) -> (int, int):
     """Process an arbitrary number of lines and save them to the CSV outfile
 
+    If the *input_format* option is 'json', the lines are first split into JSON objects, which can span lines or be
+    elements of an array, see :func:`iter_json_documents`, and can be given by chunks of any size instead, see
+    :func:`iter_chunks`. Otherwise, each line is a tweet.
+
     :param lines: Lines of tweets to process and write to file
     :type lines: list(str) or buffer
     :param csv_output_path: Full output path of CSV file, including filename and extension
     :type csv_output_path: str
     :param opts: Transformation options
     :type opts: TransformationOptions
+    :param seen_ids: Ids of the tweets already written, to drop duplicates, or None to keep them
+    :type seen_ids: TweetIdSet
     :return: Tuple of write pass/failures
     :rtype: tuple(int, int)
     """
 
     line_count = 0
     parse_failure_count = 0
+    if opts.input_format == 'json':
+        lines = iter_json_documents(lines)
     # Supports
     with open(csv_output_path, 'a+') as csv_file:
         while True:
@@ -92,7 +455,7 @@ def write_tweets_by_chunk(lines, csv_output_path: str,
             if not chunk or chunk == []:
                 # End of iterable
                 break
-            filtered_chunk, failure_count = filter_lighten_chunk(chunk, opts)
+            filtered_chunk, failure_count = filter_lighten_chunk(chunk, opts, seen_ids)
             parse_failure_count += failure_count
             line_count += len(filtered_chunk)
             csv.writer(csv_file, quoting=csv.QUOTE_MINIMAL).writerows(
@@ -100,7 +463,26 @@ def write_tweets_by_chunk(lines, csv_output_path: str,
     return line_count, parse_failure_count
 
 
-def filter_lighten_chunk(chunk, opts: TransformationOptions) -> (
+def read_input_in_background(stream, opts: TransformationOptions):
+    """Read a decompressed input on a background thread, see :func:`read_lines_in_background`.
+
+    With the 'json' *input_format* option, the input is read by fixed-size chunks rather than lines, so that a JSON
+    array written on a single line is not held in memory as a whole.
+
+    :param stream: A binary stream
+    :type stream: file object
+    :param opts: Transformation options
+    :type opts: TransformationOptions
+    :return: Iterator over the lines or chunks of the stream
+    :rtype: iterator(bytes)
+    """
+
+    if opts.input_format == 'json':
+        return read_lines_in_background(iter_chunks(stream), batch_size=1)
+    return read_lines_in_background(stream)
+
+
+def filter_lighten_chunk(chunk, opts: TransformationOptions, seen_ids: TweetIdSet = None) -> (
         List[dict], int):
     """Filter and lighten a given set of lines, keeping only important keys
 
@@ -108,15 +490,22 @@ def filter_lighten_chunk(chunk, opts: TransformationOptions) -> (
     :type chunk: list(str) or buffer of str
     :param opts: Transformation options
     :type opts: TransformationOptions
+    :param seen_ids: Ids of the tweets already kept, to drop duplicates, or None to keep them
+    :type seen_ids: TweetIdSet
     :return: List of filtered tweets and parse failure count
     :rtype: list(dict), int
     """
 
     output_buffer = []
     parse_failure_count = 0
+    parser = get_tweet_parser(opts.json_backend, required_tweet_fields(opts) if opts.targeted_fields else None)
     for line in chunk:
+        if opts.prefilter and not prefilter_line(line, opts.filter_language, opts.include_retweet,
+                                                 opts.text_field_key, opts.date_window, opts.date_field_key):
+            # Clearly filtered out, skip parsing
+            continue
         try:
-            tweet = parse_tweet(line)
+            tweet = parser(line)
         except json.JSONDecodeError as e:
             parse_failure_count += 1
             continue
@@ -139,13 +528,24 @@ def filter_lighten_chunk(chunk, opts: TransformationOptions) -> (
                     # Issue parsing JSON tweet, raise this as a failure and continue
                     parse_failure_count += 1
                     continue
+                if opts.date_window is not None:
+                    in_window = opts.date_window.contains_date(light_tweet[2])
+                    if in_window is None:
+                        # The date cannot be checked, raise this as a failure
+                        parse_failure_count += 1
+                        continue
+                    if not in_window:
+                        continue
                 output_buffer.append(light_tweet)
+    if seen_ids is not None:
+        is_new = seen_ids.filter_new([light_tweet[0] for light_tweet in output_buffer])
+        output_buffer = [light_tweet for light_tweet, new in zip(output_buffer, is_new) if new]
     return output_buffer, parse_failure_count
 
 
 def process_tar_file(file: str, opts: TransformationOptions,
-                     csv_output_path: str) -> (int, int):
-    """Process any uncompressed nested files contained within a single tar file.
+                     csv_output_path: str, seen_ids: TweetIdSet = None) -> (int, int):
+    """Process all files contained within a single tar file.
 
     :param file: Path to tar file
     :type file: str
@@ -153,28 +553,39 @@ def process_tar_file(file: str, opts: TransformationOptions,
     :type opts: TransformationOptions
     :param csv_output_path: Output path for the combined CSV file
     :type csv_output_path: str
+    :param seen_ids: Ids of the tweets already written, to drop duplicates, or None to keep them
+    :type seen_ids: TweetIdSet
     :return: Pass/fail counts
     :rtype: tuple(int, int)
 
-    .. warning:: This cannot handle nested compression, ie a tar inside a tar.
+    .. note:: Compressed members and nested archives are decompressed on the fly, see :func:`process_compressed_file`.
     """
 
+    return process_compressed_file(file, opts, csv_output_path, seen_ids)
+
+
+def process_tar_member(file: str, member: dict, opts: TransformationOptions,
+                       csv_output_path: str) -> (int, int):
+    """Process a single member of an uncompressed tar archive, from its index entry.
+
+    :param file: Path to tar file
+    :type file: str
+    :param member: Index entry of the member, see :func:`build_tar_index`
+    :type member: dict
+    :param opts: Transformation options
+    :type opts: TransformationOptions
+    :param csv_output_path: Output path for the CSV file
+    :type csv_output_path: str
+    :return: Pass/fail counts
+    :rtype: tuple(int, int)
+    """
+
+    print("processing tar member: ", member['name'])
     line_count = 0
     failure_count = 0
-    with tarfile.open(file, 'r|*') as tf:
-        while True:
-            file = tf.next()
-            if not file:
-                # None, end of members
-                break
-            if not file.isfile():
-                # The member is not a file(could be a malformed file, another tar
-                # a folder etc.
-                print("skipping tar member: ", file.name)
-                continue
-            print("processing tar member: ", file.name)
-            buffer = tf.extractfile(file)
-            lines_written, errors = write_tweets_by_chunk(buffer,
+    with open_tar_member(file, member) as member_stream:
+        for _, stream in iter_decompressed_streams(member_stream, str(file) + "/" + member['name']):
+            lines_written, errors = write_tweets_by_chunk(read_input_in_background(stream, opts),
                                                           csv_output_path,
                                                           opts)
             line_count += lines_written
@@ -182,6 +593,43 @@ def process_tar_file(file: str, opts: TransformationOptions,
     return line_count, failure_count
 
 
+def process_compressed_file(file: str, opts: TransformationOptions,
+                            csv_output_path: str, seen_ids: TweetIdSet = None) -> (int, int):
+    """Process a compressed file or an archive, recursing into nested archives and compressed members.
+
+    The format of the file and of each member is detected from its magic bytes. Supported formats are gzip, bz2, xz,
+    zstd (with the optional *zstandard* package), zip and tar. Content is decompressed in streaming mode on a
+    background thread, so that nothing is written to disk and decompression overlaps with parsing.
+
+    :param file: Path to the file
+    :type file: str
+    :param opts: Transformation options
+    :type opts: TransformationOptions
+    :param csv_output_path: Output path for the combined CSV file
+    :type csv_output_path: str
+    :param seen_ids: Ids of the tweets already written, to drop duplicates, or None to keep them
+    :type seen_ids: TweetIdSet
+    :return: Pass/fail counts
+    :rtype: tuple(int, int)
+    """
+
+    line_count = 0
+    failure_count = 0
+    member_filter = None
+    if opts.date_window is not None and opts.date_pruning:
+        member_filter = partial(_member_may_contain_window, opts)
+    for name, stream in iter_file_streams(file, member_filter):
+        if name != str(file):
+            print("processing archive member: ", name)
+        lines_written, errors = write_tweets_by_chunk(read_input_in_background(stream, opts),
+                                                      csv_output_path,
+                                                      opts,
+                                                      seen_ids)
+        line_count += lines_written
+        failure_count += errors
+    return line_count, failure_count
+
+
 def matches_language_filter(tweet: dict, opts: TransformationOptions) -> bool:
     """Check whether a tweet is in the desired language. If JSON key does not
     exist it assumes that the text matches the language filter(returns True)
@@ -231,6 +679,21 @@ def is_retweet(tweet: dict, text_field_key: str) -> bool:
     return False
 
 
+def required_tweet_fields(opts: TransformationOptions) -> Tuple[str, ...]:
+    """List the top-level keys of a tweet read by the filters and by :func:`lighten_tweet`.
+
+    :param opts: Transformation options
+    :type opts: TransformationOptions
+    :return: The keys needed to filter and lighten a tweet
+    :rtype: tuple(str)
+    """
+
+    return ("lang", "retweeted", "truncated", "extended_tweet",
+            opts.text_field_key if opts.text_field_key is not None else "text",
+            opts.id_field_key if opts.id_field_key is not None else "id",
+            opts.date_field_key if opts.date_field_key is not None else "created_at")
+
+
 def parse_tweet(tweet: str) -> dict:
     """Parse the passed JSON format tweet from str to dictionary.
 
@@ -1,9 +1,14 @@
 import argparse
-import csv
+import os
 
-from cranetoolbox.fileHandler import scan_folder_csv
+from cranetoolbox.fileHandler import COMPRESSION_SUFFIXES, scan_folder_csv
+from cranetoolbox.preprocess.partition import PARTITION_BUCKETS
+from cranetoolbox.preprocess.persistentCache import PersistentCache
 from cranetoolbox.preprocess.preprocess import *
 
+# Names of the flags that can be combined in a variant, in the order of the options of Preprocessor
+VARIANT_FLAGS = ('url', 'mention', 'hashtag', 'punct', 'num')
+
 
 def main():
     # Create argument parser
@@ -39,8 +44,60 @@ def main():
                              "their text version",
                         action='store_false')
 
+    parser.add_argument("--cache-file",
+                        help="Path to a file caching hashtag segmentations and number conversions across runs, "
+                             "created if needed",
+                        default=None)
+    parser.add_argument("--text-cache-size",
+                        help="Number of clean texts kept in memory by raw text, so that duplicate tweets are only "
+                             "preprocessed once, 0 to disable",
+                        type=int, default=0)
+    parser.add_argument("--incremental",
+                        help="Use this flag to skip the input files whose output is up to date, and resume the "
+                             "preprocessing of those partly written by an interrupted run",
+                        action='store_true')
+    parser.add_argument("--variant",
+                        help="Comma-separated flags among %s, applied on top of the other options, or 'default' for "
+                             "none. Repeat to preprocess several variants of the dataset in one pass, each saved in "
+                             "a sub-folder of the output folder named after its flags." % ", ".join(VARIANT_FLAGS),
+                        action='append', default=None)
+    parser.add_argument("--partition-by",
+                        help="Write the output of each input file partitioned by the day, month or year of the "
+                             "tweets, in a sub-folder per partition, with metadata used by the analysis to skip "
+                             "partitions",
+                        choices=list(PARTITION_BUCKETS), default=None)
+    parser.add_argument("--no-original-text",
+                        help="Use this flag to leave the original_text column empty in the output, to save space",
+                        dest='keep_original_text', action='store_false')
+    parser.add_argument("--compression",
+                        help="Compress the output files with gzip (.csv.gz) or zstd (.csv.zst) while writing them. "
+                             "zstd requires the zstandard package. Compressed outputs are not resumed by "
+                             "--incremental, only skipped once complete.",
+                        choices=list(COMPRESSION_SUFFIXES), default=None)
+    parser.add_argument("--workers",
+                        help="Number of processes preprocessing batches of rows in parallel, 1 to preprocess in the "
+                             "main process",
+                        type=int, default=1)
+
     # Parse arguments
     args = parser.parse_args()
+    options = (args.remove_url, args.remove_mentions, args.segment_hashtags, args.remove_punctuation,
+               args.remove_numbers)
+    variants = []
+    for variant in args.variant or []:
+        flags = [flag.strip() for flag in variant.split(',') if flag.strip() and flag.strip() != 'default']
+        unknown = [flag for flag in flags if flag not in VARIANT_FLAGS]
+        if unknown:
+            parser.error("unknown flags in --variant %s: %s" % (variant, ", ".join(unknown)))
+        # Each flag switches its option to False, as on the command line
+        variant_options = tuple(option and VARIANT_FLAGS[index] not in flags for index, option in enumerate(options))
+        variants.append(("-".join(flags) or "default", variant_options))
+    if variants and args.workers > 1:
+        parser.error("--variant cannot be combined with --workers")
+    if variants and args.text_cache_size > 0:
+        parser.error("--text-cache-size cannot be combined with --variant")
+    if args.partition_by is not None and (variants or args.workers > 1 or args.incremental):
+        parser.error("--partition-by cannot be combined with --variant, --workers or --incremental")
 
     # Scan supplied directory for files
     input_paths = scan_folder_csv(args.input_path)
@@ -52,18 +109,37 @@ def main():
 
     failed_file_reading = 0
     date_dataframes = []
-    # For each input file
-    for file_path in input_paths:
-        with open(file_path, 'r') as csv_input:
+    if args.workers > 1:
+        date_dataframes, failed_file_reading = preprocess_csv_files_parallel(
+            input_paths, args.output_path, args.remove_url, args.remove_mentions, args.segment_hashtags,
+            args.remove_punctuation, args.remove_numbers, args.workers, args.cache_file, args.text_cache_size,
+            args.incremental, args.keep_original_text, args.compression)
+    else:
+        cache = PersistentCache(args.cache_file) if args.cache_file is not None else None
+        # Shared by all files, so that duplicates are found across files
+        preprocessor = Preprocessor(*options, cache, args.text_cache_size)
+        # For each input file
+        for file_path in input_paths:
             print(f"Processing file {str(file_path)}")
-            csv_reader = csv.reader(csv_input)
-            date_dataframe = preprocess_csv_file(csv_reader, file_path, args.output_path, args.remove_url,
-                                                 args.remove_mentions, args.segment_hashtags, args.remove_punctuation,
-                                                 args.remove_numbers)
+            # Files are read by blocks of rows, see read_row_blocks
+            if variants:
+                date_dataframe = preprocess_csv_file_variants(
+                    None, file_path, [os.path.join(args.output_path, name) for name, _ in variants],
+                    [variant_options for _, variant_options in variants], cache, args.incremental,
+                    args.keep_original_text, args.compression)
+            else:
+                date_dataframe = preprocess_csv_file(None, file_path, args.output_path, *options, cache,
+                                                     preprocessor, args.incremental, args.partition_by,
+                                                     args.keep_original_text, args.compression)
             if date_dataframe is not None:
                 date_dataframes.append(date_dataframe)
             else:
                 failed_file_reading += 1
+        if cache is not None:
+            cache.close()
+            print(f"Cache hits: {cache.hits}, misses: {cache.misses}")
+        if args.text_cache_size > 0:
+            print(f"Text cache hits: {preprocessor.text_cache_hits}, misses: {preprocessor.text_cache_misses}")
 
     if len(date_dataframes) > 0:
         final_dataframe = merge_counts_dataframe(date_dataframes)
@@ -0,0 +1,139 @@
+# Preprocessed output partitioned by the day of the tweets, with metadata for each partition
+
+import csv
+import json
+import os
+from collections import OrderedDict
+from datetime import date
+from typing import Dict, List, Optional
+
+from cranetoolbox.dateHandler import get_utc_timestamps
+from cranetoolbox.fileHandler import get_metadata_path, get_output_file_name, open_csv_file
+
+# Formats of the name of the partition of a day, for each size of partition
+PARTITION_BUCKETS = {'day': '%Y-%m-%d', 'month': '%Y-%m', 'year': '%Y'}
+# Partitions kept open at once, the least recently written one is closed and reopened in append mode when needed
+MAX_OPEN_PARTITIONS = 64
+OPTION_NAMES = ('replace_or_remove_url', 'replace_or_remove_mentions', 'remove_hashtag_or_segment',
+                'replace_or_remove_punctuation', 'replace_or_remove_numbers')
+
+
+class PartitionedWriter:
+    """
+    Writer of the preprocessed rows of an input file, partitioned by the day of their timestamp
+
+    Rows are written to <output>/<bucket>/<name>_preprocessed.csv, where the bucket is the day, month or year of the
+    timestamp, as written in it. Each file has its metadata in <file>.meta.json: number of rows, first and last
+    timestamps in UTC, number of rows per day and preprocessing options. Files are written as <file>.partial and only
+    renamed, with their metadata, when the writer is closed. At most *max_open* files are open at once, so that inputs
+    spanning years of days can be partitioned by day.
+
+    :param output_path: The path to the output folder.
+    :type output_path: str
+    :param file_path: The path to the input file.
+    :type file_path: str
+    :param bucket: Size of the partitions, a key of :data:`PARTITION_BUCKETS`
+    :type bucket: str
+    :param options: The preprocessing options, see :attr:`Preprocessor.options`
+    :type options: tuple
+    :param compression: Compression of the partitions, see :func:`open_csv_file`
+    :type compression: str
+    :param max_open: Maximum number of partition files open at once
+    :type max_open: int
+    """
+
+    def __init__(self, output_path: str, file_path: str, bucket: str = 'day', options: Optional[tuple] = None,
+                 compression: Optional[str] = None, max_open: int = MAX_OPEN_PARTITIONS):
+        if bucket not in PARTITION_BUCKETS:
+            raise ValueError("Unknown partition size: " + str(bucket))
+        self.output_path = str(output_path)
+        self.file_name = get_output_file_name(file_path, compression)
+        self.compression = compression
+        self.input_path = os.path.abspath(str(file_path))
+        self.bucket_format = PARTITION_BUCKETS[bucket]
+        self.options = dict(zip(OPTION_NAMES, options)) if options is not None else None
+        self.max_open = max_open
+        self._partitions = {}
+        # Writers of the open partitions, from the least to the most recently written
+        self._open = OrderedDict()
+
+    def get_partition_path(self, partition: str) -> str:
+        return os.path.join(self.output_path, partition, self.file_name)
+
+    def writerows(self, data: List[list], days: List[date]):
+        """Write preprocessed rows to their partitions.
+
+        :param data: Rows in format [id, original_text, clean_text, timestamp]
+        :type data: list(list())
+        :param days: The day of each row, see :func:`cranetoolbox.dateHandler.get_days`
+        :type days: list(datetime.date)
+        """
+
+        rows_by_partition: Dict[str, list] = {}
+        for row, day in zip(data, days):
+            rows_by_partition.setdefault(day.strftime(self.bucket_format), []).append((row, day))
+        for partition, rows in rows_by_partition.items():
+            state = self._partitions.get(partition)
+            if state is None:
+                state = {'rows': 0, 'min': None, 'max': None, 'counts': {}}
+                self._partitions[partition] = state
+            self._get_writer(partition, state['rows'] > 0).writerows([row for row, _ in rows])
+            state['rows'] += len(rows)
+            counts = state['counts']
+            for _, day in rows:
+                day_key = day.isoformat()
+                counts[day_key] = counts.get(day_key, 0) + 1
+            timestamps = get_utc_timestamps([row[3] for row, _ in rows]).dropna()
+            if len(timestamps) > 0:
+                first, last = timestamps.min(), timestamps.max()
+                state['min'] = first if state['min'] is None else min(state['min'], first)
+                state['max'] = last if state['max'] is None else max(state['max'], last)
+
+    def _get_writer(self, partition: str, append: bool):
+        if partition in self._open:
+            self._open.move_to_end(partition)
+            return self._open[partition][1]
+        if len(self._open) >= self.max_open:
+            _, (output_file, _) = self._open.popitem(last=False)
+            output_file.close()
+        partition_path = self.get_partition_path(partition)
+        os.makedirs(os.path.dirname(partition_path), exist_ok=True)
+        output_file = open_csv_file(partition_path + ".partial", 'a' if append else 'w', self.compression)
+        writer = csv.writer(output_file, quoting=csv.QUOTE_MINIMAL)
+        self._open[partition] = (output_file, writer)
+        return writer
+
+    def _close_files(self):
+        for output_file, _ in self._open.values():
+            output_file.close()
+        self._open = OrderedDict()
+
+    def close(self):
+        """Move the partitions to their final paths and write their metadata."""
+
+        self._close_files()
+        for partition, state in self._partitions.items():
+            partition_path = self.get_partition_path(partition)
+            metadata_path = get_metadata_path(partition_path)
+            # Metadata of a previous run must not describe the new partition
+            if os.path.exists(metadata_path):
+                os.remove(metadata_path)
+            os.replace(partition_path + ".partial", partition_path)
+            metadata = {'input': self.input_path, 'partition': partition, 'rows': state['rows'],
+                        'min_timestamp': state['min'].isoformat() if state['min'] is not None else None,
+                        'max_timestamp': state['max'].isoformat() if state['max'] is not None else None,
+                        'counts': dict(sorted(state['counts'].items())), 'options': self.options}
+            with open(metadata_path + ".tmp", 'w') as metadata_file:
+                json.dump(metadata, metadata_file, indent=1)
+            os.replace(metadata_path + ".tmp", metadata_path)
+        self._partitions = {}
+
+    def abort(self):
+        """Remove the partitions written so far, e.g. after an error."""
+
+        self._close_files()
+        for partition in self._partitions:
+            partial_path = self.get_partition_path(partition) + ".partial"
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+        self._partitions = {}
@@ -0,0 +1,123 @@
+# On-disk cache of the results of slow text transforms, shared across runs and processes
+
+import sqlite3
+from functools import lru_cache
+from typing import Callable, Optional, Tuple
+
+from cranetoolbox.preprocess.preprocessTools import CACHE_SIZE
+
+# Number of new results kept before they are written to disk
+FLUSH_SIZE = 1000
+# Size of the memory mapping of the cache file
+MMAP_SIZE = 256 * 1024 * 1024
+
+
+class PersistentCache:
+    """
+    A key/value cache stored in an SQLite file
+
+    The file is memory-mapped for reading and opened in write-ahead logging mode, so that several processes can use
+    it at the same time. New entries are written in batches. Entries are never invalidated, the file must be deleted
+    when the wordsegment or num2words packages are upgraded.
+
+    :param path: Path to the cache file, created if needed
+    :type path: str
+    :param flush_size: Number of new entries kept in memory before they are written
+    :type flush_size: int
+    """
+
+    def __init__(self, path: str, flush_size: int = FLUSH_SIZE):
+        self.path = str(path)
+        self.flush_size = flush_size
+        self.hits = 0
+        self.misses = 0
+        self._pending = {}
+        self._connection = sqlite3.connect(self.path, timeout=60)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA mmap_size=%d" % MMAP_SIZE)
+        self._connection.execute("CREATE TABLE IF NOT EXISTS cache (namespace TEXT, key TEXT, value TEXT, "
+                                 "PRIMARY KEY (namespace, key)) WITHOUT ROWID")
+        self._connection.commit()
+
+    def get(self, namespace: str, key: str) -> Optional[str]:
+        """Get a cached value.
+
+        :param namespace: Name of the transform
+        :type namespace: str
+        :param key: Input of the transform
+        :type key: str
+        :return: The cached value, or None
+        :rtype: str or None
+        """
+
+        value = self._pending.get((namespace, key))
+        if value is None:
+            row = self._connection.execute("SELECT value FROM cache WHERE namespace = ? AND key = ?",
+                                           (namespace, key)).fetchone()
+            value = row[0] if row is not None else None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, namespace: str, key: str, value: str):
+        """Add a value to the cache, it is written to disk with the next batch.
+
+        :param namespace: Name of the transform
+        :type namespace: str
+        :param key: Input of the transform
+        :type key: str
+        :param value: Output of the transform
+        :type value: str
+        """
+
+        self._pending[(namespace, key)] = value
+        if len(self._pending) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        if not self._pending:
+            return
+        # Entries computed by other processes in the meantime are identical, keep them
+        self._connection.executemany("INSERT OR IGNORE INTO cache (namespace, key, value) VALUES (?, ?, ?)",
+                                     [(namespace, key, value) for (namespace, key), value in self._pending.items()])
+        self._connection.commit()
+        self._pending = {}
+
+    def close(self):
+        self.flush()
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def memoize(self, namespace: str, function: Callable[..., str], maxsize: int = CACHE_SIZE) -> Callable[..., str]:
+        """Wrap a transform with an in-memory LRU cache backed by this cache.
+
+        :param namespace: Name of the transform
+        :type namespace: str
+        :param function: The transform, whose arguments are converted to str to build the key
+        :type function: function
+        :param maxsize: Number of results kept in memory
+        :type maxsize: int
+        :return: The cached transform
+        :rtype: function
+        """
+
+        def cached(*args):
+            key = _make_key(args)
+            value = self.get(namespace, key)
+            if value is None:
+                value = function(*args)
+                self.put(namespace, key, value)
+            return value
+
+        return lru_cache(maxsize=maxsize)(cached)
+
+
+def _make_key(args: Tuple) -> str:
+    return args[0] if len(args) == 1 and isinstance(args[0], str) else repr(args)
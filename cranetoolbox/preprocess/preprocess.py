@@ -1,16 +1,343 @@
 # Main preprocessing module
 
 import csv
+import multiprocessing.util
 import os
+import re
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from itertools import islice
 from os import makedirs
-from os.path import splitext, basename, exists
-from typing import List, Optional
+from os.path import exists
+from typing import Iterable, List, Optional, Union
 
 import pandas as pd
 
+from cranetoolbox.dateHandler import get_days
+from cranetoolbox.fileHandler import get_output_file_name, read_csv_blocks
 from cranetoolbox.preprocess import preprocessTools
+from cranetoolbox.preprocess.partition import PartitionedWriter
+from cranetoolbox.preprocess.persistentCache import PersistentCache
+from cranetoolbox.preprocess.preprocessState import PreprocessState, get_options_hash
 
 MAX_BUFFER_SIZE = 1000
+# Number of row batches sent to each worker ahead of the one being written
+PARALLEL_BATCHES_PER_WORKER = 4
+# Preprocessed text is pure ASCII, character-level steps only need tables over the ASCII range
+_ASCII_CHARACTERS = [chr(code) for code in range(128)]
+_REMOVE_PUNCTUATION_TABLE = str.maketrans(
+    '', '', ''.join(c for c in _ASCII_CHARACTERS if preprocessTools.PUNCTUATION_PATTERN.fullmatch(c)))
+_REMOVE_NUMBERS_TABLE = str.maketrans('', '', ''.join(c for c in _ASCII_CHARACTERS if c.isdigit()))
+# Repetitions of '!', '?' and '.' are replaced in a single pass, the tags never join two repetitions
+_MULTI_PUNCTUATION_PATTERN = re.compile(r"!{2,}|\?{2,}|\.{2,}")
+_MULTI_PUNCTUATION_TAGS = {'!': ' multiExclamation ', '?': ' multiQuestion ', '.': ' multiStop '}
+# URLs only hold these characters and a dot, they are searched within the runs of such characters holding a dot
+_URL_RUN_PATTERN = re.compile(r"[\w\-\@?^=%&amp;/~\+#:]*\.[\w\-\@?^=%&amp;/~\+#:.]*")
+# Contractions around apostrophes, as (literal part, pattern or None, replacement). A pattern can only match when its
+# literal part, e.g. "'ll" for r"(\w+)\'ll", is in the text. Fully literal ones use str.replace.
+_APOSTROPHE_CONTRACTIONS = [(pattern.pattern.replace('\\', '').replace('(w+)', ''),
+                             pattern if pattern.groups else None, repl)
+                            for pattern, repl in preprocessTools.CONTRACTION_PATTERNS if "'" in pattern.pattern]
+_LITERAL_CONTRACTIONS = [(pattern.pattern, repl) for pattern, repl in preprocessTools.CONTRACTION_PATTERNS
+                         if "'" not in pattern.pattern]
+# Whitespace control character joining the texts of a batch, no step alters it and no pattern matches across it
+_BATCH_SEPARATOR = '\x1e'
+# Any character outside of the ASCII range, str.isascii is not available before Python 3.7
+_NON_ASCII_PATTERN = re.compile(r'[^\x00-\x7f]')
+
+
+class Preprocessor:
+    """
+    Text preprocessing pipeline, built once for a set of options
+
+    :meth:`process` returns the same text as :func:`preprocessing_text` with the same options. Patterns are compiled
+    once, steps are skipped when the characters they act on are absent, literal replacements use :meth:`str.replace`
+    and character-level steps use :meth:`str.translate` or ASCII encoding. Hashtag segmentation and number conversion
+    are memoized, in memory and optionally in a :class:`PersistentCache` shared across runs and processes.
+
+    :param replace_or_remove_url: True to replace URLs, False to remove them.
+    :type replace_or_remove_url: bool
+    :param replace_or_remove_mentions: True to replace mentions, False to remove them.
+    :type replace_or_remove_mentions: bool
+    :param remove_hashtag_or_segment: True to remove '#' in front of hashtags, False to segment hashtags.
+    :type remove_hashtag_or_segment: bool
+    :param replace_or_remove_punctuation: True to replace multiple punctuation, False to remove all punctuation.
+    :type replace_or_remove_punctuation: bool
+    :param replace_or_remove_numbers: True to replace numbers by their text version, False to remove them.
+    :type replace_or_remove_numbers: bool
+    :param cache: On-disk cache of hashtag segmentations and number conversions, or None
+    :type cache: PersistentCache
+    :param text_cache_size: Number of clean texts kept in an LRU cache by raw text, so that duplicate tweets, e.g.
+        retweets, are only preprocessed once. 0 to disable it. Hits and misses are counted in :attr:`text_cache_hits`
+        and :attr:`text_cache_misses`.
+    :type text_cache_size: int
+    """
+
+    def __init__(self, replace_or_remove_url: bool, replace_or_remove_mentions: bool, remove_hashtag_or_segment: bool,
+                 replace_or_remove_punctuation: bool, replace_or_remove_numbers: bool,
+                 cache: Optional[PersistentCache] = None, text_cache_size: int = 0):
+        self.options = (replace_or_remove_url, replace_or_remove_mentions, remove_hashtag_or_segment,
+                        replace_or_remove_punctuation, replace_or_remove_numbers)
+        self.text_cache_size = text_cache_size
+        self.text_cache_hits = 0
+        self.text_cache_misses = 0
+        self._text_cache = OrderedDict() if text_cache_size > 0 else None
+        self.replace_or_remove_url = replace_or_remove_url
+        self.replace_or_remove_mentions = replace_or_remove_mentions
+        self.remove_hashtag_or_segment = remove_hashtag_or_segment
+        self.replace_or_remove_punctuation = replace_or_remove_punctuation
+        self.replace_or_remove_numbers = replace_or_remove_numbers
+        url_replacement = 'url' if replace_or_remove_url else ''
+        self._url_replacement = lambda x: preprocessTools.URL_PATTERN.sub(url_replacement, x.group())
+        self._at_user_replacement = 'atUser' if replace_or_remove_mentions else ''
+        segment_hashtag = preprocessTools.segment_hashtag
+        number_to_words = preprocessTools.number_to_words
+        if cache is not None:
+            segment_hashtag = cache.memoize('hashtag', segment_hashtag.__wrapped__)
+            number_to_words = cache.memoize('number', number_to_words.__wrapped__)
+        if remove_hashtag_or_segment:
+            self._hashtag_replacement = r'\1'
+        else:
+            self._hashtag_replacement = lambda x: segment_hashtag(x.group())
+        self._number_replacement = lambda x: number_to_words(int(x.group(1)), x.group(2) is not None)
+
+    def process(self, text: str) -> str:
+        """Preprocess the text content of a tweet for analysis.
+
+        :param text: Text content of a tweet.
+        :type text: str
+        :return: The clean version of the text.
+        :rtype: str
+        """
+
+        text_cache = self._text_cache
+        if text_cache is None:
+            return self._process(text)
+        clean_text = text_cache.get(text)
+        if clean_text is not None:
+            self.text_cache_hits += 1
+            text_cache.move_to_end(text)
+            return clean_text
+        self.text_cache_misses += 1
+        clean_text = self._process(text)
+        self._add_to_text_cache(text, clean_text)
+        return clean_text
+
+    def _process(self, text: str) -> str:
+        text = self._replace_hashtags(self._replace_mentions(self._replace_urls(self._clean_characters(text.lower()))))
+        return self._replace_numbers(self._replace_punctuation(self._replace_contractions(text)))
+
+    def process_batch(self, texts: Iterable[str]) -> List[str]:
+        """Preprocess the text content of a batch of tweets.
+
+        The texts are joined with a separator that no step alters or matches across, so that most steps run once over
+        the whole batch and are skipped when the characters they act on are absent from all texts. Contractions around
+        apostrophes are only searched in the texts holding one. Batches holding the separator are processed one text
+        at a time.
+
+        :param texts: Text content of the tweets.
+        :type texts: iterable(str)
+        :return: The clean version of each text, in the same order.
+        :rtype: list(str)
+        """
+
+        texts = list(texts)
+        text_cache = self._text_cache
+        if text_cache is None:
+            return self._process_batch(texts)
+        clean_texts = [text_cache.get(text) for text in texts]
+        # Texts to preprocess, each once
+        missing = {}
+        for text, clean_text in zip(texts, clean_texts):
+            if clean_text is None:
+                missing[text] = None
+            else:
+                text_cache.move_to_end(text)
+        self.text_cache_hits += len(texts) - len(missing)
+        self.text_cache_misses += len(missing)
+        if missing:
+            for text, clean_text in zip(missing, self._process_batch(list(missing))):
+                missing[text] = clean_text
+                self._add_to_text_cache(text, clean_text)
+            clean_texts = [missing[text] if clean_text is None else clean_text
+                           for text, clean_text in zip(texts, clean_texts)]
+        return clean_texts
+
+    def _process_batch(self, texts: List[str]) -> List[str]:
+        text = _BATCH_SEPARATOR.join(texts).lower()
+        if len(texts) < 2 or text.count(_BATCH_SEPARATOR) != len(texts) - 1:
+            return [self._process(text) for text in texts]
+        text = self._replace_hashtags(self._replace_mentions(self._replace_urls(self._clean_characters(text))))
+        text = self._replace_numbers(self._replace_punctuation(self._replace_contractions(text)))
+        return text.split(_BATCH_SEPARATOR)
+
+    def _add_to_text_cache(self, text: str, clean_text: str):
+        self._text_cache[text] = clean_text
+        if len(self._text_cache) > self.text_cache_size:
+            # Drop the least recently used text
+            self._text_cache.popitem(last=False)
+
+    # Steps of the pipeline, in order, on lowercase text. Each only depends on the option of the same name, if any.
+
+    @staticmethod
+    def _clean_characters(text: str) -> str:
+        if '\\u' in text:
+            text = preprocessTools.ESCAPED_UNICODE_PATTERN.sub('', text)
+        if _NON_ASCII_PATTERN.search(text):
+            text = text.encode('ascii', 'ignore').decode('ascii')
+        return text
+
+    def _replace_urls(self, text: str) -> str:
+        if '.' in text:
+            text = _URL_RUN_PATTERN.sub(self._url_replacement, text)
+        return text
+
+    def _replace_mentions(self, text: str) -> str:
+        if '@' in text:
+            text = preprocessTools.AT_USER_PATTERN.sub(self._at_user_replacement, text)
+        return text
+
+    def _replace_hashtags(self, text: str) -> str:
+        if '#' in text:
+            text = preprocessTools.HASHTAG_PATTERN.sub(self._hashtag_replacement, text)
+        return text
+
+    @staticmethod
+    def _replace_contractions(text: str) -> str:
+        if "'" in text:
+            if _BATCH_SEPARATOR in text:
+                # Patterns around apostrophes are slow on long texts, only search the texts of a batch holding one
+                text = _BATCH_SEPARATOR.join([Preprocessor._replace_apostrophe_contractions(part) if "'" in part
+                                              else part for part in text.split(_BATCH_SEPARATOR)])
+            else:
+                text = Preprocessor._replace_apostrophe_contractions(text)
+        for literal, repl in _LITERAL_CONTRACTIONS:
+            if literal in text:
+                text = text.replace(literal, repl)
+        return text
+
+    @staticmethod
+    def _replace_apostrophe_contractions(text: str) -> str:
+        for literal, pattern, repl in _APOSTROPHE_CONTRACTIONS:
+            if literal in text:
+                text = text.replace(literal, repl) if pattern is None else pattern.sub(repl, text)
+        return text
+
+    def _replace_punctuation(self, text: str) -> str:
+        if self.replace_or_remove_punctuation:
+            if '!!' in text or '??' in text or '..' in text:
+                text = _MULTI_PUNCTUATION_PATTERN.sub(lambda x: _MULTI_PUNCTUATION_TAGS[x.group()[0]], text)
+            return text.replace('\n', ' ')
+        return text.translate(_REMOVE_PUNCTUATION_TABLE)
+
+    def _replace_numbers(self, text: str) -> str:
+        if self.replace_or_remove_numbers:
+            return preprocessTools.NUMBER_PATTERN.sub(self._number_replacement, text)
+        return text.translate(_REMOVE_NUMBERS_TABLE)
+
+    def _replace_hashtags_and_contractions(self, text: str) -> str:
+        return self._replace_contractions(self._replace_hashtags(text))
+
+
+class MultiPreprocessor:
+    """
+    Several text preprocessing pipelines, run together on the same texts
+
+    Each variant returns the same texts as a :class:`Preprocessor` with its options. The steps run in the order of
+    the options, and variants agreeing on the options of the steps run so far share their result: lowercasing and
+    unicode cleanup run once, URL replacement once per URL option, mention replacement once per distinct URL and
+    mention options, and so on.
+
+    :param option_sets: The options of each variant, as the five first arguments of :class:`Preprocessor`.
+    :type option_sets: list(tuple(bool, bool, bool, bool, bool))
+    :param cache: On-disk cache of hashtag segmentations and number conversions, or None
+    :type cache: PersistentCache
+    """
+
+    def __init__(self, option_sets: List[tuple], cache: Optional[PersistentCache] = None):
+        self.option_sets = [tuple(options) for options in option_sets]
+        preprocessors = {}
+        for options in self.option_sets:
+            if options not in preprocessors:
+                preprocessors[options] = Preprocessor(*options, cache=cache)
+        self.preprocessors = [preprocessors[options] for options in self.option_sets]
+        # For each option, the distinct values of the options up to it, with the step to run for them
+        self._steps = []
+        for index, step in enumerate(['_replace_urls', '_replace_mentions', '_replace_hashtags_and_contractions',
+                                      '_replace_punctuation', '_replace_numbers']):
+            prefixes = {}
+            for options, preprocessor in preprocessors.items():
+                prefixes.setdefault(options[:index + 1], getattr(preprocessor, step))
+            self._steps.append(list(prefixes.items()))
+
+    def _run(self, text: str) -> List[str]:
+        results = {(): Preprocessor._clean_characters(text)}
+        for step in self._steps:
+            results = {prefix: function(results[prefix[:-1]]) for prefix, function in step}
+        return [results[options] for options in self.option_sets]
+
+    def process(self, text: str) -> List[str]:
+        """Preprocess the text content of a tweet with each variant.
+
+        :param text: Text content of a tweet.
+        :type text: str
+        :return: The clean version of the text for each variant, in the order of the option sets.
+        :rtype: list(str)
+        """
+
+        return self._run(text.lower())
+
+    def process_batch(self, texts: Iterable[str]) -> List[List[str]]:
+        """Preprocess the text content of a batch of tweets with each variant, see :meth:`Preprocessor.process_batch`.
+
+        :param texts: Text content of the tweets.
+        :type texts: iterable(str)
+        :return: For each variant, in the order of the option sets, the clean version of each text.
+        :rtype: list(list(str))
+        """
+
+        texts = list(texts)
+        text = _BATCH_SEPARATOR.join(texts).lower()
+        if len(texts) < 2 or text.count(_BATCH_SEPARATOR) != len(texts) - 1:
+            return [list(variant_texts) for variant_texts in zip(*[self.process(text) for text in texts])] \
+                if texts else [[] for _ in self.option_sets]
+        return [variant_text.split(_BATCH_SEPARATOR) for variant_text in self._run(text)]
+
+
+def preprocess_texts(texts: Union[Iterable[str], pd.Series], replace_or_remove_url: bool = True,
+                     replace_or_remove_mentions: bool = True, remove_hashtag_or_segment: bool = True,
+                     replace_or_remove_punctuation: bool = True, replace_or_remove_numbers: bool = True,
+                     cache: Optional[PersistentCache] = None) -> Union[List[str], pd.Series]:
+    """Preprocess a batch of tweet texts for analysis, see :meth:`Preprocessor.process_batch`.
+
+    The options default to those of the *preprocess* command without flags.
+
+    :param texts: Text content of the tweets, a pandas Series or any iterable of str.
+    :type texts: iterable(str) or pandas.Series
+    :param replace_or_remove_url: True to replace URLs, False to remove them.
+    :type replace_or_remove_url: bool
+    :param replace_or_remove_mentions: True to replace mentions, False to remove them.
+    :type replace_or_remove_mentions: bool
+    :param remove_hashtag_or_segment: True to remove '#' in front of hashtags, False to segment hashtags.
+    :type remove_hashtag_or_segment: bool
+    :param replace_or_remove_punctuation: True to replace multiple punctuation, False to remove all punctuation.
+    :type replace_or_remove_punctuation: bool
+    :param replace_or_remove_numbers: True to replace numbers by their text version, False to remove them.
+    :type replace_or_remove_numbers: bool
+    :param cache: On-disk cache of hashtag segmentations and number conversions, or None
+    :type cache: PersistentCache
+    :return: The clean texts, as a Series with the same index for a Series input, as a list otherwise.
+    :rtype: list(str) or pandas.Series
+
+    """
+
+    preprocessor = Preprocessor(replace_or_remove_url, replace_or_remove_mentions, remove_hashtag_or_segment,
+                                replace_or_remove_punctuation, replace_or_remove_numbers, cache)
+    if isinstance(texts, pd.Series):
+        return pd.Series(preprocessor.process_batch(texts.tolist()), index=texts.index, name=texts.name,
+                         dtype=object)
+    return preprocessor.process_batch(texts)
 
 
 def preprocessing_text(text: str, replace_or_remove_url: bool, replace_or_remove_mentions: bool,
@@ -49,7 +376,7 @@ def preprocessing_text(text: str, replace_or_remove_url: bool, replace_or_remove
             ascii_text)  # Technique 1
     else:
         # Remove URLs
-        no_link_text = preprocessTools.remove_url(no_unicode_text)
+        no_link_text = preprocessTools.remove_url(ascii_text)
 
     if replace_or_remove_mentions:
         # Replace mentions by 'atUser'
@@ -152,21 +479,89 @@ def count_per_day(data: [str, str, str, str]) -> pd.DataFrame:
 
     """
 
-    counts = pd.DataFrame.from_records(data)
+    counts = pd.Series(get_days([row[3] for row in data])).value_counts()
+    # Format the few distinct days only
+    counts.index = [day.strftime('%Y-%m-%d') for day in counts.index]
 
-    counts[3] = pd.to_datetime(counts[3])
-    counts[3] = counts[3].apply(lambda x: x.strftime('%Y-%m-%d'))
+    return counts.rename_axis('date').to_frame('counts')
 
-    return counts[3].value_counts().rename_axis('date').to_frame('counts')
 
+def read_row_blocks(csv_reader: Optional[csv.reader], file_path: str, skip_rows: int = 0) -> Iterable[List[list]]:
+    """Read the tweets of a CSV file by blocks of MAX_BUFFER_SIZE rows.
 
-def preprocess_csv_file(csv_reader: csv.reader, file_path: str, output_path: str, replace_or_remove_url: bool,
+    :param csv_reader: The reader for the input CSV file, without header, or None to read the file by large blocks of
+        bytes, see :func:`cranetoolbox.fileHandler.read_csv_blocks`.
+    :type csv_reader: csv.reader
+    :param file_path: The path to the input file.
+    :type file_path: str
+    :param skip_rows: Number of rows to skip at the start of the file, e.g. those committed by a previous run.
+    :type skip_rows: int
+    :return: Blocks of tweets, in format [id, original_text, timestamp].
+    :rtype: iterator(list(list()))
+
+    """
+
+    if csv_reader is None:
+        for ids, texts, timestamps in read_csv_blocks(file_path, [0, 1, 2], MAX_BUFFER_SIZE, skip_rows):
+            yield list(zip(ids, texts, timestamps))
+        return
+    for _ in islice(csv_reader, skip_rows):
+        pass
+    while True:
+        rows = list(islice(csv_reader, MAX_BUFFER_SIZE))
+        if not rows:
+            return
+        yield rows
+
+
+def preprocess_rows(rows: List[list], preprocessor: Preprocessor, keep_original_text: bool = True) -> List[list]:
+    """Preprocess a batch of tweets, see :meth:`Preprocessor.process_batch`.
+
+    :param rows: Tweets, in format [id, original_text, timestamp].
+    :type rows: list(list())
+    :param preprocessor: The preprocessing pipeline.
+    :type preprocessor: Preprocessor
+    :param keep_original_text: False to leave the original text empty in the output.
+    :type keep_original_text: bool
+    :return: The tweets, including clean text, in format [id, original_text, clean_text, timestamp].
+    :rtype: list(list())
+
+    """
+
+    clean_texts = preprocessor.process_batch([row[1] for row in rows])
+    if not keep_original_text:
+        return [[row[0], '', clean_text, row[2]] for row, clean_text in zip(rows, clean_texts)]
+    return [[row[0], row[1], clean_text, row[2]] for row, clean_text in zip(rows, clean_texts)]
+
+
+def get_output_file_path(file_path: str, output_path: str, compression: Optional[str] = None) -> str:
+    """Get the path of the preprocessed version of an input file.
+
+    :param file_path: The path to the input file.
+    :type file_path: str
+    :param output_path: The path to the output folder.
+    :type output_path: str
+    :param compression: Compression of the output, a key of :data:`COMPRESSION_SUFFIXES`, or None
+    :type compression: str
+    :return: The path to the output file, named from the input file with "_preprocessed.csv" appended
+    :rtype: str
+
+    """
+
+    return os.path.join(output_path + "/", get_output_file_name(file_path, compression))
+
+
+def preprocess_csv_file(csv_reader: Optional[csv.reader], file_path: str, output_path: str, replace_or_remove_url: bool,
                         replace_or_remove_mentions: bool,
                         remove_hashtag_or_segment: bool, replace_or_remove_punctuation: bool,
-                        replace_or_remove_numbers: bool) -> Optional[pd.DataFrame]:
+                        replace_or_remove_numbers: bool, cache: Optional[PersistentCache] = None,
+                        preprocessor: Optional[Preprocessor] = None, incremental: bool = False,
+                        partition_by: Optional[str] = None, keep_original_text: bool = True,
+                        compression: Optional[str] = None) -> Optional[pd.DataFrame]:
     """Preprocess a single CSV file.
 
-    :param csv_reader: The reader for the input CSV file, without header.
+    :param csv_reader: The reader for the input CSV file, without header, or None to read the file by large blocks of
+        bytes, see :func:`read_row_blocks`.
     :type csv_reader: csv.reader
     :param file_path: The path to the input file.
     :type file_path: str
@@ -182,56 +577,302 @@ def preprocess_csv_file(csv_reader: csv.reader, file_path: str, output_path: str
     :type replace_or_remove_punctuation: bool
     :param replace_or_remove_numbers: True to replace numbers by their text version, False to remove them.
     :type replace_or_remove_numbers: bool
+    :param cache: On-disk cache of hashtag segmentations and number conversions, or None
+    :type cache: PersistentCache
+    :param preprocessor: Pipeline to use instead of building one from the options and cache, e.g. to share its text
+        cache across files.
+    :type preprocessor: Preprocessor
+    :param incremental: True to skip the file if its output is up to date, or resume after the last chunk of rows
+        written by an interrupted run, see :class:`PreprocessState`.
+    :type incremental: bool
+    :param partition_by: Size of the partitions of the output, see :class:`PartitionedWriter`, or None to write a
+        single output file. Partitioned outputs cannot be incremental.
+    :type partition_by: str
+    :param keep_original_text: False to leave the original text empty in the output, to save space.
+    :type keep_original_text: bool
+    :param compression: Compression of the output, a key of :data:`COMPRESSION_SUFFIXES`, or None. Compressed outputs
+        are written through a streaming compressor, an interrupted run starts them again from the first row.
+    :type compression: str
     :return: Dataframe of processed CSV file
     :rtype: pd.DataFrame
 
     """
 
-    # Reading and saving in chunks to avoid memory overload
-    buffer_size = 0
-    buffer_data = []
-    date_dataframes = []
+    if preprocessor is None:
+        preprocessor = Preprocessor(replace_or_remove_url, replace_or_remove_mentions, remove_hashtag_or_segment,
+                                    replace_or_remove_punctuation, replace_or_remove_numbers, cache)
 
     # Create output folder if it does not exists
     if not exists(output_path):
         makedirs(output_path)
 
-    # Write to a CSV file, named from the input file with "_preprocessed.csv" appended
-    input_file_name = splitext(basename(file_path))[0]
-    output_file_path = os.path.join(output_path + "/", (input_file_name + "_preprocessed.csv"))
-    with open(output_file_path, 'w+') as output_file:
+    if partition_by is not None:
+        if incremental:
+            raise ValueError("Partitioned outputs cannot be written incrementally")
+        writer = PartitionedWriter(output_path, file_path, partition_by, preprocessor.options, compression)
+        date_dataframes = []
+        try:
+            row_num = 0
+            for rows in read_row_blocks(csv_reader, file_path):
+                buffer_data = preprocess_rows(rows, preprocessor, keep_original_text)
+                writer.writerows(buffer_data, get_days([row[3] for row in buffer_data]))
+                date_dataframes.append(count_per_day(buffer_data))
+                row_num += len(rows)
+                print(f'\rProcessing line: {row_num}', end="")
+        except Exception as e:
+            print(e)
+            writer.abort()
+            return None
+        finally:
+            # Print newline to escape out of line used for status updates
+            print()
+        writer.close()
+        return merge_counts_dataframe(date_dataframes)
+
+    state = PreprocessState(file_path, get_output_file_path(file_path, output_path, compression),
+                            get_options_hash(preprocessor.options + (keep_original_text,)), incremental, compression)
+    if state.is_complete():
+        print("Output is up to date, skipping")
+        return state.get_counts_dataframe()
+
+    # Rows are written to a partial output, committed by chunk and renamed once all are written
+    with state.open_output() as output_file:
         csv_writer = csv.writer(output_file, quoting=csv.QUOTE_MINIMAL)
 
         # Catch errors, no specific exception handling for now
         try:
-            row_num = 0
-            # For each line
-            for row in csv_reader:
+            row_num = state.rows
+            # Reading, preprocessing and saving in chunks to avoid memory overload, after the rows committed by a
+            # previous run
+            for rows in read_row_blocks(csv_reader, file_path, row_num):
+                buffer_data = preprocess_rows(rows, preprocessor, keep_original_text)
+                csv_writer.writerows(buffer_data)
+                state.commit(output_file, len(rows), count_per_day(buffer_data))
+                row_num += len(rows)
                 print(f'\rProcessing line: {row_num}', end="")
-                row_num += 1
-                # Preprocess the text
-                clean_tweet = preprocessing_tweet(row, replace_or_remove_url, replace_or_remove_mentions,
-                                                  remove_hashtag_or_segment, replace_or_remove_punctuation,
-                                                  replace_or_remove_numbers)
-                buffer_data.append(clean_tweet)
-                buffer_size += 1
-                # If the buffer is full, save to file
-                if buffer_size >= MAX_BUFFER_SIZE:
-                    csv_writer.writerows(buffer_data)
-                    date_dataframes.append(count_per_day(buffer_data))
-                    buffer_data = []
-                    buffer_size = 0
+        except Exception as e:
+            print(e)
+            return None
+        finally:
+            # Print newline to escape out of line used for status updates
+            print()
+    state.complete()
 
-            # Saving incomplete buffer when end of file is reached
-            if buffer_size > 0:
-                csv_writer.writerows(buffer_data)
-                date_dataframes.append(count_per_day(buffer_data))
+    return state.get_counts_dataframe()
+
+
+def preprocess_csv_file_variants(csv_reader: Optional[csv.reader], file_path: str, output_paths: List[str],
+                                 option_sets: List[tuple], cache: Optional[PersistentCache] = None,
+                                 incremental: bool = False, keep_original_text: bool = True,
+                                 compression: Optional[str] = None) -> Optional[pd.DataFrame]:
+    """Preprocess a single CSV file with several sets of options, in one pass, see :class:`MultiPreprocessor`.
+
+    Each variant is written to its own output folder, as by :func:`preprocess_csv_file` with its options.
+
+    :param csv_reader: The reader for the input CSV file, without header, or None to read the file by large blocks of
+        bytes, see :func:`read_row_blocks`.
+    :type csv_reader: csv.reader
+    :param file_path: The path to the input file.
+    :type file_path: str
+    :param output_paths: The path to the output folder of each variant.
+    :type output_paths: list(str)
+    :param option_sets: The options of each variant, as the five first arguments of :class:`Preprocessor`.
+    :type option_sets: list(tuple(bool, bool, bool, bool, bool))
+    :param cache: On-disk cache of hashtag segmentations and number conversions, or None
+    :type cache: PersistentCache
+    :param incremental: True to skip the file if all its outputs are up to date, or resume after the last chunk of
+        rows written by an interrupted run.
+    :type incremental: bool
+    :param keep_original_text: False to leave the original text empty in the output, to save space.
+    :type keep_original_text: bool
+    :param compression: Compression of the output, a key of :data:`COMPRESSION_SUFFIXES`, or None. Compressed outputs
+        are written through a streaming compressor, an interrupted run starts them again from the first row.
+    :type compression: str
+    :return: Dataframe of processed CSV file, the counts per day, which are the same for all variants
+    :rtype: pd.DataFrame
+
+    """
+
+    multi_preprocessor = MultiPreprocessor(option_sets, cache)
+
+    # Create output folders if they do not exist
+    for output_path in output_paths:
+        if not exists(output_path):
+            makedirs(output_path)
+
+    def get_states(resume: bool) -> List[PreprocessState]:
+        return [PreprocessState(file_path, get_output_file_path(file_path, output_path, compression),
+                                get_options_hash(options + (keep_original_text,)), resume, compression)
+                for output_path, options in zip(output_paths, multi_preprocessor.option_sets)]
+
+    states = get_states(incremental)
+    if all(state.is_complete() for state in states):
+        print("Outputs are up to date, skipping")
+        return states[0].get_counts_dataframe()
+    if any(state.is_complete() for state in states) or len({state.rows for state in states}) > 1:
+        # Variants can only be resumed together, from the same row
+        states = get_states(False)
+
+    with ExitStack() as stack:
+        output_files = [stack.enter_context(state.open_output()) for state in states]
+        csv_writers = [csv.writer(output_file, quoting=csv.QUOTE_MINIMAL) for output_file in output_files]
+
+        # Catch errors, no specific exception handling for now
+        try:
+            row_num = states[0].rows
+            # Reading, preprocessing and saving in chunks to avoid memory overload, after the rows committed by a
+            # previous run
+            for rows in read_row_blocks(csv_reader, file_path, row_num):
+                counts = None
+                variant_texts = multi_preprocessor.process_batch([row[1] for row in rows])
+                for state, output_file, csv_writer, clean_texts in zip(states, output_files, csv_writers,
+                                                                         variant_texts):
+                    buffer_data = [[row[0], row[1] if keep_original_text else '', clean_text, row[2]]
+                                   for row, clean_text in zip(rows, clean_texts)]
+                    csv_writer.writerows(buffer_data)
+                    if counts is None:
+                        counts = count_per_day(buffer_data)
+                    state.commit(output_file, len(rows), counts)
+                row_num += len(rows)
+                print(f'\rProcessing line: {row_num}', end="")
         except Exception as e:
             print(e)
             return None
         finally:
             # Print newline to escape out of line used for status updates
             print()
+    for state in states:
+        state.complete()
+
+    return states[0].get_counts_dataframe()
+
+
+# Preprocessor of each worker process, built once by the pool initializer
+_worker_preprocessor = None
+_worker_keep_original_text = True
+
+
+def _init_worker(options: tuple, cache_path: Optional[str], text_cache_size: int, keep_original_text: bool):
+    global _worker_preprocessor, _worker_keep_original_text
+    _worker_keep_original_text = keep_original_text
+    cache = None
+    if cache_path is not None:
+        cache = PersistentCache(cache_path)
+        # Write the last cached results when the worker exits
+        multiprocessing.util.Finalize(cache, cache.close, exitpriority=10)
+    _worker_preprocessor = Preprocessor(*options, cache=cache, text_cache_size=text_cache_size)
+
+
+def _preprocess_batch(rows: List[list]) -> (List[list], pd.DataFrame, int, int):
+    hits, misses = _worker_preprocessor.text_cache_hits, _worker_preprocessor.text_cache_misses
+    data = preprocess_rows(rows, _worker_preprocessor, _worker_keep_original_text)
+    # Text cache statistics of the batch
+    hits = _worker_preprocessor.text_cache_hits - hits
+    misses = _worker_preprocessor.text_cache_misses - misses
+    return data, count_per_day(data), hits, misses
+
+
+def preprocess_csv_files_parallel(file_paths: List[str], output_path: str, replace_or_remove_url: bool,
+                                  replace_or_remove_mentions: bool, remove_hashtag_or_segment: bool,
+                                  replace_or_remove_punctuation: bool, replace_or_remove_numbers: bool,
+                                  workers: int, cache_path: Optional[str] = None,
+                                  text_cache_size: int = 0, incremental: bool = False, keep_original_text: bool = True,
+                                  compression: Optional[str] = None) -> (List[pd.DataFrame], int):
+    """Preprocess CSV files in a pool of worker processes.
+
+    The rows of all files are sent to the workers in batches of MAX_BUFFER_SIZE rows, so that both small and large
+    files are spread across workers. Batches are written back in order, so each output file is identical to the one
+    written by :func:`preprocess_csv_file`. At most a few batches per worker are held in memory.
+
+    :param file_paths: The paths to the input files, CSV files without header.
+    :type file_paths: list(str)
+    :param output_path: The path to the output folder.
+    :type output_path: str
+    :param replace_or_remove_url: True to replace URLs, False to remove them.
+    :type replace_or_remove_url: bool
+    :param replace_or_remove_mentions: True to replace mentions, False to remove them.
+    :type replace_or_remove_mentions: bool
+    :param remove_hashtag_or_segment: True to remove '#' in front of hashtags, False to segment hashtags.
+    :type remove_hashtag_or_segment: bool
+    :param replace_or_remove_punctuation: True to replace multiple punctuation, False to remove all punctuation.
+    :type replace_or_remove_punctuation: bool
+    :param replace_or_remove_numbers: True to replace numbers by their text version, False to remove them.
+    :type replace_or_remove_numbers: bool
+    :param workers: Number of worker processes.
+    :type workers: int
+    :param cache_path: Path to a :class:`PersistentCache` file shared by the workers, or None
+    :type cache_path: str
+    :param text_cache_size: Number of clean texts cached by each worker, see :class:`Preprocessor`.
+    :type text_cache_size: int
+    :param incremental: True to skip files whose output is up to date, and resume those partly written, see
+        :func:`preprocess_csv_file`.
+    :type incremental: bool
+    :param keep_original_text: False to leave the original text empty in the output, to save space.
+    :type keep_original_text: bool
+    :param compression: Compression of the output, a key of :data:`COMPRESSION_SUFFIXES`, or None. Compressed outputs
+        are written through a streaming compressor, an interrupted run starts them again from the first row.
+    :type compression: str
+    :return: The counts per day of each file that was fully processed, and the number of files that failed
+    :rtype: list(pandas.DataFrame), int
+
+    """
+
+    # Create output folder if it does not exists
+    if not exists(output_path):
+        makedirs(output_path)
 
-    date_dataframe = merge_counts_dataframe(date_dataframes)
-    return date_dataframe
+    options = (replace_or_remove_url, replace_or_remove_mentions, remove_hashtag_or_segment,
+               replace_or_remove_punctuation, replace_or_remove_numbers)
+    date_dataframes = []
+    failed_files = 0
+    text_cache_hits = 0
+    text_cache_misses = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(options, cache_path, text_cache_size, keep_original_text)) as executor:
+        for file_path in file_paths:
+            print(f"Processing file {str(file_path)}")
+            pending = deque()
+            try:
+                state = PreprocessState(file_path, get_output_file_path(file_path, output_path, compression),
+                                        get_options_hash(options + (keep_original_text,)), incremental, compression)
+                if state.is_complete():
+                    print("Output is up to date, skipping")
+                    if state.counts:
+                        date_dataframes.append(state.get_counts_dataframe())
+                    continue
+                with state.open_output() as output_file:
+                    csv_writer = csv.writer(output_file, quoting=csv.QUOTE_MINIMAL)
+                    row_num = state.rows
+                    # Rows after those committed by a previous run
+                    row_blocks = read_row_blocks(None, file_path, row_num)
+                    while True:
+                        rows = next(row_blocks, None)
+                        if rows:
+                            pending.append(executor.submit(_preprocess_batch, rows))
+                        # Write the oldest batches once enough are in flight, or all of them at the end of the file
+                        while pending and (not rows or len(pending) > PARALLEL_BATCHES_PER_WORKER * workers):
+                            data, counts, hits, misses = pending.popleft().result()
+                            text_cache_hits += hits
+                            text_cache_misses += misses
+                            csv_writer.writerows(data)
+                            state.commit(output_file, len(data), counts)
+                            row_num += len(data)
+                            print(f'\rProcessing line: {row_num}', end="")
+                        if not rows:
+                            break
+                state.complete()
+            except Exception as e:
+                print(e)
+                for future in pending:
+                    future.cancel()
+                failed_files += 1
+                continue
+            finally:
+                # Print newline to escape out of line used for status updates
+                print()
+            date_dataframe = state.get_counts_dataframe()
+            if date_dataframe is not None:
+                date_dataframes.append(date_dataframe)
+    if text_cache_size > 0:
+        print(f"Text cache hits: {text_cache_hits}, misses: {text_cache_misses}")
+    return date_dataframes, failed_files
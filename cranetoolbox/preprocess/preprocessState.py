@@ -0,0 +1,150 @@
+# Checkpoint state of the preprocessing of an input file, for atomic outputs and resumable runs
+
+import hashlib
+import json
+import os
+from typing import Dict, Optional, TextIO
+
+import pandas as pd
+
+from cranetoolbox.fileHandler import open_csv_file
+
+STATE_SUFFIX = ".state.json"
+PARTIAL_SUFFIX = ".partial"
+
+
+def get_options_hash(options: tuple) -> str:
+    """Hash a set of preprocessing options, to detect outputs written with other options.
+
+    :param options: The options, see :attr:`Preprocessor.options`
+    :type options: tuple
+    :return: A short hexadecimal hash
+    :rtype: str
+    """
+
+    return hashlib.sha256(json.dumps(list(options)).encode('utf-8')).hexdigest()[:16]
+
+
+class PreprocessState:
+    """
+    State of the preprocessing of an input file, saved next to its output as <output>.state.json
+
+    Rows are written to <output>.partial, which is renamed to the output once the whole input is preprocessed, so the
+    output is never left half-written. After each chunk of rows, the number of input rows read, the size of the
+    partial output and the counts per day so far are committed to the state. The state also records the size and
+    modification time of the input and a hash of the options, and is discarded if any of them changed.
+
+    :param input_path: Path to the input file
+    :type input_path: str
+    :param output_file_path: Path to the output file
+    :type output_file_path: str
+    :param options_hash: Hash of the preprocessing options, see :func:`get_options_hash`
+    :type options_hash: str
+    :param resume: False to discard any existing state and start from scratch
+    :type resume: bool
+    :param compression: Compression of the output, see :func:`open_csv_file`. Compressed outputs cannot be
+        truncated to the last commit, so they are only skipped once complete, never resumed.
+    :type compression: str
+    """
+
+    def __init__(self, input_path: str, output_file_path: str, options_hash: str, resume: bool = True,
+                 compression: Optional[str] = None):
+        self.output_path = str(output_file_path)
+        self.compression = compression
+        self.state_path = self.output_path + STATE_SUFFIX
+        self.partial_path = self.output_path + PARTIAL_SUFFIX
+        stat = os.stat(input_path)
+        self._state = {'input': os.path.abspath(str(input_path)), 'size': stat.st_size, 'mtime': stat.st_mtime,
+                       'options': options_hash, 'rows': 0, 'offset': 0, 'counts': {}, 'complete': False}
+        if resume and os.path.exists(self.state_path):
+            try:
+                with open(self.state_path, 'r') as state_file:
+                    state = json.load(state_file)
+            except ValueError:
+                state = None
+            if state is not None and all(state.get(key) == self._state[key]
+                                         for key in ('input', 'size', 'mtime', 'options')):
+                self._state = state
+
+    @property
+    def rows(self) -> int:
+        return self._state['rows']
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        return self._state['counts']
+
+    def is_complete(self) -> bool:
+        """Check whether the output is complete and up to date with the input and options.
+
+        :return: True if the input can be skipped
+        :rtype: bool
+        """
+
+        return self._state['complete'] and os.path.exists(self.output_path)
+
+    def open_output(self) -> TextIO:
+        """Open the partial output to append rows after the last committed chunk.
+
+        Rows written after the last commit are truncated. If the partial output is missing or shorter than
+        committed, preprocessing starts again from the first row.
+
+        :return: The partial output, opened for appending
+        :rtype: file
+        """
+
+        offset = self._state['offset']
+        if self.rows > 0 and self.compression is None and os.path.exists(self.partial_path) \
+                and os.path.getsize(self.partial_path) >= offset:
+            print("Resuming %s after %d rows" % (self.output_path, self.rows))
+            with open(self.partial_path, 'r+b') as partial_file:
+                partial_file.truncate(offset)
+            return open(self.partial_path, 'a')
+        self._state.update({'rows': 0, 'offset': 0, 'counts': {}, 'complete': False})
+        self.save()
+        return open_csv_file(self.partial_path, 'w', self.compression)
+
+    def commit(self, output_file: TextIO, rows: int, counts: pd.DataFrame):
+        """Record that a chunk of rows was written to the partial output.
+
+        :param output_file: The partial output, see :meth:`open_output`
+        :type output_file: file
+        :param rows: Number of input rows of the chunk
+        :type rows: int
+        :param counts: Counts per day of the chunk, see :func:`count_per_day`
+        :type counts: pandas.DataFrame
+        """
+
+        self._state['rows'] += rows
+        if self.compression is None:
+            output_file.flush()
+            self._state['offset'] = os.fstat(output_file.fileno()).st_size
+        state_counts = self._state['counts']
+        for day, count in counts['counts'].items():
+            state_counts[day] = state_counts.get(day, 0) + int(count)
+        self.save()
+
+    def complete(self):
+        """Move the partial output to the output, once all rows are committed."""
+
+        os.replace(self.partial_path, self.output_path)
+        self._state['complete'] = True
+        self.save()
+
+    def get_counts_dataframe(self) -> Optional[pd.DataFrame]:
+        """Get the counts per day of the committed rows, in the format of :func:`merge_counts_dataframe`.
+
+        :return: A DataFrame with the counts per day, or None if no row was committed
+        :rtype: pandas.DataFrame
+        """
+
+        if not self.counts:
+            return None
+        counts = pd.DataFrame({'counts': pd.Series(self.counts, dtype='int64')}).rename_axis('date')
+        return counts.sort_index()
+
+    def save(self):
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, 'w') as state_file:
+            json.dump(self._state, state_file)
+        os.replace(temp_path, self.state_path)
@@ -2,53 +2,82 @@
 # Adapted from https://github.com/Deffro/text-preprocessing-techniques
 
 import re
+from functools import lru_cache
 
 import wordsegment
 from num2words import num2words
 
+# Patterns are compiled once, at import
+ESCAPED_UNICODE_PATTERN = re.compile(r'(\\u[0-9A-Fa-f]+)')
+NON_ASCII_PATTERN = re.compile(r'[^\x00-\x7f]')
+URL_PATTERN = re.compile(r'((http|ftp|https):\/\/)?(w{3}\.)?[\w\-\@?^=%&amp;/~\+#]+\.\w+')
+AT_USER_PATTERN = re.compile(r'@[\w]+')
+HASHTAG_PATTERN = re.compile(r'#(\w+)')
+CONTRACTION_PATTERNS = [(re.compile(regex), repl) for (regex, repl) in [
+    (r'won\'t', 'will not'), (r'can\'t', 'cannot'), (r'i\'m', 'i am'), (r'ain\'t', 'is not'),
+    (r'(\w+)\'ll', r'\g<1> will'), (r'(\w+)n\'t', r'\g<1> not'),
+    (r'(\w+)\'ve', r'\g<1> have'), (r'(\w+)\'s', r'\g<1> is'), (r'(\w+)\'re', r'\g<1> are'),
+    (r'(\w+)\'d', r'\g<1> would'), (r'&', 'and'), (r'dammit', 'damn it'), (r'dont', 'do not'),
+    (r'wont', 'will not')]]
+MULTI_EXCLAMATION_PATTERN = re.compile(r"(\!)\1+")
+MULTI_QUESTION_PATTERN = re.compile(r"(\?)\1+")
+MULTI_STOP_PATTERN = re.compile(r"(\.)\1+")
+NEW_LINE_PATTERN = re.compile(r"\n")
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s-]|_")
+NUMBER_PATTERN = re.compile(r"(\d+)(st|nd|rd|th)?")
+# Number of results kept in memory for each cached transform
+CACHE_SIZE = 100000
+
+
+def load_wordsegment():
+    """ Loads the word frequency tables used by hashtag segmentation, once """
+    if not wordsegment.UNIGRAMS:
+        wordsegment.load()
+
 
 def remove_escaped_unicode(text: str) -> str:
     """ Removes escaped unicode characters from the text """
-    return re.sub(r'(\\u[0-9A-Fa-f]+)', r'', text)
+    return ESCAPED_UNICODE_PATTERN.sub(r'', text)
 
 def remove_non_ascii(text: str) -> str:
     """ Removes non ascii characters from the text """
-    return re.sub(r'[^\x00-\x7f]', '', text)
+    return NON_ASCII_PATTERN.sub('', text)
 
 def replace_url(text: str) -> str:
     """ Replaces url address with "url" """
-    text = re.sub(r'((http|ftp|https):\/\/)?(w{3}\.)?[\w\-\@?^=%&amp;/~\+#]+\.\w+', 'url', text)
+    text = URL_PATTERN.sub('url', text)
     return text
 
 
 def remove_url(text: str) -> str:
     """ Removes url address"""
-    text = re.sub(r'((http|ftp|https):\/\/)?(w{3}\.)?[\w\-\@?^=%&amp;/~\+#]+\.\w+', '', text)
+    text = URL_PATTERN.sub('', text)
     return text
 
 
 def replace_at_user(text: str) -> str:
     """ Replaces "@user" with "atUser" """
-    text = re.sub(r'@[\w]+', 'atUser', text)
+    text = AT_USER_PATTERN.sub('atUser', text)
     return text
 
 
 def remove_at_user(text: str) -> str:
     """ Removes "@user" """
-    text = re.sub(r'@[\w]+', '', text)
+    text = AT_USER_PATTERN.sub('', text)
     return text
 
 
 def remove_hashtag_in_front_of_word(text: str) -> str:
     """ Removes hastag in front of a word """
-    text = re.sub(r'#(\w+)', r'\1', text)
+    text = HASHTAG_PATTERN.sub(r'\1', text)
     return text
 
 
+@lru_cache(maxsize=CACHE_SIZE)
 def segment_hashtag(text: str) -> str:
     """ Removes hastag in front of a word and add hashtag segmentation """
     text = text[1:]
-    wordsegment.load()
+    load_wordsegment()
     segments = wordsegment.segment(text)
     if len(segments) > 1:
         text = " ".join(segments)
@@ -57,51 +86,44 @@ def segment_hashtag(text: str) -> str:
 
 def replace_hashtags(text: str) -> str:
     """ Removes hastag in front of a word and add hashtag segmentation """
-    text = re.sub(r'#(\w+)', lambda x: segment_hashtag(x.group()), text)
+    text = HASHTAG_PATTERN.sub(lambda x: segment_hashtag(x.group()), text)
     return text
 
 
 def replace_contraction(text: str) -> str:
     """ Replaces contractions from a string to their equivalents """
-    contraction_patterns = [(r'won\'t', 'will not'), (r'can\'t', 'cannot'), (r'i\'m', 'i am'), (r'ain\'t', 'is not'),
-                            (r'(\w+)\'ll', r'\g<1> will'), (r'(\w+)n\'t', r'\g<1> not'),
-                            (r'(\w+)\'ve', r'\g<1> have'), (r'(\w+)\'s', r'\g<1> is'), (r'(\w+)\'re', r'\g<1> are'),
-                            (r'(\w+)\'d', r'\g<1> would'), (r'&', 'and'), (r'dammit', 'damn it'), (r'dont', 'do not'),
-                            (r'wont', 'will not')]
-    patterns = [(re.compile(regex), repl)
-                for (regex, repl) in contraction_patterns]
-    for (pattern, repl) in patterns:
-        (text, count) = re.subn(pattern, repl, text)
+    for (pattern, repl) in CONTRACTION_PATTERNS:
+        text = pattern.sub(repl, text)
     return text
 
 
 def replace_multi_exclamation_mark(text: str) -> str:
     """ Replaces repetitions of exlamation marks """
-    text = re.sub(r"(\!)\1+", ' multiExclamation ', text)
+    text = MULTI_EXCLAMATION_PATTERN.sub(' multiExclamation ', text)
     return text
 
 
 def replace_multi_question_mark(text: str) -> str:
     """ Replaces repetitions of question marks """
-    text = re.sub(r"(\?)\1+", ' multiQuestion ', text)
+    text = MULTI_QUESTION_PATTERN.sub(' multiQuestion ', text)
     return text
 
 
 def replace_multi_stop_mark(text: str) -> str:
     """ Replaces repetitions of stop marks """
-    text = re.sub(r"(\.)\1+", ' multiStop ', text)
+    text = MULTI_STOP_PATTERN.sub(' multiStop ', text)
     return text
 
 
 def replace_new_line(text: str) -> str:
     """ Replaces new lines with spaces """
-    text = re.sub(r"\n", " ", text)
+    text = NEW_LINE_PATTERN.sub(" ", text)
     return text
 
 
 def remove_punctuation(text: str) -> str:
     """ Removes punctuation symbols, except hyphens"""
-    text = re.sub(r"[^\w\s-]|_", "", text)
+    text = PUNCTUATION_PATTERN.sub("", text)
     return text
 
 
@@ -111,9 +133,13 @@ def remove_numbers(text: str) -> str:
     return text
 
 
+@lru_cache(maxsize=CACHE_SIZE)
+def number_to_words(number: int, ordinal: bool) -> str:
+    """ Converts a number to words, as a cardinal or ordinal number """
+    return num2words(number, ordinal)
+
+
 def replace_numbers(text: str) -> str:
     """Replaces numbers with their text version"""
-    text = re.sub(r"(\d+)(st|nd|rd|th)?",
-                  lambda x: num2words(int(x.group(1)), x.group(2) is not None),
-                  text)
+    text = NUMBER_PATTERN.sub(lambda x: number_to_words(int(x.group(1)), x.group(2) is not None), text)
     return text
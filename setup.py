@@ -29,7 +29,8 @@ setuptools.setup(
         }
     },
     python_requires='>=3.6',
-    install_requires=['argparse', 'datetime', 'num2words', 'pathlib', 'pandas', 'typing', 'wordsegment'],
+    install_requires=['argparse', 'datetime', 'num2words', 'numpy', 'pathlib', 'pandas', 'typing', 'wordsegment'],
+    extras_require={'zstd': ['zstandard'], 'columnar': ['pyarrow'], 'ahocorasick': ['pyahocorasick']},
     setup_requires=['pytest-runner'],
     tests_require=['pytest', 'pytest-datafiles'],
 )
@@ -0,0 +1,97 @@
+## Unit and integration tests for analysis modules
+
+import csv
+import random
+from datetime import date
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cranetoolbox.analysis import countOccurences
+from cranetoolbox.analysis.countOccurences import (DailyKeywordCounts, aggregate_counts, count_keywords,
+                                                   detect_keywords)
+from cranetoolbox.analysis.keywordMatcher import KeywordMatcher, tokenize
+from cranetoolbox.dateHandler import get_days
+
+
+@pytest.mark.parametrize('backend', ['python', 'pyahocorasick'])
+def test_keyword_matcher(backend):
+    if backend == 'pyahocorasick':
+        pytest.importorskip("ahocorasick")
+    keywords = {'mask': ['mask', 'masks', 'face cover'], 'covid': ['covid', 'corona', 'covid19'], 'ask': ['ask'],
+                'any': ['', 'mask'], 'none': []}
+    texts = ['i wear a mask', 'coronavirus and covid19', 'face covering', 'Mask', '', 'i ask to cover my face',
+             'masks', 'ma sk']
+    matcher = KeywordMatcher(keywords, backend)
+    matches = matcher.detect_texts(texts)
+    assert matches.shape == (len(texts), len(keywords))
+    for text, text_matches in zip(texts, matches):
+        expected = detect_keywords(text, keywords)
+        assert detect_keywords(text, matcher) == expected
+        assert text_matches.tolist() == [expected[keyword] for keyword in keywords]
+    assert matcher.find('masks') == {'mask', 'ask', 'any'}
+
+
+def test_keyword_matcher_tokens():
+    keywords = {'asia': ['asia', 'asian'], 'face mask': ['face mask', 'face-mask'], 'covid': ['covid-nineteen'],
+                'empty': ['', '!!']}
+    matcher = KeywordMatcher(keywords, mode='tokens')
+    assert tokenize('hello, (face mask) "covid-nineteen" it\'s ok') == [
+        'hello', 'face', 'mask', 'covid-nineteen', "it's", 'ok']
+    assert matcher.find('caucasian food') == set()
+    assert matcher.find('east asian food, asia.') == {'asia'}
+    assert matcher.find('a face mask') == {'face mask'}
+    assert matcher.find('a face masks, face-mask') == {'face mask'}
+    assert matcher.find('face mask covid-nineteen') == {'face mask', 'covid'}
+    assert matcher.find('face the mask covid') == set()
+    assert matcher.detect_texts(['asia', 'mask face', '']).tolist() == [
+        [True, False, False, False], [False, False, False, False], [False, False, False, False]]
+
+
+def test_daily_keyword_counts():
+    random.seed(3)
+    main_variants = ['mask', 'covid']
+    counts = DailyKeywordCounts(main_variants)
+    blocks = []
+    # More days than the initial size of the counts
+    for block_index in range(30):
+        timestamps = ['2020-%02d-%02d 10:00:00' % (1 + block_index // 10, 1 + random.randrange(block_index % 5 + 1))
+                      for _ in range(20)]
+        matches = np.array([[random.random() < 0.5 for _ in main_variants] for _ in timestamps])
+        counts.add(get_days(timestamps), matches)
+        blocks.append(aggregate_counts(dict({'timestamp': timestamps, 'total': [1] * len(timestamps)},
+                                            **{main_variant: matches[:, index]
+                                               for index, main_variant in enumerate(main_variants)}),
+                                       main_variants, None))
+    expected = pd.concat(blocks).groupby('day').sum()
+    daily_counts = counts.to_dataframe()
+    assert daily_counts.index.tolist() == expected.index.tolist()
+    assert daily_counts.values.tolist() == expected.values.tolist()
+    assert daily_counts.columns.tolist() == ['total_count', 'mask_count', 'covid_count']
+    assert counts.to_dataframe(since=date(2020, 2, 1), until=date(2020, 3, 1)).index.tolist() == [
+        day for day in expected.index if date(2020, 2, 1) <= day < date(2020, 3, 1)]
+    assert countOccurences.parse_day('2020-02-01') == date(2020, 2, 1)
+    with pytest.raises(ValueError):
+        countOccurences.parse_day('2020-13-01')
+
+
+def test_count_keywords_parallel(tmpdir, monkeypatch):
+    random.seed(4)
+    input_paths = []
+    for file_index in range(3):
+        input_path = tmpdir.join('tweets_%d.csv' % file_index).strpath
+        with open(input_path, 'w') as input_file:
+            writer = csv.writer(input_file)
+            for row_index in range(500):
+                text = random.choice(['i wear a mask', 'covid, "again"\nand again', 'masks and covid', 'hello'])
+                writer.writerow([str(row_index), text, text, 'Wed Oct %02d 20:00:00 +0000 2018' % random.randint(1, 9)])
+        input_paths.append(input_path)
+    keywords = {'mask': ['mask'], 'covid': ['covid', 'corona']}
+    expected = count_keywords(input_paths, keywords, '%a %b %d %H:%M:%S %z %Y')
+
+    # Files split into ranges of rows
+    monkeypatch.setattr(countOccurences, 'MIN_RANGE_SIZE', 1000)
+    counts = count_keywords(input_paths, keywords, '%a %b %d %H:%M:%S %z %Y', workers=3)
+    assert counts.equals(expected)
+    assert counts['total_count'].sum() == 1500
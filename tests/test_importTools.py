@@ -2,8 +2,23 @@
 
 # Input/output tests
 
+import bz2
+import gzip
+import io
+import json
+import lzma
 import os
+import tarfile
+import tracemalloc
+import zipfile
+from datetime import datetime
+
 import pytest
+from cranetoolbox.importTools.dateWindow import DateWindow, parse_tweet_date
+from cranetoolbox.importTools.dedup import TweetIdSet
+from cranetoolbox.importTools.jsonStream import iter_chunks, iter_json_documents, JSON_CHUNK_SIZE
+from cranetoolbox.importTools.prefilter import prefilter_line
+from cranetoolbox.importTools.tarIndex import TarIndex
 from cranetoolbox.importTools.transform import process_files, TransformationOptions
 
 # Set up data input
@@ -133,3 +148,524 @@ def test_input_output_match_field_names_lang_retweet_memory(tmpdir, datafiles):
     assert line_count == 1
     assert failure_count == 2
     assert output_file.read() == expected_output
+
+
+@pytest.mark.datafiles(
+    os.path.join(FIXTURE_DIR, 'importTools_input.json'),
+    )
+def test_input_output_match_workers(tmpdir, datafiles):
+    opts_default = TransformationOptions("en",
+                                 False,
+                                 2,
+                                 None,
+                                 None,
+                                 None)
+
+    # Run test on two copies of the input, shards should be merged in the input order
+    input_file = datafiles.listdir()[0]
+    input_copy = tmpdir.join('importTools_input_copy.json')
+    input_file.copy(input_copy)
+    expected_output = "1,yes,date\n2,yes,date\n4,yes,date\n7,yes,date\n8,yes,date\n9,yes,date\n" * 2
+    output_file = tmpdir.join('output.txt')
+    line_count, failure_count = process_files([str(input_file), input_copy.strpath], opts_default,
+                                              output_file.strpath, workers=2)
+    assert line_count == 12
+    assert failure_count == 24
+    assert output_file.read() == expected_output
+    assert not os.path.exists(output_file.strpath + ".part0")
+
+    # A file failing in its worker is reported and skipped, the other files are still merged
+    output_file = tmpdir.join('output_missing.txt')
+    line_count, failure_count = process_files([tmpdir.join('missing.json').strpath, str(input_file)], opts_default,
+                                              output_file.strpath, workers=2)
+    assert line_count == 6
+    assert output_file.read() == expected_output[:len(expected_output) // 2]
+
+
+@pytest.mark.parametrize("archive_format", ["gzip", "bz2", "xz", "zstd", "zip", "tar", "tar-of-gzip", "gzip-tar-of-zip"])
+@pytest.mark.datafiles(
+    os.path.join(FIXTURE_DIR, 'importTools_input.json'),
+    )
+def test_input_output_match_compressed(tmpdir, datafiles, archive_format):
+    opts_default = TransformationOptions("en",
+                                 False,
+                                 50000,
+                                 None,
+                                 None,
+                                 None)
+
+    # Build the archive from the input file
+    input_path = str(datafiles.listdir()[0])
+    with open(input_path, 'rb') as f:
+        content = f.read()
+    archive_path = tmpdir.join('archive').strpath
+
+    def add_to_tar(tf, name, data):
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        tf.addfile(info, io.BytesIO(data))
+
+    def zipped(data):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w') as zf:
+            zf.writestr('input.json', data)
+        return buffer.getvalue()
+
+    if archive_format == "gzip":
+        with gzip.open(archive_path, 'wb') as f:
+            f.write(content)
+    elif archive_format == "bz2":
+        with bz2.open(archive_path, 'wb') as f:
+            f.write(content)
+    elif archive_format == "xz":
+        with lzma.open(archive_path, 'wb') as f:
+            f.write(content)
+    elif archive_format == "zstd":
+        zstandard = pytest.importorskip("zstandard")
+        with open(archive_path, 'wb') as f:
+            f.write(zstandard.ZstdCompressor().compress(content))
+    elif archive_format == "zip":
+        with open(archive_path, 'wb') as f:
+            f.write(zipped(content))
+    elif archive_format == "tar":
+        with tarfile.open(archive_path, 'w') as tf:
+            add_to_tar(tf, 'input.json', content)
+    elif archive_format == "tar-of-gzip":
+        with tarfile.open(archive_path, 'w') as tf:
+            add_to_tar(tf, 'input.json.gz', gzip.compress(content))
+    elif archive_format == "gzip-tar-of-zip":
+        with tarfile.open(archive_path, 'w:gz') as tf:
+            add_to_tar(tf, 'input.zip', zipped(content))
+
+    # Run test, output should match the uncompressed input
+    expected_output = "1,yes,date\n2,yes,date\n4,yes,date\n7,yes,date\n8,yes,date\n9,yes,date\n"
+    output_file = tmpdir.join('output.txt')
+    line_count, failure_count = process_files([archive_path], opts_default, output_file.strpath)
+    assert line_count == 6
+    assert failure_count == 12
+    assert output_file.read() == expected_output
+
+
+@pytest.mark.parametrize("json_backend", ["json", "orjson", "simdjson", "ujson"])
+@pytest.mark.parametrize("targeted_fields", [False, True])
+@pytest.mark.datafiles(
+    os.path.join(FIXTURE_DIR, 'importTools_input.json'),
+    )
+def test_input_output_match_json_backends(tmpdir, datafiles, json_backend, targeted_fields):
+    if json_backend != "json":
+        pytest.importorskip(json_backend)
+
+    # Run test for default options and custom field names, output should match the standard library parser
+    for opts_args, expected_output, expected_failures in [
+        (("en", False, 50000, None, None, None),
+         "1,yes,date\n2,yes,date\n4,yes,date\n7,yes,date\n8,yes,date\n9,yes,date\n", 12),
+        (("en", False, 50000, "fake_text", "fake_id", "fake_created_at"),
+         "15,fail,date\n17,fail,date\n20,fail,date\n21,yes,date\n23,fail,date\n", 13),
+    ]:
+        opts = TransformationOptions(*opts_args, json_backend=json_backend, targeted_fields=targeted_fields)
+        output_file = tmpdir.join('output_%s.txt' % opts_args[3])
+        line_count, failure_count = process_files([str(datafiles.join('importTools_input.json'))], opts,
+                                                  output_file.strpath)
+        assert line_count == expected_output.count("\n")
+        assert failure_count == expected_failures
+        assert output_file.read() == expected_output
+
+
+@pytest.mark.datafiles(
+    os.path.join(FIXTURE_DIR, 'importTools_input.json'),
+    )
+def test_input_output_match_prefilter(tmpdir, datafiles):
+    input_path = str(datafiles.join('importTools_input.json'))
+
+    # Run test for all option sets, output should match a run without the prefilter
+    for index, opts_args in enumerate([("en", False, 50000, None, None, None),
+                                       ("fr", False, 50000, None, None, None),
+                                       ("en", True, 50000, None, None, None),
+                                       ("en", False, 2, "fake_text", "fake_id", "fake_created_at"),
+                                       ("fr", True, 2, "fake_text", "fake_id", "fake_created_at")]):
+        output_file = tmpdir.join('output_%d.txt' % index)
+        expected_file = tmpdir.join('expected_%d.txt' % index)
+        expected_counts = process_files([input_path], TransformationOptions(*opts_args), expected_file.strpath)
+        counts = process_files([input_path], TransformationOptions(*opts_args, prefilter=True), output_file.strpath)
+        assert counts == expected_counts
+        assert output_file.read() == expected_file.read()
+
+
+def test_prefilter_line():
+    # Top-level fields failing the filters
+    assert not prefilter_line('{"id": 1, "text": "yes", "lang": "fr"}', "en", False)
+    assert not prefilter_line(b'{"id": 1, "text": "yes", "lang": "fr"}\n', "en", False)
+    assert not prefilter_line('{"id": 1, "text": "yes", "retweeted": true}', "en", False)
+    assert not prefilter_line('{"id": 1, "text": "RT @bob yes", "lang": "en"}', "en", False)
+    assert not prefilter_line('{"id": 1, "fake_text": "RT @bob yes"}', "en", False, "fake_text")
+    # Retweets are kept
+    assert prefilter_line('{"id": 1, "text": "RT @bob yes", "retweeted": true}', "en", True)
+    # Missing or null language
+    assert prefilter_line('{"id": 1, "text": "yes", "lang": null}', "en", False)
+    assert prefilter_line('{"id": 1, "text": "yes"}', "en", False)
+    # Same keys in nested objects or in strings
+    assert prefilter_line('{"id": 1, "quoted_status": {"text": "RT x", "lang": "fr", "retweeted": true}}', "en", False)
+    assert prefilter_line('{"id": 1, "text": "a \\"lang\\": \\"fr\\""}', "en", False)
+    assert prefilter_line('{"id": 1, "text": "R\\u0054 escaped"}', "en", False)
+    assert not prefilter_line('{"retweeted_status": {"lang": "en"}, "text": "yes", "lang": "fr"}', "en", False)
+
+
+@pytest.mark.datafiles(
+    os.path.join(FIXTURE_DIR, 'importTools_input.json'),
+    )
+def test_input_output_match_tar_index(tmpdir, datafiles):
+    opts_tar_index = TransformationOptions("en",
+                                 False,
+                                 2,
+                                 None,
+                                 None,
+                                 None,
+                                 tar_index=True)
+
+    # Build an uncompressed tar with plain and compressed members
+    with open(str(datafiles.join('importTools_input.json')), 'rb') as f:
+        content = f.read()
+    archive_path = tmpdir.join('archive.tar').strpath
+    with tarfile.open(archive_path, 'w') as tf:
+        for name, data in [('a.json', content), ('b.json.gz', gzip.compress(content)), ('c.json', content)]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    member_output = "1,yes,date\n2,yes,date\n4,yes,date\n7,yes,date\n8,yes,date\n9,yes,date\n"
+
+    # Indexed processing in parallel should match the sequential output
+    output_file = tmpdir.join('output.txt')
+    line_count, failure_count = process_files([archive_path], opts_tar_index, output_file.strpath, workers=2)
+    assert line_count == 18
+    assert failure_count == 36
+    assert output_file.read() == member_output * 3
+    index = TarIndex(archive_path, output_file.strpath)
+    assert [member['name'] for member in index.members] == ['a.json', 'b.json.gz', 'c.json']
+    assert index.get_progress(0) is None
+
+    # Resume a run where the first member was merged and the second one completed
+    resumed_file = tmpdir.join('resumed.txt')
+    resumed_file.write(member_output)
+    index = TarIndex(archive_path, resumed_file.strpath)
+    index.mark_merged(0, (6, 12))
+    tmpdir.join('resumed.txt.part0.part1').write(member_output)
+    index.mark_completed(1, (6, 12))
+    line_count, failure_count = process_files([archive_path], opts_tar_index, resumed_file.strpath)
+    assert line_count == 12
+    assert failure_count == 24
+    assert resumed_file.read() == member_output * 3
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.datafiles(
+    os.path.join(FIXTURE_DIR, 'importTools_input.json'),
+    )
+def test_input_output_match_dedup(tmpdir, datafiles, workers):
+    opts_dedup = TransformationOptions("en",
+                                 True,
+                                 2,
+                                 None,
+                                 None,
+                                 None,
+                                 dedup=True)
+
+    # Run test on two copies of the input, the second copy only holds duplicates
+    input_file = datafiles.join('importTools_input.json')
+    input_copy = tmpdir.join('importTools_input_copy.json')
+    input_file.copy(input_copy)
+    expected_output = "1,yes,date\n2,yes,date\n4,yes,date\n5,retweet only,date\n6,RT retweet only,date\n7,yes,date\n8,yes,date\n9,yes,date\n"
+    output_file = tmpdir.join('output.txt')
+    line_count, failure_count = process_files([str(input_file), input_copy.strpath], opts_dedup,
+                                              output_file.strpath, workers=workers)
+    assert line_count == 8
+    assert failure_count == 26
+    assert output_file.read() == expected_output
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_input_output_match_incremental(tmpdir, workers):
+    opts_incremental = TransformationOptions("en",
+                                 False,
+                                 2,
+                                 None,
+                                 None,
+                                 None,
+                                 incremental=True)
+
+    def write_input(name, ids):
+        input_file = tmpdir.join(name)
+        input_file.write("".join('{"id": %d, "text": "yes", "created_at":"date", "lang":"en"}\n' % i for i in ids))
+        return input_file.strpath
+
+    first = write_input('first.json', [1, 2])
+    second = write_input('second.json', [3])
+    output_file = tmpdir.join('output.txt')
+    line_count, failure_count = process_files([first, second], opts_incremental, output_file.strpath, workers)
+    assert line_count == 3
+    assert output_file.read() == "1,yes,date\n2,yes,date\n3,yes,date\n"
+
+    # Rows of an interrupted run are truncated, and only the new file is processed
+    with open(output_file.strpath, 'a') as f:
+        f.write("4,half written")
+    third = write_input('third.json', [4])
+    line_count, failure_count = process_files([first, second, third], opts_incremental, output_file.strpath, workers)
+    assert line_count == 1
+    assert output_file.read() == "1,yes,date\n2,yes,date\n3,yes,date\n4,yes,date\n"
+
+    # Rows of a changed file are replaced
+    write_input('first.json', [1, 2, 5])
+    os.utime(first, (0, 0))
+    line_count, failure_count = process_files([first, second, third], opts_incremental, output_file.strpath, workers)
+    assert line_count == 3
+    assert output_file.read() == "3,yes,date\n4,yes,date\n1,yes,date\n2,yes,date\n5,yes,date\n"
+
+    # An output without a manifest is only replaced when rebuilding
+    plain_output = tmpdir.join('plain_output.txt')
+    process_files([first], TransformationOptions("en", False, 2, None, None, None), plain_output.strpath)
+    with pytest.raises(ValueError):
+        process_files([second], opts_incremental, plain_output.strpath, workers)
+    assert plain_output.read() == "1,yes,date\n2,yes,date\n5,yes,date\n"
+    opts_incremental.rebuild = True
+    line_count, failure_count = process_files([second], opts_incremental, plain_output.strpath, workers)
+    assert line_count == 1
+    assert plain_output.read() == "3,yes,date\n"
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_input_output_match_incremental_failure(tmpdir, workers):
+    opts_incremental = TransformationOptions("en",
+                                 False,
+                                 2,
+                                 None,
+                                 None,
+                                 None,
+                                 incremental=True)
+
+    first = tmpdir.join('first.json')
+    first.write('{"id": 1, "text": "yes", "created_at":"date", "lang":"en"}\n')
+    # A truncated archive fails after some of its rows were written
+    content = "".join('{"id": %d, "text": "yes", "created_at":"date", "lang":"en"}\n' % i for i in range(2, 20000))
+    compressed = gzip.compress(content.encode('utf-8'))
+    truncated = tmpdir.join('truncated.json.gz')
+    truncated.write_binary(compressed[:len(compressed) // 2])
+    output_file = tmpdir.join('output.txt')
+    line_count, failure_count = process_files([first.strpath, truncated.strpath], opts_incremental,
+                                              output_file.strpath, workers)
+    assert line_count == 1
+    assert output_file.read() == "1,yes,date\n"
+
+    # The failed archive is processed again by the next run
+    truncated.write_binary(compressed)
+    line_count, failure_count = process_files([first.strpath, truncated.strpath], opts_incremental,
+                                              output_file.strpath, workers)
+    assert line_count == 19998
+    assert output_file.read() == "1,yes,date\n" + "".join("%d,yes,date\n" % i for i in range(2, 20000))
+
+    # Ids written by a failed archive are not duplicates of the tweets of later files
+    opts_incremental.dedup = True
+    truncated.write_binary(compressed[:len(compressed) // 2])
+    later = tmpdir.join('later.json')
+    later.write('{"id": 2, "text": "yes", "created_at":"date", "lang":"en"}\n')
+    output_file = tmpdir.join('output_dedup.txt')
+    line_count, failure_count = process_files([truncated.strpath, later.strpath], opts_incremental,
+                                              output_file.strpath, workers)
+    assert line_count == 1
+    assert output_file.read() == "2,yes,date\n"
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "arrow"])
+@pytest.mark.parametrize("workers", [1, 2])
+@pytest.mark.datafiles(
+    os.path.join(FIXTURE_DIR, 'importTools_input.json'),
+    )
+def test_input_output_match_columnar(tmpdir, datafiles, output_format, workers):
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.ipc
+    import pyarrow.parquet
+    opts_columnar = TransformationOptions("en",
+                                 False,
+                                 4,
+                                 None,
+                                 None,
+                                 None,
+                                 output_format=output_format)
+
+    input_file = datafiles.join('importTools_input.json')
+    dated_file = tmpdir.join('dated.json')
+    dated_file.write('{"id": "10", "text": "yes", "created_at": "Wed Oct 10 20:19:24 +0200 2018", "lang": "en"}\n')
+    output_file = tmpdir.join('output.' + output_format)
+    line_count, failure_count = process_files([str(input_file), dated_file.strpath], opts_columnar,
+                                              output_file.strpath, workers)
+    assert line_count == 7
+    assert failure_count == 12
+    if output_format == 'parquet':
+        parquet_file = pyarrow.parquet.ParquetFile(output_file.strpath)
+        assert parquet_file.metadata.num_row_groups == 2
+        table = parquet_file.read()
+    else:
+        table = pyarrow.ipc.open_file(output_file.strpath).read_all()
+    assert table.schema.field('id').type == pyarrow.int64()
+    assert str(table.schema.field('created_at').type) == 'timestamp[ms, tz=UTC]'
+    assert table.column('id').to_pylist() == [1, 2, 4, 7, 8, 9, 10]
+    assert table.column('text').to_pylist() == ["yes"] * 7
+    dates = table.column('created_at').to_pylist()
+    assert dates[:6] == [None] * 6
+    assert dates[6].isoformat() == "2018-10-10T18:19:24+00:00"
+
+
+@pytest.mark.parametrize("prefilter", [False, True])
+def test_input_output_match_date_window(tmpdir, prefilter):
+    opts_window = TransformationOptions("en",
+                                 False,
+                                 2,
+                                 None,
+                                 None,
+                                 None,
+                                 prefilter=prefilter,
+                                 since=datetime(2020, 3, 1),
+                                 until=datetime(2020, 4, 1))
+
+    def write_input(name, dates):
+        input_file = tmpdir.join(name)
+        input_file.write("".join('{"id": %d, "text": "yes", "created_at": "%s", "lang": "en"}\n' % (i, date)
+                                 for i, date in enumerate(dates, 1)))
+        return input_file.strpath
+
+    in_window = write_input('tweets_2020-03-15.json', ["Sun Mar 01 00:00:00 +0000 2020",
+                                                      "Sat Feb 29 23:59:59 +0000 2020",
+                                                      "Tue Mar 31 23:00:00 -0100 2020",
+                                                      "Tue Mar 31 23:59:59 +0000 2020",
+                                                      "2020-03-15T12:00:00",
+                                                      "date"])
+    before_window = write_input('tweets_2020-02-15.json', ["Sun Mar 01 00:00:00 +0000 2020"])
+    old_file = write_input('tweets.json', ["Sun Mar 01 00:00:00 +0000 2020"])
+    os.utime(old_file, (0, 0))
+    output_file = tmpdir.join('output.txt')
+    line_count, failure_count = process_files([in_window, before_window, old_file], opts_window, output_file.strpath)
+    assert line_count == 3
+    assert failure_count == 1
+    assert output_file.read() == "1,yes,Sun Mar 01 00:00:00 +0000 2020\n" \
+                                 "4,yes,Tue Mar 31 23:59:59 +0000 2020\n" \
+                                 "5,yes,2020-03-15T12:00:00\n"
+
+    # Without pruning, inputs are only filtered on the dates of their tweets
+    opts_window.date_pruning = False
+    output_file = tmpdir.join('output_no_pruning.txt')
+    line_count, failure_count = process_files([before_window, old_file], opts_window, output_file.strpath)
+    assert line_count == 2
+
+
+def test_date_window():
+    window = DateWindow(datetime(2020, 3, 1), datetime(2020, 4, 1))
+    assert window.contains_date("Sun Mar 01 00:00:00 +0000 2020")
+    assert not window.contains_date("Sat Feb 29 23:59:59 +0000 2020")
+    assert window.contains_date("Wed Apr 01 00:30:00 +0100 2020")
+    assert window.contains_date("date") is None
+    assert window.may_contain_input("2020/02/29/23.json.bz2")
+    assert not window.may_contain_input("2020/02/28/23.json.bz2")
+    assert not window.may_contain_input("archive-20200402.tar")
+    assert window.may_contain_input("tweets_2020-01-01_2020-06-30.jsonl")
+    assert window.may_contain_input("covid_20200101-20200630.json.gz")
+    assert window.may_contain_input("2020/04/01/tweets_2020-02-15.json")
+    assert not window.may_contain_input("tweets_2020-01-01_2020-02-27.jsonl")
+    assert not window.may_contain_input("crawl_started_2020-02-27.jsonl")
+    assert window.may_contain_input("archive.tar", datetime(2020, 2, 29).timestamp())
+    assert not window.may_contain_input("archive.tar", datetime(2020, 2, 27).timestamp())
+
+
+@pytest.mark.parametrize("archive_format", ["plain", "gzip"])
+@pytest.mark.datafiles(
+    os.path.join(FIXTURE_DIR, 'importTools_input.json'),
+    )
+def test_input_output_match_json_input(tmpdir, datafiles, archive_format):
+    opts_json = TransformationOptions("en",
+                                 False,
+                                 2,
+                                 None,
+                                 None,
+                                 None,
+                                 input_format='json')
+
+    # Rewrite the input as a pretty-printed JSON array, with a malformed tweet
+    with open(str(datafiles.join('importTools_input.json')), 'r') as f:
+        tweets = [json.loads(line) for line in f]
+    content = json.dumps(tweets, indent=2)
+    content = content[:-1] + ', {"id": 24, "text": "unterminated\n, "lang": "en"}, ' + json.dumps(tweets[0]) + ']'
+    input_file = tmpdir.join('input.json')
+    if archive_format == 'gzip':
+        input_file.write_binary(gzip.compress(content.encode('utf-8')))
+    else:
+        input_file.write(content)
+    expected_output = "1,yes,date\n2,yes,date\n4,yes,date\n7,yes,date\n8,yes,date\n9,yes,date\n1,yes,date\n"
+    output_file = tmpdir.join('output.txt')
+    line_count, failure_count = process_files([input_file.strpath], opts_json, output_file.strpath)
+    assert line_count == 7
+    assert failure_count == 13
+    assert output_file.read() == expected_output
+
+
+def test_iter_json_documents():
+    lines = ['[{"id": 1, "text": "} [ \\" {"},\n', '  {"id": 2,\n', '   "nested": {"a": [{}]}}, {"id": 3}]\n']
+    assert [json.loads(document) for document in iter_json_documents(iter(lines))] == \
+           [{"id": 1, "text": '} [ " {'}, {"id": 2, "nested": {"a": [{}]}}, {"id": 3}]
+    assert list(iter_json_documents([b'{"id": 1}{"id":\n', b'2}\n'])) == [b'{"id": 1}', b'{"id":\n2}']
+
+
+def test_iter_json_documents_chunks():
+    # A compact array on a single line, with escapes and brackets in strings falling on chunk boundaries
+    tweets = [{"id": i, "text": 'a \\"quoted\\" } [ text \\\\ ' * (i % 50), "nested": {"a": [i]}} for i in range(8000)]
+    content = json.dumps(tweets)
+    assert "\n" not in content and len(content) > 6 * JSON_CHUNK_SIZE
+    for chunk_size in (1, 7):
+        documents = iter_json_documents(iter_chunks(io.StringIO(json.dumps(tweets[:30])), chunk_size))
+        assert list(documents) == [json.dumps(tweet) for tweet in tweets[:30]]
+
+    # Memory use is bounded by the chunks and the largest tweet, not by the size of the line
+    stream = io.BytesIO(content.encode('utf-8'))
+    tracemalloc.start()
+    count = 0
+    for document in iter_json_documents(iter_chunks(stream)):
+        assert json.loads(document)["id"] == count
+        count += 1
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    assert count == len(tweets)
+    assert peak < 4 * JSON_CHUNK_SIZE
+
+    # A line break in a string ends a malformed object, even when the string started in a previous chunk
+    content = '[{"id": 1, "text": "abc\n, "lang": "en"}, {"id": 2}]'
+    assert list(iter_json_documents(iter_chunks(io.StringIO(content), 3))) == ['{"id": 1, "text": "abc', '{"id": 2}']
+
+
+def test_tweet_id_set():
+    seen_ids = TweetIdSet(buffer_size=4)
+    assert seen_ids.filter_new([1, 2, 3, 2, "3", "abc"]) == [True, True, True, False, False, True]
+    assert seen_ids.filter_new(range(4, 20)) == [True] * 16
+    assert seen_ids.filter_new([5, "19", 20, "abc", "007", 2 ** 70]) == [False, False, True, False, True, True]
+    assert seen_ids.duplicates == 5
+    assert len(seen_ids) == 23
+    assert 7 in seen_ids and "7" in seen_ids and 21 not in seen_ids
+    seen_ids.update([7, 21])
+    assert seen_ids.duplicates == 5
+    assert 21 in seen_ids
+    # Non-ASCII digits are not read as integers
+    assert seen_ids.filter_new(["\u0663", "\u0663", 3]) == [True, False, False]
+
+    # Ids of a child set count as seen in its parent once committed
+    file_ids = TweetIdSet(buffer_size=2, parent=seen_ids)
+    assert file_ids.filter_new([3, 100, 101, 102, "xyz", "xyz"]) == [False, True, True, True, True, False]
+    assert 100 in file_ids and 100 not in seen_ids and 3 in file_ids
+    file_ids.commit()
+    assert 100 in seen_ids and "102" in seen_ids and "xyz" in seen_ids
+    assert seen_ids.duplicates == 9
+
+
+def test_parse_tweet_date():
+    assert parse_tweet_date("Wed Oct 10 20:19:24 +0000 2018").isoformat() == "2018-10-10T20:19:24+00:00"
+    assert parse_tweet_date("Wed Oct 10 20:19:24 -0130 2018").isoformat() == "2018-10-10T21:49:24+00:00"
+    assert parse_tweet_date("2018-10-10 20:19:24").isoformat() == "2018-10-10T20:19:24+00:00"
+    assert parse_tweet_date("2018-10-10T20:19:24.5-01:30").isoformat() == "2018-10-10T21:49:24.500000+00:00"
+    assert parse_tweet_date("2018-10-10").isoformat() == "2018-10-10T00:00:00+00:00"
+    assert parse_tweet_date("2018-13-10") is None
+    assert parse_tweet_date("Wed Foo 10 20:19:24 +0000 2018") is None
+    assert parse_tweet_date("date") is None
@@ -3,6 +3,23 @@
 # Unit testing for functions in preprocessingTools.py
 # All testing is done on lower case strings
 
+import csv
+import os
+import random
+from datetime import date
+from itertools import product
+
+import pandas as pd
+import pytest
+
+from cranetoolbox import fileHandler
+from cranetoolbox.analysis.countOccurences import count_keywords
+from cranetoolbox.dateHandler import get_days
+from cranetoolbox.fileHandler import COMPRESSION_SUFFIXES, open_csv_file, read_csv_blocks, read_metadata, scan_folder_csv
+from cranetoolbox.preprocess import preprocess
+from cranetoolbox.preprocess.partition import PartitionedWriter
+from cranetoolbox.preprocess.persistentCache import PersistentCache
+from cranetoolbox.preprocess.preprocess import MultiPreprocessor, Preprocessor, preprocessing_text
 from cranetoolbox.preprocess.preprocessTools import *
 
 
@@ -92,3 +109,339 @@ def test_replace_numbers():
     assert replace_numbers("it is the 1st time i have been here.") == "it is the first time i have been here."
     assert replace_numbers("i am born on september 29th and i am 29 years old.") == "i am born on september twenty-ninth and i am twenty-nine years old."
     assert replace_numbers("bob finished 3rd in the 2010 edition of the new york marathon.") == "bob finished third in the two thousand and ten edition of the new york marathon."
+
+
+# Unit testing for the Preprocessor pipeline in preprocess.py
+
+PREPROCESSOR_TEXTS = [
+    "RT @Bob: I won't tell you that I can't... Check https://www.bob.fr/uncle?x=1 & www.bob.com!!!",
+    "Dammit, don't do that or I'll too?? It's 2nd time we've said we'd go, they're 27 #BobIsMyUncle",
+    "Caf\u00e9 \\u2020 \u4e5d \U0001F600 bob.\n\nis my uncle_ -- he's 31st... #bob ##is my#uncle @ @@bob",
+    "i'm here, ain't i? dont wont can't.. ok!?!? 1,000,000 people _ a.b.c @bob.fr \x1c\x00\t",
+    "a..b ...c.d www.x..y http://.com ftp://a.b:c.d e.f.g.h. :.:a it'll'll n'tn't x'sy's '''s",
+    "",
+]
+
+
+def test_preprocessor_matches_preprocessing_text():
+    for options in product([True, False], repeat=5):
+        preprocessor = Preprocessor(*options)
+        for text in PREPROCESSOR_TEXTS:
+            assert preprocessor.process(text) == preprocessing_text(text, *options)
+
+    # Random texts built from the characters the steps act on
+    generator = random.Random(0)
+    alphabet = ["a", "n", "t", "s", "w", "ll", "'", ".", "..", "!", "?", ":", "/", "@", "&", "_", "-", "1", "2nd",
+                " ", "\n", "http://", "www.", "\\u00e9", "\u00e9", "dont"]
+    texts = ["".join(generator.choice(alphabet) for _ in range(30)) for _ in range(200)]
+    for options in product([True, False], [True, False], [True], [True, False], [True, False]):
+        preprocessor = Preprocessor(*options)
+        for text in texts:
+            assert preprocessor.process(text) == preprocessing_text(text, *options)
+
+
+def test_preprocessor_persistent_cache(tmpdir):
+    text = "#bobismyuncle is 27, #bobismyuncle is my 2nd uncle"
+    expected = "bob is my uncle is twenty-seven, bob is my uncle is my second uncle"
+    cache_path = tmpdir.join('cache.sqlite').strpath
+    with PersistentCache(cache_path) as cache:
+        assert Preprocessor(True, True, False, True, True, cache).process(text) == expected
+        assert cache.misses == 3
+    # A new run reads the results from the file
+    with PersistentCache(cache_path) as cache:
+        assert Preprocessor(True, True, False, True, True, cache).process(text) == expected
+        assert cache.hits == 3
+        assert cache.misses == 0
+        assert cache.get('hashtag', '#bobismyuncle') == "bob is my uncle"
+
+
+def test_preprocess_csv_files_parallel(tmpdir, monkeypatch):
+    # Small batches, so that each file is spread across several batches and workers
+    monkeypatch.setattr(preprocess, 'MAX_BUFFER_SIZE', 7)
+    random.seed(0)
+    input_paths = []
+    for file_index in range(3):
+        input_path = tmpdir.join('tweets_%d.csv' % file_index).strpath
+        with open(input_path, 'w') as input_file:
+            writer = csv.writer(input_file)
+            for row_index in range(50 * file_index + 5):
+                text = random.choice(PREPROCESSOR_TEXTS)
+                writer.writerow([str(row_index + 1), text, '2020-03-%02d 10:00:00' % random.randint(1, 5)])
+        input_paths.append(input_path)
+    options = (True, False, True, False, True)
+
+    sequential_path = tmpdir.join('sequential').strpath
+    sequential_counts = []
+    for input_path in input_paths:
+        with open(input_path, 'r') as csv_input:
+            sequential_counts.append(preprocess.preprocess_csv_file(csv.reader(csv_input), input_path,
+                                                                    sequential_path, *options))
+    parallel_path = tmpdir.join('parallel').strpath
+    parallel_counts, failed = preprocess.preprocess_csv_files_parallel(input_paths, parallel_path, *options, 2)
+
+    assert failed == 0
+    for input_path in input_paths:
+        with open(preprocess.get_output_file_path(input_path, sequential_path)) as sequential_file, \
+                open(preprocess.get_output_file_path(input_path, parallel_path)) as parallel_file:
+            assert parallel_file.read() == sequential_file.read()
+    assert preprocess.merge_counts_dataframe(parallel_counts).equals(
+        preprocess.merge_counts_dataframe(sequential_counts))
+
+
+def test_preprocess_texts():
+    random.seed(0)
+    texts = [random.choice(PREPROCESSOR_TEXTS) for _ in range(100)]
+    for options in product([True, False], repeat=5):
+        if not options[2]:
+            # Hashtag segmentation is slow and covered above
+            continue
+        expected = [preprocessing_text(text, *options) for text in texts]
+        assert preprocess.preprocess_texts(texts, *options) == expected
+    # Texts holding the separator of batches
+    texts = ["a\x1eb's", "c'll 2"]
+    assert preprocess.preprocess_texts(texts) == [preprocessing_text(text, True, True, True, True, True)
+                                                  for text in texts]
+    series = pd.Series(PREPROCESSOR_TEXTS, index=range(10, 10 + len(PREPROCESSOR_TEXTS)), name='text')
+    result = preprocess.preprocess_texts(series)
+    assert result.index.equals(series.index)
+    assert result.tolist() == [preprocessing_text(text, True, True, True, True, True) for text in series]
+
+
+def test_get_days():
+    timestamps = ['Wed Oct 10 20:19:24 +0000 2018', 'Thu Oct 11 01:19:24 +0500 2018', '2018-10-12 23:59:59',
+                  '2018-10-13T00:00:00+02:00', 'Wed Oct 10 20:19:24 +0000 2018', '10/14/2018 10:00']
+    expected = [date(2018, 10, 10), date(2018, 10, 11), date(2018, 10, 12), date(2018, 10, 13), date(2018, 10, 10),
+                date(2018, 10, 14)]
+    assert get_days(timestamps) == expected
+    assert get_days(['14/10/2018'], '%d/%m/%Y') == [date(2018, 10, 14)]
+    data = [[str(index), '', '', timestamp] for index, timestamp in enumerate(timestamps)]
+    counts = preprocess.count_per_day(data)
+    assert counts.loc['2018-10-10', 'counts'] == 2
+    assert counts['counts'].sum() == len(timestamps)
+
+
+def test_preprocessor_text_cache():
+    texts = ["RT @bob: I won't go!!", "RT @bob: I won't go!!", "2nd try", "RT @bob: I won't go!!"]
+    expected = [preprocessing_text(text, True, True, True, True, True) for text in texts]
+    preprocessor = Preprocessor(True, True, True, True, True, text_cache_size=2)
+    assert [preprocessor.process(text) for text in texts] == expected
+    assert (preprocessor.text_cache_hits, preprocessor.text_cache_misses) == (2, 2)
+    assert preprocessor.process_batch(texts + ["3rd try"]) == expected + ["third try"]
+    assert (preprocessor.text_cache_hits, preprocessor.text_cache_misses) == (6, 3)
+    # The size is bounded, the least recently used texts are dropped
+    assert len(preprocessor._text_cache) == 2
+    assert "2nd try" not in preprocessor._text_cache
+
+
+def test_preprocess_csv_file_incremental(tmpdir, monkeypatch):
+    monkeypatch.setattr(preprocess, 'MAX_BUFFER_SIZE', 7)
+    input_path = tmpdir.join('tweets.csv').strpath
+    with open(input_path, 'w') as input_file:
+        writer = csv.writer(input_file)
+        for row_index in range(25):
+            writer.writerow([str(row_index + 1), PREPROCESSOR_TEXTS[row_index % len(PREPROCESSOR_TEXTS)],
+                             '2020-03-%02d 10:00:00' % (row_index % 3 + 1)])
+    options = (True, False, True, False, True)
+
+    def run(output_path, incremental):
+        with open(input_path, 'r') as csv_input:
+            return preprocess.preprocess_csv_file(csv.reader(csv_input), input_path, output_path, *options,
+                                                  incremental=incremental)
+
+    expected_counts = run(tmpdir.join('expected').strpath, False)
+    with open(preprocess.get_output_file_path(input_path, tmpdir.join('expected').strpath)) as expected_file:
+        expected = expected_file.read()
+
+    # Interrupted run, after two chunks of rows
+    output_path = tmpdir.join('output').strpath
+    output_file_path = preprocess.get_output_file_path(input_path, output_path)
+    preprocess_rows = preprocess.preprocess_rows
+    processed_rows = []
+    interrupted = [True]
+
+    def counting_preprocess_rows(rows, preprocessor, keep_original_text=True):
+        if interrupted[0] and len(processed_rows) == 14:
+            raise RuntimeError("interrupted")
+        processed_rows.extend(rows)
+        return preprocess_rows(rows, preprocessor, keep_original_text)
+
+    monkeypatch.setattr(preprocess, 'preprocess_rows', counting_preprocess_rows)
+    assert run(output_path, True) is None
+    assert not os.path.exists(output_file_path)
+
+    # Resumed after the committed rows
+    interrupted[0] = False
+    assert run(output_path, True).equals(expected_counts)
+    assert len(processed_rows) == 25
+    with open(output_file_path) as output_file:
+        assert output_file.read() == expected
+
+    # Up to date, the counts are read from the state
+    assert run(output_path, True).equals(expected_counts)
+    assert len(processed_rows) == 25
+    # Not incremental, preprocessed again
+    assert run(output_path, False).equals(expected_counts)
+    assert len(processed_rows) == 50
+
+
+def test_multi_preprocessor(tmpdir):
+    option_sets = [(True, True, True, True, True), (False, True, False, True, True), (False, True, False, False, True),
+                   (True, False, True, True, False), (True, True, True, True, True)]
+    multi_preprocessor = MultiPreprocessor(option_sets)
+    for text in PREPROCESSOR_TEXTS:
+        assert multi_preprocessor.process(text) == [preprocessing_text(text, *options) for options in option_sets]
+    assert multi_preprocessor.process_batch(PREPROCESSOR_TEXTS) == [
+        [preprocessing_text(text, *options) for text in PREPROCESSOR_TEXTS] for options in option_sets]
+
+    input_path = tmpdir.join('tweets.csv').strpath
+    with open(input_path, 'w') as input_file:
+        writer = csv.writer(input_file)
+        for row_index, text in enumerate(PREPROCESSOR_TEXTS):
+            writer.writerow([str(row_index + 1), text, '2020-03-01 10:00:00'])
+    output_paths = [tmpdir.join('variant_%d' % index).strpath for index in range(2)]
+    with open(input_path, 'r') as csv_input:
+        counts = preprocess.preprocess_csv_file_variants(csv.reader(csv_input), input_path, output_paths,
+                                                         option_sets[1:3])
+    assert counts.loc['2020-03-01', 'counts'] == len(PREPROCESSOR_TEXTS)
+    for output_path, options in zip(output_paths, option_sets[1:3]):
+        with open(preprocess.get_output_file_path(input_path, output_path)) as output_file:
+            assert [row[2] for row in csv.reader(output_file)] == [preprocessing_text(text, *options)
+                                                                   for text in PREPROCESSOR_TEXTS]
+
+
+def test_preprocess_csv_file_partitioned(tmpdir):
+    input_path = tmpdir.join('tweets.csv').strpath
+    with open(input_path, 'w') as input_file:
+        writer = csv.writer(input_file)
+        for row_index in range(30):
+            text = "bob is my uncle" if row_index % 2 else "hello"
+            writer.writerow([str(row_index + 1), text, 'Wed Oct %02d 20:%02d:00 +0000 2018' % (10 + row_index % 3,
+                                                                                          row_index)])
+    output_path = tmpdir.join('output').strpath
+    with open(input_path, 'r') as csv_input:
+        counts = preprocess.preprocess_csv_file(csv.reader(csv_input), input_path, output_path,
+                                                True, True, True, True, True, partition_by='day')
+    assert counts['counts'].tolist() == [10, 10, 10]
+
+    partition_paths = sorted(str(path) for path in scan_folder_csv(output_path))
+    assert [os.path.basename(os.path.dirname(path)) for path in partition_paths] == [
+        '2018-10-10', '2018-10-11', '2018-10-12']
+    metadata = read_metadata(partition_paths[1])
+    assert metadata['rows'] == 10
+    assert metadata['counts'] == {'2018-10-11': 10}
+    assert metadata['min_timestamp'] == '2018-10-11T20:01:00+00:00'
+    assert metadata['max_timestamp'] == '2018-10-11T20:28:00+00:00'
+    assert metadata['options']['replace_or_remove_url'] is True
+
+    keyword_counts = count_keywords(partition_paths, {'uncle': ['uncle']}, '%a %b %d %H:%M:%S %z %Y',
+                                    since=date(2018, 10, 11))
+    assert keyword_counts.index.tolist() == [date(2018, 10, 11), date(2018, 10, 12)]
+    assert keyword_counts['total_count'].tolist() == [10, 10]
+    assert keyword_counts['uncle_count'].tolist() == [5, 5]
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip', 'zstd'])
+def test_partitioned_writer_max_open(tmpdir, compression):
+    if compression == 'zstd':
+        pytest.importorskip("zstandard")
+    output_path = tmpdir.strpath
+    writer = PartitionedWriter(output_path, 'tweets.csv', 'day', compression=compression, max_open=2)
+    # Blocks of rows spread over more days than open files, so that partitions are closed and reopened
+    days = [date(2018, 10, 10 + day_index) for day_index in range(5)]
+    for block_index in range(4):
+        rows = [[str(block_index * 10 + day_index), "", "text", day.isoformat() + ' 10:00:00']
+                for day_index, day in enumerate(days)]
+        writer.writerows(rows, days)
+    writer.close()
+
+    for day_index, day in enumerate(days):
+        partition_path = writer.get_partition_path(day.isoformat())
+        with open_csv_file(partition_path) as partition_file:
+            assert [row[0] for row in csv.reader(partition_file)] == [str(block_index * 10 + day_index)
+                                                                      for block_index in range(4)]
+        assert read_metadata(partition_path)['rows'] == 4
+
+
+@pytest.mark.parametrize('compression', ['gzip', 'zstd'])
+def test_preprocess_csv_file_compressed(tmpdir, compression):
+    if compression == 'zstd':
+        pytest.importorskip("zstandard")
+    input_path = tmpdir.join('tweets.csv').strpath
+    with open(input_path, 'w') as input_file:
+        writer = csv.writer(input_file)
+        for row_index in range(20):
+            text = "bob is my uncle" if row_index % 2 else "hello"
+            writer.writerow([str(row_index + 1), text, 'Wed Oct %02d 20:%02d:00 +0000 2018' % (10 + row_index % 2,
+                                                                                          row_index)])
+    output_path = tmpdir.mkdir('output').strpath
+    with open(input_path, 'r') as csv_input:
+        counts = preprocess.preprocess_csv_file(csv.reader(csv_input), input_path, output_path,
+                                                True, True, True, True, True, keep_original_text=False,
+                                                compression=compression)
+    assert counts['counts'].tolist() == [10, 10]
+
+    output_paths = scan_folder_csv(output_path)
+    assert [os.path.basename(str(path)) for path in output_paths] == [
+        'tweets_preprocessed.csv' + COMPRESSION_SUFFIXES[compression]]
+    with open_csv_file(str(output_paths[0])) as output_file:
+        rows = list(csv.reader(output_file))
+    assert rows[1] == ['2', '', 'bob is my uncle', 'Wed Oct 11 20:01:00 +0000 2018']
+
+    keyword_counts = count_keywords([str(path) for path in output_paths], {'uncle': ['uncle']},
+                                    '%a %b %d %H:%M:%S %z %Y')
+    assert keyword_counts['total_count'].tolist() == [10, 10]
+    assert keyword_counts['uncle_count'].tolist() == [0, 10]
+
+
+@pytest.mark.parametrize('engine', ['pandas', 'arrow'])
+def test_read_csv_blocks(tmpdir, engine):
+    if engine == 'arrow':
+        pytest.importorskip("pyarrow")
+    input_path = tmpdir.join('tweets.csv').strpath
+    texts = {1: 'a "quoted",\nmultiline text', 2: 'NA', 3: ''}
+    rows = [['%03d' % row_index, texts.get(row_index % 4, 'hello'), 'Wed Oct 10 20:%02d:00 +0000 2018' % row_index]
+            for row_index in range(25)]
+    with open(input_path, 'w') as input_file:
+        csv.writer(input_file).writerows(rows)
+
+    blocks = list(read_csv_blocks(input_path, [0, 1], 10, skip_rows=3, engine=engine))
+    assert [len(ids) for ids, _ in blocks] == [10, 10, 2]
+    assert [value for ids, _ in blocks for value in ids] == [row[0] for row in rows[3:]]
+    assert [value for _, texts in blocks for value in texts] == [row[1] for row in rows[3:]]
+
+    # Same output as when read row by row
+    output_paths = [tmpdir.join(name).strpath for name in ('rows', 'blocks')]
+    with open(input_path, 'r') as csv_input:
+        preprocess.preprocess_csv_file(csv.reader(csv_input), input_path, output_paths[0], True, True, True, True, True)
+    preprocess.preprocess_csv_file(None, input_path, output_paths[1], True, True, True, True, True)
+    outputs = []
+    for output_path in output_paths:
+        with open(preprocess.get_output_file_path(input_path, output_path), 'r') as output_file:
+            outputs.append(output_file.read())
+    assert outputs[0] == outputs[1]
+
+
+@pytest.mark.parametrize('engine', ['pandas', 'arrow'])
+def test_read_csv_blocks_ragged_rows(tmpdir, monkeypatch, engine):
+    if engine == 'arrow':
+        pytest.importorskip("pyarrow")
+        # Small blocks of bytes, so that rows with extra or missing fields fall on the boundaries of Arrow batches
+        monkeypatch.setattr(fileHandler, 'CSV_READ_SIZE', 256)
+    input_path = tmpdir.join('tweets.csv').strpath
+    rows = []
+    for row_index in range(200):
+        row = ['%03d' % row_index, 'a "windows"\r\nline break' if row_index % 5 == 1 else 'hello', 'date']
+        if row_index % 7 == 3:
+            row.append('extra field')
+        elif row_index % 11 == 4:
+            row = row[:2]
+        rows.append(row)
+    with open(input_path, 'w', newline='') as input_file:
+        csv.writer(input_file, lineterminator='\r\n').writerows(rows)
+
+    with open(input_path, 'r') as input_file:
+        expected = [[row[column] if column < len(row) else '' for column in (0, 1, 2)]
+                    for row in csv.reader(input_file)]
+    blocks = list(read_csv_blocks(input_path, [0, 1, 2], 30, engine=engine))
+    assert [len(ids) for ids, _, _ in blocks] == [30] * 6 + [20]
+    assert [list(row) for block in blocks for row in zip(*block)] == expected